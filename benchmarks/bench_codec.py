@@ -0,0 +1,139 @@
+# Per-message decode cost of the JSON codecs on replayed DAP traffic.
+#
+# Takes sessions saved with `cmakedbg --record`. Every message cmake sent is
+# decoded from a memoryview by each installed codec, and the cost is reported
+# per message kind (the response command or event name). "json+str" is the
+# old path of decoding the body to a str first. Without a recording, the
+# traffic of a few stops on a project with --entries cache variables is made
+# up.
+#
+#   python benchmarks/bench_codec.py [RECORDING ...] [--entries 20000] [--repeat 5]
+import argparse
+import json
+import time
+
+from cmakedbg.codec import CODECS, Codec, get_codec
+from cmakedbg.recording import RECEIVED, read_recording
+from cmakedbg.transport import FrameDecoder
+
+
+def frame(message: dict) -> bytes:
+    body = json.dumps(message).encode()
+    return f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+def synthetic_traffic(entries: int, stops: int = 5) -> bytes:
+    traffic = []
+    seq = 0
+    for stop in range(stops):
+        frames = [
+            {
+                "name": "add_library",
+                "line": 10 + i,
+                "source": {"path": f"/src/project/sub{i}/CMakeLists.txt"},
+                "id": i,
+            }
+            for i in range(8)
+        ]
+        variables = [
+            {
+                "name": f"PROJECT_CACHE_VARIABLE_{i}",
+                "value": f"/opt/toolchains/lib/cmake/pkg_{i};stop{stop}",
+                "type": "STRING",
+                "variablesReference": 0,
+            }
+            for i in range(entries)
+        ]
+        replies = [
+            ("stackTrace", {"stackFrames": frames}),
+            ("scopes", {"scopes": [{"name": "Locals", "variablesReference": 1}]}),
+            ("variables", {"variables": variables}),
+        ]
+        seq = seq + 1
+        stopped = {"reason": "step", "threadId": 1}
+        traffic.append(
+            frame({"seq": seq, "type": "event", "event": "stopped", "body": stopped})
+        )
+        for command, body in replies:
+            seq = seq + 1
+            response = {
+                "seq": seq,
+                "type": "response",
+                "request_seq": seq,
+                "command": command,
+                "success": True,
+                "body": body,
+            }
+            traffic.append(frame(response))
+    return b"".join(traffic)
+
+
+def split_frames(traffic: bytes) -> list[bytes]:
+    decoder = FrameDecoder()
+    decoder.feed(traffic)
+    frames = []
+    while (body := decoder.next_frame()) is not None:
+        frames.append(body.tobytes())
+    return frames
+
+
+def message_kind(body: bytes) -> str:
+    message = json.loads(body)
+    return message.get("command") or message.get("event") or message.get("type", "?")
+
+
+def time_decode(codec: Codec, body: bytes, repeat: int) -> float:
+    # best of repeat, decoding from a memoryview like the session does
+    view = memoryview(body)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        codec.decode(view)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recordings", nargs="*")
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.recordings:
+        frames = [
+            body
+            for path in args.recordings
+            for direction, _, body in read_recording(path)
+            if direction == RECEIVED
+        ]
+    else:
+        frames = split_frames(synthetic_traffic(args.entries))
+
+    codecs = [Codec("json+str", None, lambda view: json.loads(view.tobytes().decode()))]
+    for name in CODECS:
+        try:
+            codecs.append(get_codec(name))
+        except ImportError:
+            print(f"{name} is not installed, skipped")
+
+    # kind -> [messages, bytes, seconds per codec]
+    kinds: dict[str, list] = {}
+    for body in frames:
+        entry = kinds.setdefault(message_kind(body), [0, 0, [0.0] * len(codecs)])
+        entry[0] = entry[0] + 1
+        entry[1] = entry[1] + len(body)
+        for i, codec in enumerate(codecs):
+            entry[2][i] = entry[2][i] + time_decode(codec, body, args.repeat)
+
+    total = sum(len(body) for body in frames)
+    print(f"{len(frames)} messages, {total / 1024 / 1024:.1f} MB")
+    columns = "".join(f" {codec.name + ' us':>14}" for codec in codecs)
+    print(f"{'message':<18} {'count':>6} {'avg KB':>9}{columns}")
+    for kind, (count, nbytes, seconds) in sorted(kinds.items()):
+        columns = "".join(f" {total / count * 1e6:14.1f}" for total in seconds)
+        print(f"{kind:<18} {count:6} {nbytes / count / 1024:9.1f}{columns}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# End-to-end overhead of cmakedbg on the cmake-examples corpus in tests/.
+#
+# Every example is configured natively and under the debugger in three modes:
+#   run         run to completion with no breakpoints
+#   step        step through every command of the configure
+#   breakpoints a breakpoint on every command line of every listfile, and
+#               continue through all of them
+# Each configure runs in a fresh worker process with a fresh build directory,
+# which reports the wall time, the latency from every stopped event to the
+# next prompt (the stacktrace, listing and whatever the stop fetches), the
+# bytes over the debugger socket, and the peak RSS of cmakedbg and of cmake.
+# cmake's is sampled from /proc every few milliseconds, since a child's
+# ru_maxrss on Linux also counts the memory of the process that spawned it.
+# The results are printed and, with --output, written to a JSON file to
+# compare between runs. The debugger modes need cmake 3.27 or newer.
+#
+#   python benchmarks/bench_examples.py [--examples 01-basic/A-hello-cmake ...]
+#       [--modes native run step breakpoints] [--output results.json]
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from cmakedbg import debugger
+from cmakedbg.indexer import COMMAND_RE
+
+CORPUS = Path(__file__).resolve().parent.parent / "tests" / "cmake-examples-master"
+MODES = ["native", "run", "step", "breakpoints"]
+
+
+def find_examples(corpus: Path) -> list[str]:
+    # the top level projects: directories with a CMakeLists.txt whose parent
+    # directory has none
+    examples = []
+    for listfile in sorted(corpus.rglob("CMakeLists.txt")):
+        example = listfile.parent
+        if (
+            "dockerfiles" in example.parts
+            or (example.parent / "CMakeLists.txt").exists()
+        ):
+            continue
+        examples.append(str(example.relative_to(corpus)))
+    return examples
+
+
+def command_lines(source_dir: Path) -> list[str]:
+    # FILE:LINE of every command in the example's listfiles
+    locations = []
+    for listfile in sorted(
+        [*source_dir.rglob("CMakeLists.txt"), *source_dir.rglob("*.cmake")]
+    ):
+        with open(listfile, errors="replace") as f:
+            for linenum, line in enumerate(f, 1):
+                if COMMAND_RE.match(line):
+                    locations.append(f"{listfile}:{linenum}")
+    return locations
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def at(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000
+
+    return {"p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": samples[-1] * 1000}
+
+
+class PeakRSS(threading.Thread):
+    # polls the high water mark of the resident set of the process pid()
+    # returns, until stop() is called
+    def __init__(self, pid: Callable[[], int | None], interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            pid = self.pid()
+            if pid is None:
+                continue
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmHWM:"):
+                            self.peak_kb = max(self.peak_kb, int(line.split()[1]))
+            except (OSError, ValueError):
+                pass
+
+    def stop(self) -> int:
+        self._done.set()
+        self.join()
+        return self.peak_kb
+
+
+def run_native(source_dir: Path, build_dir: str) -> dict:
+    cmake = subprocess.Popen(
+        ["cmake", "-S", str(source_dir), "-B", build_dir],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    peak_rss = PeakRSS(lambda: cmake.pid)
+    peak_rss.start()
+    returncode = cmake.wait()
+    return {"returncode": returncode, "cmake_max_rss_kb": peak_rss.stop()}
+
+
+def run_debugged(mode: str, source_dir: Path, build_dir: str) -> dict:
+    state = debugger.DebuggerState()
+    state.batch = True
+    # the JSON lines are not looked at, but still formatted
+    state.json_output = open(os.devnull, "w")
+    # the command given at every stop, until cmake ends
+    repeat = None
+    match mode:
+        case "step":
+            first = command_lines(source_dir)[:1]
+            state.command_queue.extend([["br", location] for location in first])
+            repeat = ["step"]
+        case "breakpoints":
+            state.command_queue.extend(
+                ["br", location] for location in command_lines(source_dir)
+            )
+            repeat = ["c"]
+    state.command_queue.append(["run"])
+
+    # timed from the stopped event to the first prompt after it
+    latencies = []
+    stopped_at = None
+    handle_stopped = debugger.handle_stopped
+    next_user_input = debugger.next_user_input
+
+    def timed_handle_stopped(*args, **kwargs):
+        nonlocal stopped_at
+        stopped_at = time.perf_counter()
+        return handle_stopped(*args, **kwargs)
+
+    def timed_next_user_input(*args, **kwargs):
+        nonlocal stopped_at
+        if stopped_at is not None:
+            latencies.append(time.perf_counter() - stopped_at)
+            stopped_at = None
+        if repeat is not None and not state.command_queue:
+            state.command_queue.append(repeat)
+        return next_user_input(*args, **kwargs)
+
+    debugger.handle_stopped = timed_handle_stopped
+    debugger.next_user_input = timed_next_user_input
+    peak_rss = PeakRSS(
+        lambda: state.cmake_process_handle.pid if state.cmake_process_handle else None
+    )
+    peak_rss.start()
+    status = None
+    try:
+        debugger.run_debugger(
+            state, ["cmake", "-S", str(source_dir), "-B", build_dir], lambda: None, 30.0
+        )
+    except SystemExit as e:
+        status = e.code
+    cmake_max_rss_kb = peak_rss.stop()
+    session = state.session.session if state.session is not None else None
+    return {
+        "returncode": status,
+        "stops": len(latencies),
+        "stop_to_prompt_ms": percentiles(latencies),
+        "bytes_sent": session.bytes_sent if session is not None else 0,
+        "bytes_received": session.bytes_received if session is not None else 0,
+        "cmake_max_rss_kb": cmake_max_rss_kb,
+    }
+
+
+def worker(mode: str, example: str) -> None:
+    source_dir = CORPUS / example
+    # cmake's and the listings' output is produced but not shown
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    with tempfile.TemporaryDirectory() as build_dir:
+        start = time.perf_counter()
+        if mode == "native":
+            result = run_native(source_dir, build_dir)
+        else:
+            result = run_debugged(mode, source_dir, build_dir)
+        result["wall_s"] = time.perf_counter() - start
+    result.update(
+        example=example,
+        mode=mode,
+        cmakedbg_max_rss_kb=(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if mode != "native"
+            else None
+        ),
+    )
+    print(json.dumps(result), file=stdout)
+
+
+def cmake_version() -> str | None:
+    try:
+        output = subprocess.run(
+            ["cmake", "--version"], capture_output=True, text=True
+        ).stdout
+    except FileNotFoundError:
+        return None
+    match = re.search(r"\d+\.\d+(\.\d+)?", output)
+    return match.group() if match else None
+
+
+def print_results(results: list[dict], output: io.TextIOBase) -> None:
+    print(
+        f"{'example':<44} {'mode':<12} {'wall s':>8} {'stops':>6} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'KB recv':>9} {'RSS MB':>7} {'cmake MB':>9}",
+        file=output,
+    )
+    for result in results:
+        if "error" in result:
+            print(
+                f"{result['example']:<44} {result['mode']:<12} {result['error']}",
+                file=output,
+            )
+            continue
+        latency = result.get("stop_to_prompt_ms", {})
+        rss = result["cmakedbg_max_rss_kb"] or 0
+        print(
+            f"{result['example']:<44} {result['mode']:<12} {result['wall_s']:8.2f} "
+            f"{result.get('stops', 0):6} {latency.get('p50', 0):8.2f} "
+            f"{latency.get('p99', 0):8.2f} {result.get('bytes_received', 0) / 1024:9.1f} "
+            f"{rss / 1024:7.1f} {result['cmake_max_rss_kb'] / 1024:9.1f}",
+            file=output,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--examples", nargs="+", help="paths relative to the corpus (default: all)"
+    )
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument(
+        "--output", metavar="FILE", help="write the results as JSON to FILE"
+    )
+    parser.add_argument(
+        "--worker", nargs=2, metavar=("MODE", "EXAMPLE"), help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+    if args.worker is not None:
+        worker(*args.worker)
+        return
+
+    version = cmake_version()
+    if version is None:
+        parser.error("cmake is not in your PATH")
+    debuggable = tuple(map(int, version.split(".")[:2])) >= (3, 27)
+    results = []
+    for example in args.examples or find_examples(CORPUS):
+        for mode in args.modes:
+            if mode != "native" and not debuggable:
+                results.append(
+                    {
+                        "example": example,
+                        "mode": mode,
+                        "error": f"cmake {version} has no --debugger",
+                    }
+                )
+                continue
+            completed = subprocess.run(
+                [sys.executable, __file__, "--worker", mode, example],
+                capture_output=True,
+                text=True,
+            )
+            try:
+                results.append(json.loads(completed.stdout.splitlines()[-1]))
+            except (IndexError, json.JSONDecodeError):
+                error = (completed.stderr.strip().splitlines() or ["no output"])[-1]
+                results.append({"example": example, "mode": mode, "error": error})
+    print_results(results, sys.stdout)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "cmake_version": version,
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
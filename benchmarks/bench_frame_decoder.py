@@ -0,0 +1,100 @@
+# Micro-benchmark for reading DAP frames off a socket.
+#
+# Feeds synthetic `variables` replies of a few MB through a socketpair and
+# compares the FrameDecoder against the old approach of growing a bytes object
+# with `response = response + s.recv(4096)`.
+#
+#   python benchmarks/bench_frame_decoder.py [--sizes 1 4 16] [--repeat 3]
+import argparse
+import json
+import socket
+import threading
+import time
+
+from cmakedbg.transport import FrameDecoder, read_frame
+
+
+def synthetic_frame(size_mb: float) -> bytes:
+    variables = []
+    total = 0
+    i = 0
+    while total < size_mb * 1024 * 1024:
+        variable = {
+            "name": f"SOME_PROJECT_CACHE_VARIABLE_{i}",
+            "value": f"/opt/toolchains/gcc-13/lib/cmake/pkg_{i};" * 2,
+            "type": "STRING",
+            "variablesReference": 0,
+        }
+        variables.append(variable)
+        total = total + len(json.dumps(variable))
+        i = i + 1
+    body = json.dumps(
+        {
+            "seq": 1,
+            "type": "response",
+            "command": "variables",
+            "success": True,
+            "body": {"variables": variables},
+        }
+    ).encode()
+    return f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+def concat_recv(s, response):
+    # recv_response as it was before the FrameDecoder, minus the json decode
+    while b"\r\n\r\n" not in response:
+        response = response + s.recv(4096)
+    header, response = response.split(b"\r\n\r\n", maxsplit=1)
+    size = int(header.decode().split()[1])
+    while len(response) < size:
+        response = response + s.recv(4096)
+    return response[:size], response[size:]
+
+
+def decoder_recv(s, decoder):
+    return read_frame(s, decoder)
+
+
+def time_reader(reader, state, data: bytes, frames: int) -> float:
+    a, b = socket.socketpair()
+    sender = threading.Thread(target=a.sendall, args=(data * frames,))
+    start = time.perf_counter()
+    sender.start()
+    for _ in range(frames):
+        result = reader(b, state)
+        if type(result) is tuple:
+            body, state = result
+        else:
+            body = result
+        assert len(body) > 0
+    elapsed = time.perf_counter() - start
+    sender.join()
+    a.close()
+    b.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1, 4, 16])
+    parser.add_argument("--frames", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'concat (s)':>12} {'decoder (s)':>12} {'speedup':>8}")
+    for size_mb in args.sizes:
+        data = synthetic_frame(size_mb)
+        concat = min(
+            time_reader(concat_recv, b"", data, args.frames) for _ in range(args.repeat)
+        )
+        decoder = min(
+            time_reader(decoder_recv, FrameDecoder(), data, args.frames)
+            for _ in range(args.repeat)
+        )
+        print(
+            f"{len(data) / 2**20:>6.1f}MB {concat:>12.4f} {decoder:>12.4f} {concat / decoder:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Memory and time of the stop history over a long stepping session.
+#
+# Records --stops stops spread over --files listfiles, with every
+# --changes-every-th stop seeing a few variables change, the way
+# handle_stopped and the variable lookups do, then runs the history queries.
+# Reports the memory allocated (tracemalloc) and the time per stop.
+#
+#   python benchmarks/bench_history.py [--stops 1000000] [--files 4000]
+import argparse
+import time
+import tracemalloc
+
+from cmakedbg.history import StopHistory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=1_000_000)
+    parser.add_argument("--files", type=int, default=4000)
+    parser.add_argument("--changes-every", type=int, default=100)
+    parser.add_argument("--capacity", type=int, default=None)
+    args = parser.parse_args()
+
+    paths = [f"/project/src/module{i}/CMakeLists.txt" for i in range(args.files)]
+    tracemalloc.start()
+    history = StopHistory(args.capacity or args.stops)
+    start = time.perf_counter()
+    for stop_id in range(1, args.stops + 1):
+        history.record(
+            stop_id, paths[stop_id % args.files], stop_id % 500 + 1, stop_id % 40
+        )
+        if stop_id % args.changes_every == 0:
+            history.record_changes(
+                stop_id,
+                {
+                    f"VAR_{stop_id % 1000}": ("old", "new"),
+                    "CMAKE_CXX_FLAGS": ("-O0", "-O2"),
+                },
+            )
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    history.last(10)
+    history.find(args.stops // 2)
+    history.last_visit(paths[0], 1)
+    history.changed_at("CMAKE_CXX_FLAGS")
+    queries = time.perf_counter() - start
+    print(f"{args.stops} stops: {elapsed / args.stops * 1e6:.2f} us per stop")
+    print(
+        f"ring arrays {history.nbytes() / 2**20:.1f} MiB, all allocated {current / 2**20:.1f} MiB "
+        f"(peak {peak / 2**20:.1f} MiB)"
+    )
+    print(f"queries {queries * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Time to index a large source tree with the listfile indexer.
+#
+# Writes --files listfiles of --lines lines each (a few function definitions,
+# the rest ordinary commands, some of them spread over several lines) to a
+# temporary directory, then times a cold index build, a warm one from the
+# saved index with nothing changed, and one after touching 1% of the files.
+#
+#   python benchmarks/bench_indexer.py [--files 4000] [--lines 200] [--jobs N]
+import argparse
+import os
+import tempfile
+import time
+
+from cmakedbg.indexer import ListfileIndex
+
+BLOCK = """function(helper_{n} NAME)
+  # configure one component
+  set(SOURCES ${{NAME}}.c ${{NAME}}_impl.c)
+  add_library(${{NAME}}_{n} STATIC
+    ${{SOURCES}}
+    "${{CMAKE_CURRENT_SOURCE_DIR}}/extra.c")
+  target_compile_options(${{NAME}}_{n} PRIVATE -Wall)
+endfunction()
+if(ENABLE_{n})
+  helper_{n}(component_{n})
+endif()
+"""
+
+
+def write_tree(root: str, files: int, lines: int) -> None:
+    block_lines = BLOCK.count("\n")
+    for i in range(files):
+        directory = os.path.join(root, f"module{i // 100}", f"sub{i % 100}")
+        os.makedirs(directory, exist_ok=True)
+        name = "CMakeLists.txt" if i % 2 else f"helpers{i}.cmake"
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(
+                "".join(BLOCK.format(n=f"{i}_{j}") for j in range(lines // block_lines))
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=4000)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, "src")
+        write_tree(source, args.files, args.lines)
+        index_path = os.path.join(root, "index.json")
+
+        start = time.perf_counter()
+        index = ListfileIndex(index_path)
+        scanned = index.update([source], args.jobs)
+        cold = time.perf_counter() - start
+        print(
+            f"cold: {scanned} files in {cold:.2f} s, {len(index.functions())} functions, "
+            f"index {os.path.getsize(index_path) / 2**20:.1f} MiB"
+        )
+
+        start = time.perf_counter()
+        index = ListfileIndex(index_path)
+        scanned = index.update([source], args.jobs)
+        print(f"warm: {scanned} files scanned in {time.perf_counter() - start:.2f} s")
+
+        for path in index.paths[::100]:
+            with open(path, "a") as f:
+                f.write("message(touched)\n")
+        start = time.perf_counter()
+        scanned = index.update([source], args.jobs)
+        print(
+            f"1% touched: {scanned} files scanned in {time.perf_counter() - start:.2f} s"
+        )
+
+        start = time.perf_counter()
+        calls = index.calls("add_library")
+        definitions = index.definitions("helper_10_3")
+        print(
+            f"queries: {sum(map(len, calls.values()))} add_library calls, "
+            f"{len(definitions)} definition in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
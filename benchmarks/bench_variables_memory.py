@@ -0,0 +1,87 @@
+# Memory and GC benchmark for stepping through a big CMake cache.
+#
+# A forked MockCMake answers with a cache of --entries variables (every
+# 1000th of which changes at every stop), and the debugger steps through it
+# and fetches all of them at every stop the way `info vars` does. Reports the peak RSS growth, the
+# garbage collections run and the time they took, and the time (and the
+# debugger's CPU time, which leaves out the server) per stop.
+#
+#   python benchmarks/bench_variables_memory.py [--entries 50000] [--stops 20]
+import argparse
+import gc
+import multiprocessing
+import resource
+import socket
+import time
+
+from cmakedbg import debugger
+from cmakedbg.mock_cmake import MockCMake, synthetic_cache, synthetic_program
+from cmakedbg.session import SyncSession
+
+
+def wait_for_stop(state: debugger.DebuggerState) -> None:
+    while state.session.next_event()["event"] != "stopped":
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--stops", type=int, default=20)
+    args = parser.parse_args()
+
+    mock = MockCMake(
+        synthetic_program(args.stops + 1, call_every=0),
+        cache=synthetic_cache(args.entries),
+        changes_every=1000,
+    )
+    client, server_sock = socket.socketpair()
+    server = multiprocessing.get_context("fork").Process(
+        target=mock.serve, args=(server_sock,), daemon=True
+    )
+    server.start()
+    server_sock.close()
+
+    collections = [0, 0, 0]
+    gc_time = 0.0
+    gc_start = 0.0
+
+    def on_gc(phase, info):
+        nonlocal gc_time, gc_start
+        if phase == "start":
+            gc_start = time.perf_counter()
+        else:
+            gc_time = gc_time + time.perf_counter() - gc_start
+            collections[info["generation"]] = collections[info["generation"]] + 1
+
+    state = debugger.DebuggerState(session=SyncSession(client), already_running=True)
+    state.session.request(debugger.initialize)
+    state.session.request(debugger.pause)
+    state.session.request(debugger.configuration_done)
+    wait_for_stop(state)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    gc.callbacks.append(on_gc)
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(args.stops):
+        debugger.reset_variables(state, 1)
+        debugger.get_all_variables(state)
+        state.session.request(debugger.step_into)
+        wait_for_stop(state)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    gc.callbacks.remove(on_gc)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    state.session.close()
+    client.close()
+
+    print(f"{args.entries} cache entries, {args.stops} stops")
+    print(f"  peak RSS growth   {(rss_after - rss_before) / 1024:8.1f} MB")
+    print(f"  gc collections    {collections} (gen0, gen1, gen2)")
+    print(f"  gc time           {gc_time * 1000:8.1f} ms")
+    print(f"  time per stop     {elapsed / args.stops * 1000:8.1f} ms")
+    print(f"  CPU per stop      {cpu / args.stops * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+from cmakedbg.conditions import Condition
+
+
+@dataclass(slots=True)
+class Breakpoint:
+    filepath: str
+    linenum: int
+    condition: Condition | None = None
+    hit_condition: str | None = None
+    # stops at this breakpoint so far where the condition held
+    hit_count: int = 0
+    number: int = 0
+    enabled: bool = True
+    # None until cmake has answered for the breakpoint
+    verified: bool | None = None
+    dap_id: int | None = None
+
+    def __str__(self) -> str:
+        description = f"{self.number}: {self.filepath}:{self.linenum}"
+        if self.condition is not None:
+            description = f"{description} if {self.condition.text}"
+        if self.hit_condition is not None:
+            description = f"{description} hits {self.hit_condition}"
+        if not self.enabled:
+            description = f"{description} [disabled]"
+        elif self.verified is None:
+            description = f"{description} [pending]"
+        elif not self.verified:
+            description = f"{description} [unverified]"
+        if self.hit_count:
+            description = f"{description} (hit {self.hit_count} times)"
+        return description
+
+    def dap_breakpoint(self, capabilities: dict) -> dict:
+        # the conditions are only passed on where cmake can evaluate them,
+        # otherwise they are checked on our side when cmake stops
+        breakpoint: dict[str, int | str] = {"line": self.linenum}
+        if self.condition is not None and capabilities.get(
+            "supportsConditionalBreakpoints"
+        ):
+            breakpoint["condition"] = self.condition.text
+        if self.hit_condition is not None and capabilities.get(
+            "supportsHitConditionalBreakpoints"
+        ):
+            breakpoint["hitCondition"] = self.hit_condition
+        return breakpoint
+
+
+class BreakpointManager:
+    """All the breakpoints, grouped by source file.
+
+    A DAP setBreakpoints request replaces every breakpoint of its source, so
+    changes are not sent one breakpoint at a time. Instead the files whose
+    breakpoints changed are marked dirty, and pending_requests() gives one
+    request per dirty file with its full set of enabled breakpoints.
+
+    Internal breakpoints are plain line breakpoints the debugger sets for
+    itself (find-origin does). They go to cmake along with the user's, but
+    have no number and are not listed.
+    """
+
+    def __init__(self):
+        self._by_file: dict[str, dict[int, Breakpoint]] = {}
+        self._by_number: dict[int, Breakpoint] = {}
+        self._by_dap_id: dict[int, Breakpoint] = {}
+        self._dirty: set[str] = set()
+        self._next_number = 1
+        self._internal: dict[str, set[int]] = {}
+
+    def __iter__(self) -> Iterator[Breakpoint]:
+        return iter(sorted(self._by_number.values(), key=lambda bp: bp.number))
+
+    def __len__(self) -> int:
+        return len(self._by_number)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def add(self, breakpoint: Breakpoint) -> Breakpoint:
+        # a breakpoint on a line that already has one replaces it
+        existing = self.find(breakpoint.filepath, breakpoint.linenum)
+        if existing is not None:
+            breakpoint.number = existing.number
+            self._forget(existing)
+        else:
+            breakpoint.number = self._next_number
+            self._next_number = self._next_number + 1
+        self._by_file.setdefault(breakpoint.filepath, {})[
+            breakpoint.linenum
+        ] = breakpoint
+        self._by_number[breakpoint.number] = breakpoint
+        self._dirty.add(breakpoint.filepath)
+        return breakpoint
+
+    def find(self, filepath: str, linenum: int) -> Breakpoint | None:
+        return self._by_file.get(filepath, {}).get(linenum)
+
+    def get(self, number: int) -> Breakpoint:
+        try:
+            return self._by_number[number]
+        except KeyError:
+            raise ValueError(f"User error: no breakpoint number {number}")
+
+    def delete(self, number: int) -> None:
+        breakpoint = self.get(number)
+        self._forget(breakpoint)
+        del self._by_file[breakpoint.filepath][breakpoint.linenum]
+        if not self._by_file[breakpoint.filepath]:
+            # still dirty, so cmake gets an empty set for the file
+            del self._by_file[breakpoint.filepath]
+
+    def set_enabled(self, number: int, enabled: bool) -> None:
+        breakpoint = self.get(number)
+        if breakpoint.enabled != enabled:
+            breakpoint.enabled = enabled
+            self._dirty.add(breakpoint.filepath)
+
+    def add_internal(self, filepath: str, lines: Iterable[int]) -> None:
+        self._internal.setdefault(filepath, set()).update(lines)
+        self._dirty.add(filepath)
+
+    def clear_internal(self) -> None:
+        self._dirty.update(self._internal)
+        self._internal.clear()
+
+    def _forget(self, breakpoint: Breakpoint) -> None:
+        del self._by_number[breakpoint.number]
+        if breakpoint.dap_id is not None:
+            self._by_dap_id.pop(breakpoint.dap_id, None)
+        self._dirty.add(breakpoint.filepath)
+
+    def pending_requests(
+        self, capabilities: dict
+    ) -> list[tuple[str, list[Breakpoint], list[dict]]]:
+        # (file, breakpoints, DAP breakpoints) for every file whose breakpoints
+        # changed since the last call
+        pending = []
+        for filepath in sorted(self._dirty):
+            breakpoints = [
+                breakpoint
+                for breakpoint in self._by_file.get(filepath, {}).values()
+                if breakpoint.enabled
+            ]
+            dap_breakpoints = [
+                breakpoint.dap_breakpoint(capabilities) for breakpoint in breakpoints
+            ]
+            # after the user's, so the response still lines up with breakpoints
+            user_lines = {breakpoint.linenum for breakpoint in breakpoints}
+            dap_breakpoints.extend(
+                {"line": linenum}
+                for linenum in sorted(self._internal.get(filepath, ()))
+                if linenum not in user_lines
+            )
+            pending.append((filepath, breakpoints, dap_breakpoints))
+        self._dirty.clear()
+        return pending
+
+    def update(
+        self, breakpoints: list[Breakpoint], dap_breakpoints: list[dict]
+    ) -> None:
+        # setBreakpoints answers with one entry per requested breakpoint, in order
+        for breakpoint, dap_breakpoint in zip(breakpoints, dap_breakpoints):
+            if breakpoint.number not in self._by_number:
+                continue
+            breakpoint.verified = dap_breakpoint.get("verified", False)
+            if dap_breakpoint.get("id") is not None:
+                breakpoint.dap_id = dap_breakpoint["id"]
+                self._by_dap_id[breakpoint.dap_id] = breakpoint
+            self._move(breakpoint, dap_breakpoint.get("line"))
+
+    def update_from_event(self, dap_breakpoint: dict) -> Breakpoint | None:
+        # the body of a "breakpoint" event with reason "changed"
+        dap_id = dap_breakpoint.get("id")
+        breakpoint = None if dap_id is None else self._by_dap_id.get(dap_id)
+        if breakpoint is not None:
+            breakpoint.verified = dap_breakpoint.get("verified", breakpoint.verified)
+            self._move(breakpoint, dap_breakpoint.get("line"))
+        return breakpoint
+
+    def _move(self, breakpoint: Breakpoint, linenum: int | None) -> None:
+        # cmake may put the breakpoint on a different line than asked for
+        if linenum is None or linenum == breakpoint.linenum:
+            return
+        lines = self._by_file[breakpoint.filepath]
+        if linenum in lines:
+            return
+        del lines[breakpoint.linenum]
+        breakpoint.linenum = linenum
+        lines[linenum] = breakpoint
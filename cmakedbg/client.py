@@ -0,0 +1,175 @@
+import json
+import shlex
+import socket
+import subprocess
+import sys
+from collections import deque
+from typing import Any
+
+from cmakedbg import debugger
+from cmakedbg.source import SourceCache
+
+
+class SessionError(Exception):
+    # a JSON-RPC error response from the server
+    pass
+
+
+class SessionClient:
+    """Blocking client of a cmakedbg serve session.
+
+    The event notifications of a subscribed client that come in while
+    waiting for a response are kept in `events`, in order, for next_event.
+    """
+
+    def __init__(self, path: str):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self._file = self.sock.makefile("rb")
+        self._next_id = 0
+        self.events: deque[dict] = deque()
+
+    def __enter__(self) -> "SessionClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def call(self, method: str, params: Any = None) -> Any:
+        self._next_id = self._next_id + 1
+        request = {"jsonrpc": "2.0", "id": self._next_id, "method": method}
+        if params is not None:
+            request["params"] = params
+        self.sock.sendall(json.dumps(request).encode() + b"\n")
+        while True:
+            message = self._read()
+            if message.get("method") == "event":
+                self.events.append(message["params"])
+            elif message.get("id") == self._next_id:
+                if "error" in message:
+                    raise SessionError(message["error"]["message"])
+                return message["result"]
+
+    def command(self, argv: list[str]) -> dict:
+        # runs a debugger command: {"output": ..., "failed": ..., "resumed": ...}
+        return self.call(argv[0], argv[1:])
+
+    def next_event(self) -> dict:
+        if self.events:
+            return self.events.popleft()
+        while True:
+            message = self._read()
+            if message.get("method") == "event":
+                return message["params"]
+
+    def close(self) -> None:
+        self._file.close()
+        self.sock.close()
+
+    def _read(self) -> dict:
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("The cmakedbg session closed the connection")
+        return json.loads(line)
+
+
+def show_output(output: str, shell_command: str) -> None:
+    if shell_command != "":
+        try:
+            subprocess.run(shell_command, shell=True, input=output, text=True)
+        except BrokenPipeError:
+            pass
+    elif sys.stdin.isatty() and sys.stdout.isatty():
+        debugger.page_output([output])
+    else:
+        sys.stdout.write(output)
+        print()
+
+
+def show_event(event: dict, source_cache: SourceCache) -> None:
+    match event:
+        case {"event": "stopped", "file": filepath, "line": linenum}:
+            print(debugger.print_listing(filepath, linenum, source_cache))
+        case {"event": "exit", "status": status}:
+            print(f"The debug session ended (exit status {status})")
+        case {"event": "running"}:
+            pass
+        case {"output": output}:
+            # watchpoint, origin
+            print(output)
+
+
+def run_client(path: str) -> int:
+    # cmakedbg attach: the REPL, with the commands run by a cmakedbg serve
+    # session. pipe runs the shell command here; detach (or Ctrl-D) leaves the
+    # session to the other clients while quit ends it
+    try:
+        client = SessionClient(path)
+    except OSError as e:
+        print(f"Could not connect to {path}: {e}")
+        return 1
+    source_cache = SourceCache()
+    last_command: list[str] = []
+    with client:
+        try:
+            show_event(client.call("subscribe"), source_cache)
+            while True:
+                while client.events:
+                    show_event(client.events.popleft(), source_cache)
+                try:
+                    user_input = input(">>> ").strip().split()
+                except KeyboardInterrupt:
+                    print("\nKeyboardInterrupt")
+                    continue
+                except EOFError:
+                    print()
+                    return 0
+                # empty input repeats the last command
+                user_input = user_input or last_command
+                if not user_input:
+                    continue
+                last_command = user_input
+                if user_input == ["detach"]:
+                    return 0
+                shell_command = ""
+                if user_input[0] == "pipe":
+                    rest = " ".join(user_input[1:])
+                    if "|" not in rest:
+                        print("Invalid syntax for pipe command")
+                        continue
+                    dbg_command, shell_command = rest.split("|", maxsplit=1)
+                    user_input = shlex.split(dbg_command)
+                    if not user_input:
+                        print("Invalid syntax for pipe command")
+                        continue
+                try:
+                    result = client.command(user_input)
+                except SessionError as e:
+                    print(e)
+                    continue
+                # what happened before the command ran
+                while client.events:
+                    show_event(client.events.popleft(), source_cache)
+                show_output(result["output"], shell_command)
+                if result["resumed"]:
+                    # like the REPL, the prompt is back once cmake stops
+                    while True:
+                        event = client.next_event()
+                        show_event(event, source_cache)
+                        if event["event"] == "exit":
+                            return 0
+                        if event["event"] == "stopped":
+                            break
+        except ConnectionError:
+            # expected after a quit, once the exit event is in
+            while client.events:
+                event = client.events.popleft()
+                show_event(event, source_cache)
+                if event["event"] == "exit":
+                    return 0
+            print("Lost the connection to the cmakedbg session")
+            return 1
@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+# tried in this order when the codec is "auto"
+CODECS = ("orjson", "msgspec", "json")
+# names the codec to use instead of picking the fastest one installed
+CODEC_ENV = "CMAKEDBG_JSON"
+
+
+class Codec:
+    """Encodes DAP messages to bytes and decodes them from bytes or the
+    memoryviews handed out by FrameDecoder.
+
+    orjson and msgspec parse a memoryview in place. The stdlib json module
+    only takes bytes or str, so there the frame body is copied out once
+    (and not decoded to a str first, which would be a second copy).
+    """
+
+    def __init__(self, name: str, encode: Callable[[dict], bytes], decode: Callable):
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+
+    def __repr__(self) -> str:
+        return f"Codec({self.name!r})"
+
+
+def _json_encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode()
+
+
+def _json_decode(data: bytes | bytearray | memoryview):
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+STDLIB_CODEC = Codec("json", _json_encode, _json_decode)
+
+
+def _load(name: str) -> Codec:
+    match name:
+        case "orjson":
+            import orjson
+
+            return Codec(name, orjson.dumps, orjson.loads)
+        case "msgspec":
+            import msgspec.json
+
+            return Codec(name, msgspec.json.encode, msgspec.json.decode)
+        case "json":
+            return STDLIB_CODEC
+    raise ValueError(
+        f"Unknown JSON codec {name}, should be one of auto, {', '.join(CODECS)}"
+    )
+
+
+def get_codec(name: str = "auto") -> Codec:
+    if name != "auto":
+        return _load(name)
+    for candidate in CODECS:
+        try:
+            return _load(candidate)
+        except ImportError:
+            logger.debug(f"{candidate} is not installed")
+    # the stdlib codec cannot fail to import
+    raise AssertionError("no JSON codec available")
+
+
+def default_codec() -> Codec:
+    return get_codec(os.environ.get(CODEC_ENV, "auto"))
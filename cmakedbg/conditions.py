@@ -0,0 +1,291 @@
+import re
+from collections.abc import Callable
+
+# a subset of CMake's if() syntax, evaluated on our side for conditional
+# breakpoints: NOT/AND/OR, parentheses, DEFINED, the string, number and
+# version comparisons, MATCHES, IN_LIST and plain truth tests
+
+TRUE_CONSTANTS = {"1", "ON", "YES", "TRUE", "Y"}
+FALSE_CONSTANTS = {"0", "OFF", "NO", "FALSE", "N", "IGNORE", "NOTFOUND", ""}
+BINARY_OPERATORS = {
+    "STREQUAL",
+    "STRLESS",
+    "STRGREATER",
+    "STRLESS_EQUAL",
+    "STRGREATER_EQUAL",
+    "MATCHES",
+    "EQUAL",
+    "LESS",
+    "GREATER",
+    "LESS_EQUAL",
+    "GREATER_EQUAL",
+    "VERSION_EQUAL",
+    "VERSION_LESS",
+    "VERSION_GREATER",
+    "VERSION_LESS_EQUAL",
+    "VERSION_GREATER_EQUAL",
+    "IN_LIST",
+}
+KEYWORDS = BINARY_OPERATORS | {"NOT", "AND", "OR", "DEFINED"}
+
+TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+
+
+class Token:
+    __slots__ = ("text", "quoted")
+
+    def __init__(self, text: str, quoted: bool = False):
+        self.text = text
+        self.quoted = quoted
+
+    def is_keyword(self, *keywords: str) -> bool:
+        return not self.quoted and self.text in keywords
+
+
+def tokenize(text: str) -> list[Token]:
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"Invalid condition: {text}")
+        open_paren, close_paren, quoted, word = match.groups()
+        if quoted is not None:
+            tokens.append(Token(re.sub(r"\\(.)", r"\1", quoted), quoted=True))
+        else:
+            tokens.append(Token(open_paren or close_paren or word))
+        pos = match.end()
+    return tokens
+
+
+class Condition:
+    """A parsed condition. evaluate() takes a function that returns the value
+    of a variable, or None if it is not set."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._tokens = tokenize(text)
+        self._pos = 0
+        if not self._tokens:
+            raise ValueError("Empty condition")
+        self._tree = self._parse_or()
+        if self._pos != len(self._tokens):
+            raise ValueError(
+                f"Invalid condition: unexpected '{self._tokens[self._pos].text}' in {text}"
+            )
+
+    def evaluate(self, lookup: Callable[[str], str | None]) -> bool:
+        values: dict[str, str | None] = {}
+
+        def cached_lookup(name: str) -> str | None:
+            if name not in values:
+                values[name] = lookup(name)
+            return values[name]
+
+        try:
+            return evaluate(self._tree, cached_lookup)
+        except re.error as e:
+            # a MATCHES whose pattern comes from a variable
+            raise ValueError(f"Invalid condition: bad regex in {self.text}: {e}")
+
+    def _peek(self) -> Token | None:
+        if self._pos < len(self._tokens):
+            return self._tokens[self._pos]
+        return None
+
+    def _next(self) -> Token:
+        token = self._peek()
+        if token is None:
+            raise ValueError(f"Invalid condition: unexpected end of {self.text}")
+        self._pos = self._pos + 1
+        return token
+
+    def _parse_or(self) -> tuple:
+        node = self._parse_and()
+        while (token := self._peek()) is not None and token.is_keyword("OR"):
+            self._next()
+            node = ("OR", node, self._parse_and())
+        return node
+
+    def _parse_and(self) -> tuple:
+        node = self._parse_not()
+        while (token := self._peek()) is not None and token.is_keyword("AND"):
+            self._next()
+            node = ("AND", node, self._parse_not())
+        return node
+
+    def _parse_not(self) -> tuple:
+        token = self._peek()
+        if token is not None and token.is_keyword("NOT"):
+            self._next()
+            return ("NOT", self._parse_not())
+        return self._parse_comparison()
+
+    def _parse_comparison(self) -> tuple:
+        token = self._next()
+        if token.is_keyword("("):
+            node = self._parse_or()
+            if not self._next().is_keyword(")"):
+                raise ValueError(f"Invalid condition: missing ')' in {self.text}")
+            return node
+        if token.is_keyword("DEFINED"):
+            return ("DEFINED", self._next().text)
+        if not token.quoted and token.text in KEYWORDS | {")"}:
+            raise ValueError(
+                f"Invalid condition: unexpected '{token.text}' in {self.text}"
+            )
+        operator = self._peek()
+        if (
+            operator is not None
+            and not operator.quoted
+            and operator.text in BINARY_OPERATORS
+        ):
+            self._next()
+            right = self._next()
+            if operator.text == "MATCHES" and right.quoted:
+                # a literal pattern is checked now rather than at every hit
+                try:
+                    re.compile(right.text)
+                except re.error as e:
+                    raise ValueError(
+                        f"Invalid condition: bad regex '{right.text}' in {self.text}: {e}"
+                    )
+            return (operator.text, token, right)
+        return ("TRUTH", token)
+
+
+def evaluate(node: tuple, lookup: Callable[[str], str | None]) -> bool:
+    match node:
+        case ("OR", left, right):
+            return evaluate(left, lookup) or evaluate(right, lookup)
+        case ("AND", left, right):
+            return evaluate(left, lookup) and evaluate(right, lookup)
+        case ("NOT", operand):
+            return not evaluate(operand, lookup)
+        case ("DEFINED", name):
+            return lookup(name) is not None
+        case ("TRUTH", token):
+            return is_true(token, lookup)
+        case ("IN_LIST", left, right):
+            values = lookup(right.text) or ""
+            return operand_value(left, lookup) in values.split(";")
+        case (operator, left, right):
+            return compare(
+                operator, operand_value(left, lookup), operand_value(right, lookup)
+            )
+    raise ValueError(f"Invalid condition node {node}")
+
+
+def operand_value(token: Token, lookup: Callable[[str], str | None]) -> str:
+    # like if(): an unquoted argument that names a variable means its value
+    if not token.quoted:
+        value = lookup(token.text)
+        if value is not None:
+            return value
+    return token.text
+
+
+def is_constant_true(value: str) -> bool | None:
+    upper = value.upper()
+    if upper in TRUE_CONSTANTS:
+        return True
+    if upper in FALSE_CONSTANTS or upper.endswith("-NOTFOUND"):
+        return False
+    try:
+        return float(value) != 0
+    except ValueError:
+        return None
+
+
+def is_true(token: Token, lookup: Callable[[str], str | None]) -> bool:
+    constant = is_constant_true(token.text)
+    if constant is not None:
+        return constant
+    if token.quoted:
+        return False
+    value = lookup(token.text)
+    return value is not None and is_constant_true(value) is not False
+
+
+def version_tuple(value: str) -> tuple[int, ...]:
+    parts = []
+    for part in value.split("."):
+        digits = re.match(r"\d+", part)
+        parts.append(int(digits.group()) if digits else 0)
+    while parts and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+def compare(operator: str, left: str, right: str) -> bool:
+    match operator:
+        case "STREQUAL":
+            return left == right
+        case "STRLESS":
+            return left < right
+        case "STRGREATER":
+            return left > right
+        case "STRLESS_EQUAL":
+            return left <= right
+        case "STRGREATER_EQUAL":
+            return left >= right
+        case "MATCHES":
+            return re.search(right, left) is not None
+        case "VERSION_EQUAL":
+            return version_tuple(left) == version_tuple(right)
+        case "VERSION_LESS":
+            return version_tuple(left) < version_tuple(right)
+        case "VERSION_GREATER":
+            return version_tuple(left) > version_tuple(right)
+        case "VERSION_LESS_EQUAL":
+            return version_tuple(left) <= version_tuple(right)
+        case "VERSION_GREATER_EQUAL":
+            return version_tuple(left) >= version_tuple(right)
+    try:
+        left_number, right_number = float(left), float(right)
+    except ValueError:
+        return False
+    match operator:
+        case "EQUAL":
+            return left_number == right_number
+        case "LESS":
+            return left_number < right_number
+        case "GREATER":
+            return left_number > right_number
+        case "LESS_EQUAL":
+            return left_number <= right_number
+        case "GREATER_EQUAL":
+            return left_number >= right_number
+    raise ValueError(f"Unknown operator {operator}")
+
+
+HIT_CONDITION_RE = re.compile(r"^(>=|==|>|%)?(\d+)$")
+
+
+def validate_hit_condition(hit_condition: str) -> str:
+    parse_hit_condition(hit_condition)
+    return hit_condition
+
+
+def parse_hit_condition(hit_condition: str) -> tuple[str | None, str]:
+    match = HIT_CONDITION_RE.match(hit_condition)
+    if match is None:
+        raise ValueError(
+            f"User error: hit count should be N, >=N, >N, ==N or %N, not '{hit_condition}'"
+        )
+    operator, number = match.groups()
+    return operator, number
+
+
+def hit_condition_met(hit_condition: str, hit_count: int) -> bool:
+    # a bare number N means stop from the Nth hit on
+    operator, number = parse_hit_condition(hit_condition)
+    match operator:
+        case "==":
+            return hit_count == int(number)
+        case ">":
+            return hit_count > int(number)
+        case "%":
+            return int(number) > 0 and hit_count % int(number) == 0
+    return hit_count >= int(number)
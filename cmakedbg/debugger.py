@@ -1,3 +1,4 @@
+import os
 import socket
 import shlex
 import argparse
@@ -7,96 +8,682 @@ import uuid
 import sys
 import subprocess
 import pathlib
-import json
 from pprint import pprint
 from dataclasses import dataclass
 import dataclasses
 import logging
 import io
-from typing import Any
-from collections.abc import Callable
+import json
+import re
+from collections import deque
+from typing import IO, Any
+from collections.abc import Callable, Iterable, Iterator
+
+from cmakedbg.breakpoints import Breakpoint, BreakpointManager
+from cmakedbg.conditions import Condition, hit_condition_met, validate_hit_condition
+from cmakedbg.history import StopHistory
+from cmakedbg.indexer import (
+    IDENTIFIER_RE,
+    ListfileIndex,
+    default_index_path,
+    listfiles,
+    module_dirs,
+    source_dir,
+)
+from cmakedbg.metrics import Metrics
+from cmakedbg.origin import OriginSearch, candidate_lines
+from cmakedbg.recording import Recorder, launch_replay
+from cmakedbg.session import EventLoopThread, SyncSession
+from cmakedbg.source import SourceCache
+from cmakedbg.variables import VariableHistory, VariableIndex, container_values
 
 # importing readline so input() will do better editing
 # linter will warn readline is imported but unused
 import readline
 
-SEQ = 0
 logger = logging.getLogger(__name__)
 
+# number of lines shown by the list command
+LIST_SIZE = 10
+
+# containers under the frame scope that hold the CMake variables, lowest
+# precedence first (a local variable shadows a cache entry of the same name)
+TOP_LEVEL_CONTAINERS = ["CacheVariables", "Directories", "Locals"]
+
+
+def pipe_name() -> str:
+    # a fresh path for cmake's --debugger-pipe
+    return f"/tmp/cmake-{uuid.uuid4()}"
+
+
+@dataclass(slots=True)
+class Frame:
+    id: int
+    name: str
+    path: str
+    line: int
+
+    @classmethod
+    def from_dap(cls, frame: dict) -> "Frame":
+        return cls(
+            frame["id"],
+            frame.get("name", ""),
+            frame.get("source", {}).get("path", ""),
+            frame.get("line", 0),
+        )
+
+    def __str__(self) -> str:
+        return f"{self.name} at {self.path}:{self.line}"
+
+
+@dataclass(slots=True)
+class FrameVariables:
+    # what has been fetched of one frame's variables at one stop:
+    # variable_refs maps the top level entries of the frame's scope to their
+    # variablesReference, containers holds the containers that have been
+    # fetched so far and merged the view of all of them, where a local shadows
+    # a cache entry of the same name
+    scope_variables: dict | None = None
+    variable_refs: dict = dataclasses.field(default_factory=dict)
+    containers: dict = dataclasses.field(default_factory=dict)
+    merged: dict = dataclasses.field(default_factory=dict)
+    # sorted names of merged, for the frames other than the innermost one
+    # (whose names are indexed by the variable history)
+    index: VariableIndex | None = None
+
 
 @dataclass
 class DebuggerState:
-    response: bytes = b""
     cmake_process_handle: subprocess.Popen = None
-    host: str = f"/tmp/cmake-{uuid.uuid4()}"
+    # set by run_debugger once cmake's debugger pipe is connected
+    session: SyncSession | None = None
+    host: str = dataclasses.field(default_factory=pipe_name)
     already_running: bool = False
-    cmake_variables: dict = dataclasses.field(default_factory=dict)
-    top_level_vars: int = 0
+    # body of cmake's initialize response
+    capabilities: dict = dataclasses.field(default_factory=dict)
+    # variables are fetched lazily, frame by frame, and memoized in
+    # frame_cache under (stop_id, frame id) until cmake runs again. frame_id is
+    # the innermost frame at the stop and selected_frame the index in
+    # stacktrace of the one frame/up/down moved to
+    frame_cache: dict[tuple[int, int | None], FrameVariables] = dataclasses.field(
+        default_factory=dict
+    )
+    frame_id: int | None = None
+    selected_frame: int = 0
+    # stops are numbered from 1; variable_history keeps the variables seen at
+    # past stops and watches the last seen value of every watched variable
+    stop_id: int = 0
+    variable_history: VariableHistory = dataclasses.field(
+        default_factory=VariableHistory
+    )
+    watches: dict = dataclasses.field(default_factory=dict)
+    watch_stepping: bool = False
+    # where every stop was, and the variable changes seen at them
+    stop_history: StopHistory = dataclasses.field(default_factory=StopHistory)
+    # set while find-origin drives cmake
+    origin_search: OriginSearch | None = None
+    # source tree of the cmake command line, and the functions, macros and
+    # command calls of its listfiles and cmake's modules, indexed on first use
+    source_dir: str = ""
+    listfile_index: ListfileIndex = dataclasses.field(
+        default_factory=lambda: ListfileIndex(default_index_path())
+    )
     current_line: tuple[str, int] = ("", 0)
-    stacktrace: list = dataclasses.field(default_factory=list)
-    breakpoints: list = dataclasses.field(default_factory=list)
+    source_cache: SourceCache = dataclasses.field(default_factory=SourceCache)
+    # (file, first line, last line) of the last list command, None after a stop
+    list_position: tuple[str, int, int] | None = None
+    stacktrace: list[Frame] = dataclasses.field(default_factory=list)
+    breakpoints: BreakpointManager = dataclasses.field(
+        default_factory=BreakpointManager
+    )
     last_command: list[str] = dataclasses.field(default_factory=list)
+    # commands from the rc files and --batch/--commands that run before (or,
+    # in batch mode, instead of) reading from the prompt
+    command_queue: deque = dataclasses.field(default_factory=deque)
+    batch: bool = False
+    json_output: IO[str] | None = None
+    # the server.Server of a cmakedbg serve session, which the commands come
+    # from and the stops and other events go to
+    server: Any = None
+    command_failed: bool = False
+    failed_commands: int = 0
     cmd_output: io.StringIO = io.StringIO()
     shell_command: str = ""
+    # per DAP command counters and timings, kept while stats_enabled (with the
+    # stats command or --stats-json)
+    metrics: Metrics = dataclasses.field(default_factory=Metrics)
+    stats_enabled: bool = False
+
+
+def dap_session(debugger_state: DebuggerState) -> SyncSession:
+    # run_debugger connects the session before any command or event can
+    # talk to cmake
+    if debugger_state.session is None:
+        raise ConnectionError("Not connected to cmake")
+    return debugger_state.session
+
+
+def reset_variables(debugger_state: DebuggerState, frame_id: int | None) -> None:
+    # called once per stop
+    debugger_state.stop_id = debugger_state.stop_id + 1
+    debugger_state.frame_id = frame_id
+    debugger_state.selected_frame = 0
+    debugger_state.frame_cache.clear()
+
+
+def invalidate_frames(debugger_state: DebuggerState) -> None:
+    # called when cmake runs again; nothing fetched at this stop holds after
+    debugger_state.frame_cache.clear()
+
+
+def selected_frame_id(debugger_state: DebuggerState) -> int | None:
+    if debugger_state.selected_frame and debugger_state.stacktrace:
+        return debugger_state.stacktrace[debugger_state.selected_frame].id
+    return debugger_state.frame_id
+
+
+def frame_variables(
+    debugger_state: DebuggerState, frame_id: int | None = None
+) -> FrameVariables:
+    # the cache entry of frame_id (by default the selected frame) at this stop
+    if frame_id is None:
+        frame_id = selected_frame_id(debugger_state)
+    key = (debugger_state.stop_id, frame_id)
+    cached = debugger_state.frame_cache.get(key)
+    if cached is None:
+        cached = debugger_state.frame_cache[key] = FrameVariables()
+    return cached
+
+
+def fetch_variables(debugger_state: DebuggerState, var_refs: list[int]) -> list[list]:
+    # all the variables requests are in flight at the same time
+    responses = dap_session(debugger_state).request_many(
+        [(variables, var_ref) for var_ref in var_refs]
+    )
+    return [body_json.get("body", {}).get("variables", []) for body_json in responses]
+
+
+def load_scope_variables(
+    debugger_state: DebuggerState, frame_id: int | None = None
+) -> dict:
+    if frame_id is None:
+        frame_id = selected_frame_id(debugger_state)
+    cached = frame_variables(debugger_state, frame_id)
+    if cached.scope_variables is None:
+        cached.scope_variables = {}
+        body_json = dap_session(debugger_state).request(scopes, frame_id)
+        var_refs = [
+            scope["variablesReference"]
+            for scope in body_json.get("body", {}).get("scopes", [])
+        ]
+        for scope_variables in fetch_variables(debugger_state, var_refs):
+            cached.scope_variables.update(container_values(scope_variables))
+            for variable in scope_variables:
+                if variable["name"] in TOP_LEVEL_CONTAINERS:
+                    cached.variable_refs[variable["name"]] = variable[
+                        "variablesReference"
+                    ]
+    return cached.scope_variables
+
+
+def load_containers(
+    debugger_state: DebuggerState, containers: list[str], frame_id: int | None = None
+) -> dict:
+    # container name -> its variables, for all the containers fetched so far
+    load_scope_variables(debugger_state, frame_id)
+    cached = frame_variables(debugger_state, frame_id)
+    missing = [
+        container for container in containers if container not in cached.containers
+    ]
+    var_refs = [cached.variable_refs.get(container) for container in missing]
+    fetched = iter(
+        fetch_variables(debugger_state, [ref for ref in var_refs if ref is not None])
+    )
+    for container, var_ref in zip(missing, var_refs):
+        values = {}
+        if var_ref is not None:
+            values = container_values(next(fetched))
+        cached.containers[container] = values
+    return cached.containers
+
+
+def load_container(
+    debugger_state: DebuggerState, container: str, frame_id: int | None = None
+) -> dict:
+    return load_containers(debugger_state, [container], frame_id)[container]
+
+
+def get_variable(
+    debugger_state: DebuggerState, varname: str, frame_id: int | None = None
+) -> str | None:
+    # CONTAINER.NAME (e.g. Locals.FOO) only looks in that container
+    container, _, name = varname.partition(".")
+    if name and container in TOP_LEVEL_CONTAINERS:
+        return load_container(debugger_state, container, frame_id).get(name)
+    # search from the highest precedence container down, so a lookup that hits
+    # a local never pulls in the (much bigger) cache
+    for container in reversed(TOP_LEVEL_CONTAINERS):
+        values = load_container(debugger_state, container, frame_id)
+        if varname in values:
+            return values[varname]
+    return load_scope_variables(debugger_state, frame_id).get(varname)
+
+
+def get_all_variables(
+    debugger_state: DebuggerState, frame_id: int | None = None
+) -> dict:
+    if frame_id is None:
+        frame_id = selected_frame_id(debugger_state)
+    cached = frame_variables(debugger_state, frame_id)
+    if not cached.merged:
+        merged = dict(load_scope_variables(debugger_state, frame_id))
+        containers = load_containers(debugger_state, TOP_LEVEL_CONTAINERS, frame_id)
+        for container in TOP_LEVEL_CONTAINERS:
+            merged.update(containers[container])
+        cached.merged = merged
+        # the history follows the innermost frame from stop to stop
+        if frame_id == debugger_state.frame_id:
+            changes = debugger_state.variable_history.record(
+                debugger_state.stop_id, merged
+            )
+            debugger_state.stop_history.record_changes(debugger_state.stop_id, changes)
+    return cached.merged
+
+
+def variable_index(debugger_state: DebuggerState) -> VariableIndex:
+    # the names of the selected frame's variables, once get_all_variables has
+    # fetched them
+    frame_id = selected_frame_id(debugger_state)
+    if frame_id == debugger_state.frame_id:
+        return debugger_state.variable_history.index
+    cached = frame_variables(debugger_state, frame_id)
+    if cached.index is None:
+        cached.index = VariableIndex()
+        cached.index.update(list(cached.merged), [], cached.merged)
+    return cached.index
+
+
+def check_watches(debugger_state: DebuggerState) -> io.StringIO | None:
+    # software watchpoints: compare the watched variables against the values
+    # seen at the last check, only fetching what the lookups need
+    current = {
+        varname: get_variable(debugger_state, varname, debugger_state.frame_id)
+        for varname in debugger_state.watches
+    }
+    changes = debugger_state.variable_history.record(
+        debugger_state.stop_id, current, partial=True
+    )
+    debugger_state.stop_history.record_changes(debugger_state.stop_id, changes)
+    changed = [
+        varname
+        for varname, value in current.items()
+        if value != debugger_state.watches[varname]
+    ]
+    if not changed:
+        return None
+    command_output = io.StringIO()
+    for varname in changed:
+        print(
+            f"Watchpoint {varname}: {debugger_state.watches[varname]!r} -> {current[varname]!r}",
+            file=command_output,
+        )
+        debugger_state.watches[varname] = current[varname]
+    return command_output
+
+
+def variable_lines(all_vars: dict, varnames: Iterable[str]) -> Iterator[str]:
+    # formatted one variable at a time as the output is consumed
+    for varname in varnames:
+        yield f"{varname}={all_vars[varname]}\n"
+
+
+def find_variables(
+    debugger_state: DebuggerState, pattern: list[str], command_output
+) -> Iterable[str]:
+    # info vars GLOB, or info vars -r REGEX
+    all_vars = get_all_variables(debugger_state)
+    index = variable_index(debugger_state)
+    match pattern:
+        case ["-r", regex]:
+            try:
+                varnames = index.regex(regex)
+            except re.error as e:
+                user_error(
+                    debugger_state,
+                    f"User error: invalid regex {regex}: {e}",
+                    command_output,
+                )
+                return command_output
+        case [glob]:
+            varnames = index.glob(glob)
+        case _:
+            user_error(
+                debugger_state,
+                "User error: should be 'info vars PATTERN' or 'info vars -r REGEX'",
+                command_output,
+            )
+            return command_output
+    return variable_lines(all_vars, varnames)
+
+
+def print_changed_variables(debugger_state: DebuggerState, command_output) -> None:
+    get_all_variables(debugger_state, debugger_state.frame_id)
+    previous, changes = debugger_state.variable_history.changes(debugger_state.stop_id)
+    if previous is None:
+        print(
+            "No earlier snapshot of the variables to compare with", file=command_output
+        )
+        return
+    print(f"Changed since stop {previous}:", file=command_output)
+    for varname in sorted(changes):
+        old, new = changes[varname]
+        if old is None:
+            print(f"+ {varname}={new}", file=command_output)
+        elif new is None:
+            print(f"- {varname}", file=command_output)
+        else:
+            print(f"  {varname}: {old!r} -> {new!r}", file=command_output)
+
+
+def print_history(debugger_state: DebuggerState, count: int, command_output) -> None:
+    history = debugger_state.stop_history
+    if not history.count:
+        print("No stops yet", file=command_output)
+        return
+    print(f"{'stop':>7} {'time':>11} {'depth':>5}  location", file=command_output)
+    for stop in history.last(count):
+        print(stop, file=command_output)
+    if history.count > len(history):
+        print(
+            f"({history.count - len(history)} older stops are no longer kept)",
+            file=command_output,
+        )
 
 
-# TODO: move the payload functions to a different file
-def send_request(s, request_func, *args):
-    payload = request_func(*args)
-    request_bytes = create_request(payload)
+def print_last_visit(
+    debugger_state: DebuggerState, filepath: str, linenum: int, command_output
+) -> None:
+    visit = debugger_state.stop_history.last_visit(filepath, linenum)
+    if visit is None:
+        print(f"{filepath}:{linenum} has not been stopped at", file=command_output)
+        return
+    stop_id, visits = visit
+    print(
+        f"Last stopped at {filepath}:{linenum} in stop {stop_id} ({visits} stops there in all)",
+        file=command_output,
+    )
+
+
+def print_last_set(debugger_state: DebuggerState, varname: str, command_output) -> None:
+    # variables are only compared at the stops where something fetched them
+    # (info vars, info changed, watches), so a change is reported at the first
+    # of those stops to see it
+    change = debugger_state.stop_history.last_change(varname)
+    if change is None:
+        print(
+            f"No change of {varname} seen. Variables are compared at the stops where "
+            "'info vars', 'info changed' or a watch fetched them",
+            file=command_output,
+        )
+        return
+    stop_id, old, new = change
+    stop = debugger_state.stop_history.find(stop_id)
+    where = f"{stop.path}:{stop.line}" if stop is not None else "a stop no longer kept"
+    print(
+        f"{varname} last seen changing at stop {stop_id}, {where}: {old!r} -> {new!r}",
+        file=command_output,
+    )
+    earlier = debugger_state.stop_history.changed_at(varname)[:-1]
+    if earlier:
+        print(
+            f"Also seen changing at stops {', '.join(map(str, earlier[-10:]))}",
+            file=command_output,
+        )
+
+
+def start_origin_search(
+    debugger_state: DebuggerState, args: list[str], command_output
+) -> tuple[Callable, list[Any]] | None:
+    # find-origin [-step] VAR [VALUE]: sets up the search and gives the
+    # request that starts it, which runs the current command
+    fine = args[0] == "-step"
+    if fine:
+        args = args[1:]
+    varname, *value = args
+    value = " ".join(value) or None
+    current = get_variable(debugger_state, varname, debugger_state.frame_id)
+    if value is not None and current is not None and value in current:
+        user_error(
+            debugger_state,
+            f"User error: {varname} already contains {value!r}. find-origin only looks "
+            "forward from here, so it has to be started before the value is set",
+            command_output,
+        )
+        return None
+    search = OriginSearch(varname, value, current, fine=fine)
+    if not fine:
+        # the project's listfiles, and whichever others cmake has stopped in
+        root = os.path.dirname(debugger_state.stacktrace[-1].path)
+        paths = set(listfiles(root)) | set(debugger_state.stop_history.files)
+        search.candidates = candidate_lines(sorted(paths), varname)
+        # with nowhere to stop, a change would only show after cmake is gone
+        search.fine = not search.candidates
+        for filepath, lines in search.candidates.items():
+            debugger_state.breakpoints.add_internal(filepath, lines)
+    search.last_location = debugger_state.current_line
+    search.last_stack = list(debugger_state.stacktrace)
+    search.stepped = True
+    debugger_state.origin_search = search
+    return (step_into if search.fine else dbg_next), []
+
+
+def lookup_origin_variable(
+    debugger_state: DebuggerState, search: OriginSearch
+) -> str | None:
+    # the container the variable was in at the last stop is asked for first,
+    # which is one variables request instead of three when cmake has kept its
+    # variablesReference. Only Locals, which nothing shadows, is reused
+    if search.reference is not None:
+        body_json = dap_session(debugger_state).request(variables, search.reference)
+        if body_json.get("success"):
+            values = container_values(body_json.get("body", {}).get("variables", []))
+            if search.varname in values:
+                return values[search.varname]
+    value = get_variable(debugger_state, search.varname, debugger_state.frame_id)
+    cached = frame_variables(debugger_state, debugger_state.frame_id)
+    search.reference = None
+    if search.varname in cached.containers.get("Locals", {}):
+        search.reference = cached.variable_refs.get("Locals")
+    return value
+
+
+def origin_report(
+    debugger_state: DebuggerState, search: OriginSearch, value: str | None
+) -> io.StringIO:
+    command_output = io.StringIO()
+    progress = f"{search.stops} stops and {search.elapsed():.2f} s into the search"
+    if search.stepped:
+        filepath, linenum = search.last_location
+        print(
+            f"{search.describe()} at {filepath}:{linenum} ({progress}): "
+            f"{search.last_value!r} -> {value!r}",
+            file=command_output,
+        )
+        for i, frame in enumerate(search.last_stack):
+            print(f"#{i:<3} {frame}", file=command_output)
+    else:
+        print(
+            f"{search.describe()} between {'%s:%d' % search.last_location} and "
+            f"{'%s:%d' % debugger_state.current_line} ({progress}), outside the "
+            f"{search.candidate_count()} lines that mention it: "
+            f"{search.last_value!r} -> {value!r}",
+            file=command_output,
+        )
+        print(
+            "It was set by cmake itself or by a file that was not looked through. "
+            f"'find-origin -step {search.varname}' single steps to the exact line",
+            file=command_output,
+        )
+    return command_output
+
+
+def end_origin_search(debugger_state: DebuggerState) -> None:
+    debugger_state.breakpoints.clear_internal()
+    debugger_state.origin_search = None
+
+
+def origin_step(debugger_state: DebuggerState) -> bool:
+    # checks the variable at a stop of the search. Lets cmake run on and
+    # returns True, or ends the search with a report and returns False
+    search = debugger_state.origin_search
+    if search is None:
+        return False
+    search.stops = search.stops + 1
+    value = lookup_origin_variable(debugger_state, search)
+    changes = debugger_state.variable_history.record(
+        debugger_state.stop_id, {search.varname: value}, partial=True
+    )
+    debugger_state.stop_history.record_changes(debugger_state.stop_id, changes)
+    if search.found(value):
+        show_event_output(
+            debugger_state, "origin", origin_report(debugger_state, search, value)
+        )
+        end_origin_search(debugger_state)
+        return False
+    search.last_value = value
+    search.last_location = debugger_state.current_line
+    search.last_stack = list(debugger_state.stacktrace)
+    invalidate_frames(debugger_state)
+    # candidate lines are stepped over, so that a change is seen right after
+    # the command that made it
+    if search.fine:
+        search.stepped = True
+        dap_session(debugger_state).request(step_into)
+    elif search.is_candidate(*debugger_state.current_line):
+        search.stepped = True
+        dap_session(debugger_state).request(dbg_next)
+    else:
+        search.stepped = False
+        dap_session(debugger_state).request(dbg_continue)
+    return True
+
+
+def print_listing(filepath, linenum, source_cache: SourceCache):
+    listing_buffer = io.StringIO()
+    print(f"{filepath}:", file=listing_buffer)
+    for line_number, line in source_cache.lines(filepath, linenum - 2, linenum + 2):
+        marker = "->" if line_number == linenum else "  "
+        print(f"{marker} {line_number}: {line}", file=listing_buffer)
+    return listing_buffer.getvalue()
+
+
+def selected_location(debugger_state: DebuggerState) -> tuple[str, int]:
+    # where the selected frame is; the current line unless frame/up/down moved
+    if debugger_state.selected_frame and debugger_state.stacktrace:
+        frame = debugger_state.stacktrace[debugger_state.selected_frame]
+        return frame.path, frame.line
+    return debugger_state.current_line
+
+
+def select_frame(debugger_state: DebuggerState, index: int, command_output) -> None:
+    # frame N, up and down; the variables commands then look at that frame
+    if not 0 <= index < len(debugger_state.stacktrace):
+        user_error(
+            debugger_state,
+            f"User error: no frame #{index}, the stack has {len(debugger_state.stacktrace)}",
+            command_output,
+        )
+        return
+    debugger_state.selected_frame = index
+    debugger_state.list_position = None
+    print(f"#{index:<3} {debugger_state.stacktrace[index]}", file=command_output)
+    print(
+        print_listing(*selected_location(debugger_state), debugger_state.source_cache),
+        end="",
+        file=command_output,
+    )
+
+
+def list_source(
+    debugger_state: DebuggerState, where: list[str], command_output
+) -> None:
+    # gdb style list: 'list' shows the lines around the current line and then
+    # keeps going forward, 'list -' goes backwards, 'list N' centers on line N,
+    # 'list N,M' shows lines N to M and 'list FILE:N' does the same in FILE
+    if debugger_state.list_position is not None:
+        filepath, first, last = debugger_state.list_position
+    elif debugger_state.current_line != ("", 0):
+        filepath, linenum = selected_location(debugger_state)
+        first, last = linenum, linenum - 1
+    else:
+        filepath, first, last = "", 0, 0
 
-    logger.info(request_bytes)
+    match where:
+        case []:
+            if debugger_state.list_position is None:
+                first = max(first - LIST_SIZE // 2, 1)
+            else:
+                first = last + 1
+            last = first + LIST_SIZE - 1
+        case ["-"]:
+            if first <= 1:
+                print(f"Already at the start of {filepath}.", file=command_output)
+                return
+            last = first - 1
+            first = max(last - LIST_SIZE + 1, 1)
+        case [spec]:
+            if ":" in spec:
+                filepath, spec = spec.rsplit(":", maxsplit=1)
+                filepath = str(pathlib.Path(filepath).expanduser().resolve())
+            try:
+                if "," in spec:
+                    first_str, last_str = spec.split(",", maxsplit=1)
+                    first, last = int(first_str), int(last_str)
+                else:
+                    first = max(int(spec) - LIST_SIZE // 2, 1)
+                    last = first + LIST_SIZE - 1
+            except ValueError:
+                user_error(
+                    debugger_state,
+                    f"User error: invalid line specification '{' '.join(where)}'",
+                    command_output,
+                )
+                return
+        case _:
+            user_error(
+                debugger_state,
+                "User error: list takes at most one argument",
+                command_output,
+            )
+            return
+
+    if filepath == "":
+        user_error(
+            debugger_state,
+            "CMake build has not started running or hit a breakpoint yet",
+            command_output,
+        )
+        return
     try:
-        s.sendall(request_bytes)
-    except Exception as e:
-        raise e
-
-
-def create_request(payload):
-    global SEQ
-    SEQ = SEQ + 1
-    payload["seq"] = SEQ
-    payload["type"] = "request"
-    payloadstr = json.dumps(payload)
-    request = f"""Content-Length: {len(payloadstr)}\r
-\r
-{payloadstr}"""
-    request_bytes = request.encode()
-    return request_bytes
-
-
-def recv_response(s, response):
-    while b"\r\n\r\n" not in response:
-        response = response + s.recv(4096)
-    header, response = response.split(b"\r\n\r\n", maxsplit=1)
-    header = header.decode()
-    size = int(header.split()[1])  # geting content lenght value
-    while len(response) < size:
-        response = response + s.recv(4096)
-    body, response = response[:size], response[size:]
-    body_json = json.loads(body.decode())
-    logger.info(header)
-    logger.info(body_json)
-    return body_json, response
-
-
-def print_listing(filepath, linenum):
-    with open(filepath, "r") as f:
-        listing_buffer = io.StringIO()
-        lines = [line.strip() for line in f.readlines()]
-        linenum = linenum - 1
-        print(f"{filepath}:", file=listing_buffer)
-        if linenum - 2 >= 0:
-            print(f"   {linenum - 1}: {lines[linenum - 2]}", file=listing_buffer)
-        if linenum - 1 >= 0:
-            print(f"   {linenum}: {lines[linenum - 1]}", file=listing_buffer)
-        print(f"-> {linenum + 1}: {lines[linenum]}", file=listing_buffer)
-        if linenum + 1 < len(lines):
-            print(f"   {linenum + 2}: {lines[linenum + 1]}", file=listing_buffer)
-        if linenum + 2 < len(lines):
-            print(f"   {linenum + 3}: {lines[linenum + 2]}", file=listing_buffer)
-
-        return listing_buffer.getvalue()
+        line_count = debugger_state.source_cache.line_count(filepath)
+    except OSError as e:
+        user_error(debugger_state, f"User error: {e}", command_output)
+        return
+    if first > line_count:
+        print(
+            f'Line number {first} out of range; "{filepath}" has {line_count} lines.',
+            file=command_output,
+        )
+        return
+    print(f"{filepath}:", file=command_output)
+    for line_number, line in debugger_state.source_cache.lines(filepath, first, last):
+        marker = (
+            "->"
+            if (filepath, line_number) == selected_location(debugger_state)
+            else "  "
+        )
+        print(f"{marker} {line_number}: {line}", file=command_output)
+    debugger_state.list_position = (filepath, first, min(last, line_count))
 
 
 # debugger commands
@@ -118,14 +705,22 @@ def initialize():
     return payload
 
 
-def set_breakpoints(filepath, lineno):
+def set_breakpoints(filepath, lineno, condition=None, hit_condition=None):
+    breakpoint = {"line": lineno}
+    if condition is not None:
+        breakpoint["condition"] = condition
+    if hit_condition is not None:
+        breakpoint["hitCondition"] = hit_condition
+    return set_source_breakpoints(filepath, [breakpoint])
+
+
+def set_source_breakpoints(filepath, breakpoints):
+    # replaces all the breakpoints of the file
     payload = {
         "command": "setBreakpoints",
         "arguments": {
             "source": {"name": filepath, "path": filepath},
-            "breakpoints": [
-                {"line": lineno},
-            ],
+            "breakpoints": breakpoints,
         },
     }
     return payload
@@ -192,6 +787,16 @@ def dbg_continue():
     return payload
 
 
+def pause():
+    payload = {
+        "command": "pause",
+        "arguments": {
+            "threadId": 1,
+        },
+    }
+    return payload
+
+
 def configuration_done():
     payload = {"command": "configurationDone", "arguments": {}}
     return payload
@@ -219,55 +824,414 @@ def validate_filepath_and_linenum(filepath_and_linenum: str) -> tuple[str, int]:
         raise RuntimeWarning(f"User error: {filepath} is not a valid file")
 
 
-def dbg_quit(debugger_state: DebuggerState):
-    print()
+def parse_breakpoint(filepath_and_linenum: str, rest: list[str]) -> Breakpoint:
+    # br FILE:LINE [if CONDITION] [hits N]
+    filepath, linenum = validate_filepath_and_linenum(filepath_and_linenum)
+    condition, hit_condition = parse_breakpoint_conditions(rest)
+    return Breakpoint(filepath, linenum, condition, hit_condition)
+
+
+def parse_breakpoint_conditions(rest: list[str]) -> tuple[Condition | None, str | None]:
+    # what follows the location of a breakpoint: [if CONDITION] [hits N]
+    hit_condition = None
+    if len(rest) >= 2 and rest[-2] == "hits":
+        hit_condition = validate_hit_condition(rest[-1])
+        rest = rest[:-2]
+    condition = None
+    if rest and rest[0] == "if":
+        condition = Condition(" ".join(rest[1:]))
+    elif rest:
+        raise RuntimeWarning(
+            "User error: breakpoint should be of the form 'file:line [if CONDITION] [hits N]'"
+        )
+    return condition, hit_condition
+
+
+def is_function_name(location: str) -> bool:
+    # br NAME is a function breakpoint unless NAME is a file
+    return bool(IDENTIFIER_RE.fullmatch(location)) and not os.path.isfile(location)
+
+
+def index_listfiles(debugger_state: DebuggerState) -> ListfileIndex:
+    # brings the index up to date with the project's listfiles (the directory
+    # of the outermost frame once cmake runs) and cmake's modules; only new
+    # and changed files are scanned again
+    if debugger_state.stacktrace:
+        root = os.path.dirname(debugger_state.stacktrace[-1].path)
+    else:
+        root = debugger_state.source_dir or os.getcwd()
+    debugger_state.listfile_index.update([root, *module_dirs()])
+    return debugger_state.listfile_index
+
+
+def function_breakpoints(
+    debugger_state: DebuggerState, location: str, rest: list[str]
+) -> list[Breakpoint]:
+    # br NAME stops at the first command of the body of every definition of
+    # the function or macro NAME, br -call NAME at every call to a command
+    # (one of cmake's own like add_library, or a function or macro)
+    if location == "-call":
+        if not rest:
+            raise RuntimeWarning("User error: br -call needs the name of a command")
+        name, *rest = rest
+    else:
+        name = location
+    condition, hit_condition = parse_breakpoint_conditions(rest)
+    index = index_listfiles(debugger_state)
+    if location == "-call":
+        lines = [
+            (filepath, linenum)
+            for filepath, call_lines in index.calls(name).items()
+            for linenum in sorted(set(call_lines))
+        ]
+        if not lines:
+            raise RuntimeWarning(
+                f"User error: no calls to {name} in the {len(index.paths)} listfiles indexed"
+            )
+    else:
+        lines = [
+            (definition.path, definition.body_line)
+            for definition in index.definitions(name)
+        ]
+        if not lines:
+            raise RuntimeWarning(
+                f"User error: {name} is neither a file nor a function or macro in the "
+                f"{len(index.paths)} listfiles indexed"
+            )
+    return [
+        Breakpoint(filepath, linenum, condition, hit_condition)
+        for filepath, linenum in lines
+    ]
+
+
+def print_functions(
+    debugger_state: DebuggerState, regex: list[str], command_output
+) -> None:
+    try:
+        # as case insensitive as command names
+        pattern = re.compile(regex[0], re.IGNORECASE) if regex else None
+    except re.error as e:
+        user_error(
+            debugger_state,
+            f"User error: invalid regex {regex[0]!r}: {e}",
+            command_output,
+        )
+        return
+    index = index_listfiles(debugger_state)
+    definitions = index.functions(pattern)
+    if not definitions:
+        print(
+            f"No functions or macros{f' matching {regex[0]!r}' if regex else ''} in the "
+            f"{len(index.paths)} listfiles indexed",
+            file=command_output,
+        )
+    for definition in definitions:
+        print(
+            f"{definition.kind:<8} {definition.name:<40} {definition.path}:{definition.line}",
+            file=command_output,
+        )
+
+
+def sync_breakpoints(debugger_state: DebuggerState) -> None:
+    # one setBreakpoints per file whose breakpoints changed, all in flight at
+    # the same time, so loading hundreds of breakpoints costs a round trip
+    pending = debugger_state.breakpoints.pending_requests(debugger_state.capabilities)
+    if not pending:
+        return
+    responses = dap_session(debugger_state).request_many(
+        [
+            (set_source_breakpoints, filepath, dap_breakpoints)
+            for filepath, _, dap_breakpoints in pending
+        ]
+    )
+    for (_, breakpoints, _), body_json in zip(pending, responses):
+        debugger_state.breakpoints.update(
+            breakpoints, body_json.get("body", {}).get("breakpoints", [])
+        )
+
+
+def breakpoint_numbers(numbers: list[str]) -> list[int]:
+    try:
+        return [int(number) for number in numbers]
+    except ValueError:
+        raise ValueError(
+            f"User error: breakpoint numbers should be integers: {' '.join(numbers)}"
+        )
+
+
+def breakpoint_hit(debugger_state: DebuggerState, reason: str | None) -> bool | None:
+    # whether to stop at the breakpoint on the current line, or None if this
+    # stop is not a breakpoint hit. Conditions cmake can't evaluate itself are
+    # checked here, fetching only the variables they refer to
+    if reason == "step" and not debugger_state.watch_stepping:
+        return None
+    breakpoint = debugger_state.breakpoints.find(*debugger_state.current_line)
+    if breakpoint is None or not breakpoint.enabled:
+        return None
+    if breakpoint.condition is not None and not debugger_state.capabilities.get(
+        "supportsConditionalBreakpoints"
+    ):
+        try:
+            if not breakpoint.condition.evaluate(
+                lambda varname: get_variable(debugger_state, varname)
+            ):
+                return False
+        except ValueError as e:
+            # like cmake with a bad regex in if(), stop and say why
+            output = io.StringIO()
+            print(f"Breakpoint {breakpoint.number}: {e}", file=output)
+            show_event_output(debugger_state, "condition", output)
+            return True
+    breakpoint.hit_count = breakpoint.hit_count + 1
+    if breakpoint.hit_condition is not None and not debugger_state.capabilities.get(
+        "supportsHitConditionalBreakpoints"
+    ):
+        return hit_condition_met(breakpoint.hit_condition, breakpoint.hit_count)
+    return True
+
+
+def dbg_quit(debugger_state: DebuggerState, terminated: bool = False):
+    if not debugger_state.batch and debugger_state.server is None:
+        print()
+        debugger_state.cmake_process_handle.kill()
+        sys.exit(0)
+
+    # batch and serve mode exit with cmake's exit code if it finished and
+    # failed, and batch mode otherwise with 1 if any of the commands failed
+    returncode = None
+    if terminated:
+        try:
+            returncode = debugger_state.cmake_process_handle.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            pass
     debugger_state.cmake_process_handle.kill()
-    sys.exit(0)
+    if returncode:
+        status = returncode
+    else:
+        # a client's mistake is not the session's
+        status = (
+            1 if debugger_state.failed_commands and debugger_state.server is None else 0
+        )
+    record = {
+        "event": "exit",
+        "status": status,
+        "cmake_returncode": returncode,
+        "failed_commands": debugger_state.failed_commands,
+    }
+    if debugger_state.server is not None:
+        # the clients hear about it before their connections are closed
+        debugger_state.server.publish(record)
+        debugger_state.server.close()
+    else:
+        emit_json(debugger_state, record)
+    sys.exit(status)
+
+
+def emit_json(debugger_state: DebuggerState, record: dict) -> None:
+    print(json.dumps(record), file=debugger_state.json_output, flush=True)
+
+
+def set_stats(debugger_state: DebuggerState, enabled: bool) -> None:
+    debugger_state.stats_enabled = enabled
+    if debugger_state.session is not None:
+        debugger_state.session.set_metrics(debugger_state.metrics if enabled else None)
+
+
+def print_stats(debugger_state: DebuggerState, command_output) -> Iterable[str] | None:
+    if debugger_state.metrics:
+        return debugger_state.metrics.report()
+    if debugger_state.stats_enabled:
+        print("No DAP requests since statistics were turned on", file=command_output)
+    else:
+        print(
+            "Statistics are off. Use 'stats on' to start collecting them",
+            file=command_output,
+        )
+    return None
+
+
+def show_event_output(
+    debugger_state: DebuggerState, event: str, output: io.StringIO
+) -> None:
+    # output of something that happened at a stop rather than of a command
+    if debugger_state.server is not None:
+        debugger_state.server.publish({"event": event, "output": output.getvalue()})
+    elif debugger_state.batch:
+        emit_json(debugger_state, {"event": event, "output": output.getvalue()})
+    else:
+        pipe_to_shell_or_print(debugger_state, output)
+
+
+def user_error(debugger_state: DebuggerState, message, command_output) -> None:
+    debugger_state.command_failed = True
+    print(message, file=command_output)
+
+
+def read_command_file(path: str) -> list[list[str]]:
+    commands = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line != "" and not line.startswith("#"):
+                commands.append(line.split())
+    return commands
+
+
+def rc_files() -> list[str]:
+    # like gdb's init files: the one in the home directory first, then the one
+    # in the current directory
+    paths = []
+    for directory in [pathlib.Path.home(), pathlib.Path.cwd()]:
+        rc_file = directory.joinpath(".cmakedbgrc").resolve()
+        if rc_file.is_file() and str(rc_file) not in paths:
+            paths.append(str(rc_file))
+    return paths
+
+
+def next_user_input(debugger_state: DebuggerState) -> list[str]:
+    if debugger_state.command_queue:
+        return debugger_state.command_queue.popleft()
+    if debugger_state.batch:
+        # end of the script
+        dbg_quit(debugger_state)
+    while True:
+        try:
+            return input(">>> ").strip().split()
+        except KeyboardInterrupt:  # catches CTRL+C
+            print("\nKeyboardInterrupt")
+        except EOFError:  # catches CTRL+D
+            dbg_quit(debugger_state)
 
 
-def pipe_to_shell_or_print(debugger_state: DebuggerState, inputstr: str) -> None:
+def output_chunks(output: str | io.StringIO | Iterable[str]) -> Iterable[str]:
+    # command output is a string, a StringIO or any other iterable of text
+    # (e.g. a generator formatting one line at a time)
+    if isinstance(output, str):
+        return [output]
+    if isinstance(output, io.StringIO):
+        output.seek(0)
+    return output
+
+
+def output_text(
+    output: tuple[Callable, list[Any]] | str | io.StringIO | Iterable[str],
+) -> str:
+    # takes anything parse_command returns: a command that resumes cmake has
+    # no output of its own
+    if isinstance(output, tuple):
+        return ""
+    return "".join(output_chunks(output))
+
+
+def pipe_to_shell_or_print(
+    debugger_state: DebuggerState, output: str | io.StringIO | Iterable[str]
+) -> None:
     if debugger_state.shell_command != "":
-        result = subprocess.run(
+        process = subprocess.Popen(
             debugger_state.shell_command,
             shell=True,
-            input=inputstr,
+            stdin=subprocess.PIPE,
             text=True,
         )
         debugger_state.shell_command = ""
-
+        try:
+            # writes block while the pipe is full, so the output is only
+            # generated as fast as the shell command reads it. stdin is
+            # always there with stdin=PIPE
+            if process.stdin is not None:
+                for chunk in output_chunks(output):
+                    process.stdin.write(chunk)
+                process.stdin.close()
+        except BrokenPipeError:
+            # the command exited early (e.g. quitting less), the rest of the
+            # output is never generated
+            pass
+        process.wait()
+
+    elif not debugger_state.batch and sys.stdin.isatty() and sys.stdout.isatty():
+        page_output(output_chunks(output))
     else:
-        print(inputstr)
+        for chunk in output_chunks(output):
+            sys.stdout.write(chunk)
+        print()
+
+
+def page_output(chunks: Iterable[str]) -> None:
+    # a minimal more(1): stops after every screenful, and only asks for the
+    # next lines of the output when they are about to be shown
+    height = max(shutil.get_terminal_size().lines - 1, 1)
+    shown = 0
+    for chunk in chunks:
+        for line in chunk.splitlines(keepends=True):
+            if shown == height:
+                try:
+                    answer = input("--More-- (Enter to continue, q to stop) ")
+                except (EOFError, KeyboardInterrupt):
+                    print()
+                    return
+                if answer.strip().lower() == "q":
+                    return
+                shown = 0
+            sys.stdout.write(line)
+            shown = shown + 1
+    print()
 
 
 def process_user_input(debugger_state: DebuggerState) -> tuple[Callable, list[Any]]:
+    if debugger_state.server is not None:
+        return debugger_state.server.run_commands(debugger_state)
     if debugger_state.current_line != ("", 0):
-        listing = print_listing(*debugger_state.current_line)
-        pipe_to_shell_or_print(debugger_state, listing)
+        if debugger_state.batch:
+            filepath, linenum = debugger_state.current_line
+            emit_json(
+                debugger_state,
+                {
+                    "event": "stopped",
+                    "stop": debugger_state.stop_id,
+                    "file": filepath,
+                    "line": linenum,
+                },
+            )
+        else:
+            listing = print_listing(
+                *debugger_state.current_line, debugger_state.source_cache
+            )
+            pipe_to_shell_or_print(debugger_state, listing)
 
     while True:
-        user_input = []
-        try:
-            user_input = input(">>> ").strip().split()
-        except KeyboardInterrupt:  # catches CTRL+C
-            print("\nKeyboardInterrupt")
-            continue
-        except EOFError:  # catches CTRL+D
-            dbg_quit(debugger_state)
+        user_input = next_user_input(debugger_state)
 
         if user_input != []:
             debugger_state.last_command = user_input
 
+        debugger_state.command_failed = False
         output_or_command = parse_command(debugger_state, user_input)
-        if type(output_or_command) is tuple:
+        if debugger_state.command_failed:
+            debugger_state.failed_commands = debugger_state.failed_commands + 1
+        if isinstance(output_or_command, tuple):
             # debugger command and args to send to cmake DAP server
+            if debugger_state.batch:
+                emit_json(
+                    debugger_state,
+                    {"command": " ".join(user_input), "output": "", "failed": False},
+                )
             return output_or_command
+        elif debugger_state.batch and debugger_state.shell_command == "":
+            emit_json(
+                debugger_state,
+                {
+                    "command": " ".join(user_input),
+                    "output": output_text(output_or_command),
+                    "failed": debugger_state.command_failed,
+                },
+            )
         else:
-            pipe_to_shell_or_print(debugger_state, output_or_command.getvalue())
+            pipe_to_shell_or_print(debugger_state, output_or_command)
 
 
 def parse_command(
     debugger_state: DebuggerState, user_input: list[str]
-) -> tuple[Callable, list[Any]] | io.StringIO:
+) -> tuple[Callable, list[Any]] | io.StringIO | Iterable[str]:
 
     #    if "pipe" in user_input and "|" in user_input:
     #
@@ -284,7 +1248,9 @@ def parse_command(
         case ["pipe", *rest]:
             rest = " ".join(rest)
             if "|" not in rest:
-                print("Invalid syntax for pipe command", file=command_output)
+                user_error(
+                    debugger_state, "Invalid syntax for pipe command", command_output
+                )
                 return command_output
             dbg_command, shell_command = rest.split("|", maxsplit=1)
             dbg_command = shlex.split(dbg_command)
@@ -292,88 +1258,304 @@ def parse_command(
 
             return parse_command(debugger_state, dbg_command)
 
-        case ["breakpoint" | "break" | "br", filepath_and_linenum]:
+        case ["breakpoint" | "break" | "br", location, *rest]:
             try:
-                filepath, linenum = validate_filepath_and_linenum(filepath_and_linenum)
+                if location == "-call" or is_function_name(location):
+                    breakpoints = function_breakpoints(debugger_state, location, rest)
+                else:
+                    breakpoints = [parse_breakpoint(location, rest)]
             except RuntimeWarning as r:
-                print(r, file=command_output)
+                user_error(debugger_state, r, command_output)
             except ValueError as e:
-                print(e, file=command_output)
+                user_error(debugger_state, e, command_output)
             else:
-                debugger_state.breakpoints.append((filepath, linenum))
-                return set_breakpoints, [filepath, linenum]
+                # sent to cmake together with any others before it runs again,
+                # one setBreakpoints per file
+                for breakpoint in breakpoints:
+                    debugger_state.breakpoints.add(breakpoint)
+                    print(
+                        f"Breakpoint {breakpoint.number} at {breakpoint.filepath}:{breakpoint.linenum}",
+                        file=command_output,
+                    )
+        case ["delete" | "d", *numbers]:
+            try:
+                for number in breakpoint_numbers(numbers) or [
+                    breakpoint.number for breakpoint in debugger_state.breakpoints
+                ]:
+                    debugger_state.breakpoints.delete(number)
+            except ValueError as e:
+                user_error(debugger_state, e, command_output)
+        case ["disable" | "enable" as action, *numbers]:
+            try:
+                for number in breakpoint_numbers(numbers) or [
+                    breakpoint.number for breakpoint in debugger_state.breakpoints
+                ]:
+                    debugger_state.breakpoints.set_enabled(number, action == "enable")
+            except ValueError as e:
+                user_error(debugger_state, e, command_output)
+        case ["source", path]:
+            try:
+                commands = read_command_file(os.path.expanduser(path))
+            except OSError as e:
+                user_error(
+                    debugger_state,
+                    f"User error: cannot read {path}: {e}",
+                    command_output,
+                )
+            else:
+                # run before anything already queued
+                debugger_state.command_queue.extendleft(reversed(commands))
         case ["run" | "r"]:
             if debugger_state.already_running:
-                print(
+                user_error(
+                    debugger_state,
                     "CMake already started running. Ignoring command.",
-                    file=command_output,
+                    command_output,
                 )
             else:
                 return configuration_done, []
         case ["continue" | "c"]:
             if not debugger_state.already_running:
-                print(
+                user_error(
+                    debugger_state,
                     "CMake build has not started running. Use 'run' command to start running",
-                    file=command_output,
+                    command_output,
                 )
+            elif debugger_state.watches:
+                # no data breakpoints in cmake, so single step and check the
+                # watched variables at every stop
+                debugger_state.watch_stepping = True
+                return step_into, []
             else:
                 return dbg_continue, []
         case ["next" | "n"]:
             if not debugger_state.already_running:
-                print(
+                user_error(
+                    debugger_state,
                     "CMake build has not started running. Use 'run' command to start running",
-                    file=command_output,
+                    command_output,
                 )
             else:
                 return dbg_next, []
         case ["step" | "s"]:
             if not debugger_state.already_running:
-                print(
+                user_error(
+                    debugger_state,
                     "CMake build has not started running. Use 'run' command to start running",
-                    file=command_output,
+                    command_output,
                 )
             else:
                 return step_into, []
 
         case ["info", "breakpoints" | "break" | "b"]:
-            pprint(debugger_state.breakpoints, stream=command_output)
+            for breakpoint in debugger_state.breakpoints:
+                print(breakpoint, file=command_output)
         case ["info", "variables" | "vars" | "locals"]:
             if not debugger_state.already_running:
-                print(
+                user_error(
+                    debugger_state,
                     "CMake build has not started running. Cannot print any variables yet. Use 'run' command to start running",
-                    file=command_output,
+                    command_output,
                 )
             else:
-                pprint(debugger_state.cmake_variables, stream=command_output)
-        case ["get", "variable" | "var", varname]:
+                all_vars = get_all_variables(debugger_state)
+                return variable_lines(all_vars, variable_index(debugger_state))
+        case ["info", "variables" | "vars" | "locals", *pattern]:
             if not debugger_state.already_running:
-                print(
+                user_error(
+                    debugger_state,
                     "CMake build has not started running. Cannot print any variables yet. Use 'run' command to start running",
-                    file=command_output,
+                    command_output,
+                )
+            else:
+                return find_variables(debugger_state, pattern, command_output)
+        case ["info", "functions", *regex] if len(regex) <= 1:
+            print_functions(debugger_state, regex, command_output)
+        case ["search", "value" | "values", *substring] if substring:
+            if not debugger_state.already_running:
+                user_error(
+                    debugger_state,
+                    "CMake build has not started running. Cannot search any variables yet. Use 'run' command to start running",
+                    command_output,
                 )
-            elif varname in debugger_state.cmake_variables:
+            else:
+                substring = " ".join(substring)
+                all_vars = get_all_variables(debugger_state)
+                return variable_lines(
+                    all_vars,
+                    (
+                        varname
+                        for varname in variable_index(debugger_state)
+                        if substring in all_vars[varname]
+                    ),
+                )
+        case ["info", "changed"]:
+            if not debugger_state.already_running:
+                user_error(
+                    debugger_state,
+                    "CMake build has not started running. Cannot print any variables yet. Use 'run' command to start running",
+                    command_output,
+                )
+            else:
+                print_changed_variables(debugger_state, command_output)
+        case ["watch", varname]:
+            if not debugger_state.already_running:
+                user_error(
+                    debugger_state,
+                    "CMake build has not started running. Cannot watch any variables yet. Use 'run' command to start running",
+                    command_output,
+                )
+            else:
+                value = get_variable(debugger_state, varname)
+                debugger_state.watches[varname] = value
                 print(
-                    f"{varname}={debugger_state.cmake_variables[varname]}",
+                    f"Watching {varname}={value if value is not None else ''}",
                     file=command_output,
                 )
+        case ["unwatch", varname]:
+            if debugger_state.watches.pop(varname, False) is False:
+                user_error(
+                    debugger_state, f"{varname} is not being watched", command_output
+                )
+        case ["info", "watch" | "watches"]:
+            pprint(debugger_state.watches, stream=command_output)
+        case ["get", "variable" | "var", varname]:
+            if not debugger_state.already_running:
+                user_error(
+                    debugger_state,
+                    "CMake build has not started running. Cannot print any variables yet. Use 'run' command to start running",
+                    command_output,
+                )
             else:
-                print(f"{varname}=", file=command_output)
-        case ["list" | "listing" | "li" | "l"]:
-            if debugger_state.current_line == ("", 0):
+                value = get_variable(debugger_state, varname)
                 print(
-                    "CMake build has not started running or hit a breakpoint yet",
+                    f"{varname}={value if value is not None else ''}",
                     file=command_output,
                 )
+        case ["expect", "variable" | "var", varname, *expected]:
+            if not debugger_state.already_running:
+                user_error(
+                    debugger_state,
+                    "CMake build has not started running. Cannot check any variables yet. Use 'run' command to start running",
+                    command_output,
+                )
+            else:
+                value = get_variable(debugger_state, varname) or ""
+                expected = " ".join(expected)
+                if value == expected:
+                    print(f"{varname}={value}", file=command_output)
+                else:
+                    user_error(
+                        debugger_state,
+                        f"Expected {varname}={expected!r}, got {value!r}",
+                        command_output,
+                    )
+        case ["list" | "listing" | "li" | "l", *where]:
+            list_source(debugger_state, where, command_output)
+        case ["history", *count] if len(count) <= 1:
+            if count and not count[0].isdigit():
+                user_error(
+                    debugger_state,
+                    f"User error: invalid number of stops {count[0]}",
+                    command_output,
+                )
+            else:
+                print_history(
+                    debugger_state, int(count[0]) if count else 10, command_output
+                )
+        case ["where-was", filepath_and_linenum]:
+            try:
+                filepath, linenum = validate_filepath_and_linenum(filepath_and_linenum)
+            except (RuntimeWarning, ValueError) as e:
+                user_error(debugger_state, e, command_output)
             else:
-                print(print_listing(*debugger_state.current_line), file=command_output)
+                print_last_visit(debugger_state, filepath, linenum, command_output)
+        case ["last-set", varname]:
+            print_last_set(debugger_state, varname, command_output)
+        case ["find-origin", *args] if args and args != ["-step"]:
+            if not debugger_state.already_running:
+                user_error(
+                    debugger_state,
+                    "CMake build has not started running. Cannot search for a variable yet. Use 'run' command to start running",
+                    command_output,
+                )
+            else:
+                request = start_origin_search(debugger_state, args, command_output)
+                if request is not None:
+                    return request
+        case ["frame" | "f", *number] if len(number) <= 1:
+            if not debugger_state.already_running:
+                user_error(
+                    debugger_state,
+                    "CMake build has not started running. Cannot select a frame. Use 'run' command to start running",
+                    command_output,
+                )
+            elif not number:
+                select_frame(
+                    debugger_state, debugger_state.selected_frame, command_output
+                )
+            elif not number[0].isdigit():
+                user_error(
+                    debugger_state,
+                    f"User error: invalid frame number {number[0]}",
+                    command_output,
+                )
+            else:
+                select_frame(debugger_state, int(number[0]), command_output)
+        case ["up" | "down" as direction, *count] if len(count) <= 1:
+            if not debugger_state.already_running:
+                user_error(
+                    debugger_state,
+                    "CMake build has not started running. Cannot select a frame. Use 'run' command to start running",
+                    command_output,
+                )
+            elif count and not count[0].isdigit():
+                user_error(
+                    debugger_state,
+                    f"User error: invalid frame count {count[0]}",
+                    command_output,
+                )
+            else:
+                # up goes towards the outermost frame, the end of the stacktrace
+                step = int(count[0]) if count else 1
+                index = debugger_state.selected_frame + (
+                    step if direction == "up" else -step
+                )
+                if index < 0:
+                    user_error(
+                        debugger_state,
+                        "Bottom (innermost) frame selected; you cannot go down.",
+                        command_output,
+                    )
+                elif index >= len(debugger_state.stacktrace):
+                    user_error(
+                        debugger_state,
+                        "Initial frame selected; you cannot go up.",
+                        command_output,
+                    )
+                else:
+                    select_frame(debugger_state, index, command_output)
         case ["stacktrace" | "st" | "backtrace" | "bt"]:
             if not debugger_state.already_running:
-                print(
+                user_error(
+                    debugger_state,
                     "CMake build has not started running. Cannot print stacktrace. Use 'run' command to start running",
-                    file=command_output,
+                    command_output,
                 )
             else:
-                pprint(debugger_state.stacktrace, stream=command_output)
+                for i, frame in enumerate(debugger_state.stacktrace):
+                    marker = "*" if i == debugger_state.selected_frame else " "
+                    print(f"{marker}#{i:<3} {frame}", file=command_output)
+
+        case ["stats"]:
+            report = print_stats(debugger_state, command_output)
+            if report is not None:
+                return report
+        case ["stats", "on" | "off" as switch]:
+            set_stats(debugger_state, switch == "on")
+            print(f"Statistics {switch}", file=command_output)
+        case ["stats", "reset"]:
+            debugger_state.metrics.reset()
 
         case ["help" | "h"]:
             print(print_debugger_commands(), file=command_output)
@@ -386,7 +1568,7 @@ def parse_command(
             if debugger_state.last_command != []:
                 return parse_command(debugger_state, debugger_state.last_command)
         case _:
-            print("Unknown command", file=command_output)
+            user_error(debugger_state, "Unknown command", command_output)
     return command_output
 
 
@@ -397,24 +1579,68 @@ CMake Debugger Commands:
 
 Flow Control:
 ------------
-breakpoint, break, br <file:line>    Set a breakpoint at specified file and line number
+breakpoint, break, br <file:line> [if <condition>] [hits <N>]
+                                     Set a breakpoint at specified file and line number,
+                                     optionally only stopping when a CMake if() condition
+                                     holds (e.g. if FOO STREQUAL bar) and/or from the Nth
+                                     hit on (also ==N, >N and %N for every Nth hit)
+breakpoint, break, br <name> [...]   Set a breakpoint at the first line of the body of a
+                                     function or macro, wherever it is defined
+breakpoint, break, br -call <command> [...]
+                                     Set a breakpoint at every call to a command (e.g.
+                                     add_library) in the project and cmake's modules
+delete, d [N...]                     Delete the given breakpoints (all of them without N)
+disable [N...], enable [N...]        Disable or enable the given breakpoints (or all of them)
 run, r                               Start the CMake build execution
-continue, c                          Continue execution until next breakpoint
+continue, c                          Continue execution until next breakpoint (or until a
+                                     watched variable changes)
 next, n                              Step over - execute next line without entering functions
 step, s                              Step into - execute next line, entering functions if present
 
 Information:
 ------------
 info breakpoints        List all set breakpoints (aliases: info break, info b)
+info functions [regex]  List the functions and macros defined in the project and cmake's
+                        modules (those whose names match a regex), and where
 info variables          Display all CMake variables in current scope (aliases: info vars, info locals)
-get variable <name>     Display value of specific CMake variable (alias: get var)
-list                    Show source code around current line (aliases: listing, li, l)
-stacktrace              Display current call stack (aliases: st, backtrace, bt)
+info vars <glob>        Display the CMake variables whose names match a glob (e.g. CMAKE_*_FLAGS)
+info vars -r <regex>    Display the CMake variables whose names match a regex
+search value <text>     Display the CMake variables whose values contain the text
+get variable <name>     Display value of specific CMake variable (alias: get var); with
+                        CacheVariables.<name>, Directories.<name> or Locals.<name> only
+                        that scope is looked in
+expect var <name> <value>
+                        Check that a CMake variable has the given value (fails the
+                        command otherwise, useful in --batch scripts)
+info changed            Display the variables that changed since the previous snapshot
+watch <name>            Stop when the value of a CMake variable changes
+unwatch <name>          Stop watching a CMake variable
+info watch              List watched variables and their last seen values
+list [N | N,M | FILE:N] Show source code around current line, or around/between the given
+                        lines; repeating 'list' shows the next lines, 'list -' the previous
+                        ones (aliases: listing, li, l)
+stacktrace              Display current call stack (aliases: st, backtrace, bt), the
+                        selected frame marked with *
+frame, f [N]            Select frame N of the stacktrace (0 is where CMake stopped), or show
+                        the selected one; the variable commands then look at that frame
+up [N], down [N]        Select the frame N (default 1) calls further out or further in
+history [N]             Show the last N (default 10) stops: where, when and how deep
+where-was <file:line>   Show the last stop at a line, and how many stops there were there
+last-set <name>         Show the last stop at which a CMake variable was seen changing
+find-origin [-step] <name> [<value>]
+                        Run CMake until a variable changes (or, with a value, until it
+                        contains it) and show the line and stack that did it. Only stops
+                        at the lines that mention the variable, unless -step is given
+stats                   Display the count, bytes and round trip and decode times of every
+                        DAP request and event since 'stats on'
+stats on|off|reset      Start or stop collecting statistics, or clear them
 
 Other:
 ------
 pipe <cmakedbg command> | <shell command>     Pipe the output of a cmakedbg command to a shell
                                               command e.g. pipe info vars | less
+source <file>                                 Run the commands in a file, one per line (e.g. a
+                                              list of breakpoints)
 quit, q                                       Exit the debugger
 help, h                                       Display this help message
 
@@ -426,7 +1652,7 @@ Notes:
           """
 
 
-def launch_cmake(cmd: list, pipe_host, print_help):
+def launch_cmake(cmd: list, pipe_host, print_help, stdout=None):
 
     if len(cmd) == 0:
         print_help()
@@ -444,19 +1670,284 @@ def launch_cmake(cmd: list, pipe_host, print_help):
     cmd.insert(1, f"--debugger-pipe {pipe_host}")
     cmd.insert(1, "--debugger")
     print(f"cmd: {cmd}")
-    cmd_handle = subprocess.Popen(cmd)
-    time.sleep(0.5)
+    cmd_handle = subprocess.Popen(cmd, stdout=stdout)
     return cmd_handle
 
 
+def connect_to_cmake(
+    pipe_host: str, cmake_process: subprocess.Popen, timeout: float = 30.0
+) -> socket.socket:
+    # cmake creates the debugger pipe some time after starting, which can take
+    # a while on slow filesystems. Poll for it with a bounded backoff instead
+    # of sleeping a fixed amount, and give up early if cmake exits first
+    start = time.perf_counter()
+    delay = 0.001
+    attempts = 0
+    while True:
+        if cmake_process.poll() is not None:
+            raise RuntimeError(
+                f"cmake exited with code {cmake_process.returncode} before the debugger pipe was ready"
+            )
+        if os.path.exists(pipe_host):
+            attempts = attempts + 1
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                s.connect(pipe_host)
+            except (FileNotFoundError, ConnectionRefusedError):
+                # the path exists before cmake is listening on it
+                s.close()
+            else:
+                logger.info(
+                    f"startup: debugger pipe ready after {(time.perf_counter() - start) * 1000:.1f} ms ({attempts} connect attempts)"
+                )
+                return s
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(
+                f"cmake did not open the debugger pipe {pipe_host} within {timeout} seconds"
+            )
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+# requests after which cmake runs until its next stopped event
+RESUME_REQUESTS = (configuration_done, dbg_continue, dbg_next, step_into)
+
+
+def run_user_commands(debugger_state: DebuggerState) -> None:
+    # keep prompting until a command lets cmake run again
+    while True:
+        request_func, args = process_user_input(debugger_state)
+        if request_func in RESUME_REQUESTS:
+            sync_breakpoints(debugger_state)
+            invalidate_frames(debugger_state)
+        dap_session(debugger_state).request(request_func, *args)
+        if request_func is configuration_done:
+            debugger_state.already_running = True
+        if request_func in RESUME_REQUESTS:
+            return
+
+
+def handle_stopped(debugger_state: DebuggerState, reason: str | None = None) -> None:
+    body_json = dap_session(debugger_state).request(stacktrace)
+    match body_json:
+        case {
+            "type": "response",
+            "command": "stackTrace",
+            "body": {
+                "stackFrames": [
+                    {
+                        "id": frame_id,
+                        "line": linenumber,
+                        "source": {"path": filepath},
+                    } as first_frame,
+                    *other_frames,
+                ]
+            },
+        }:
+            reset_variables(debugger_state, frame_id)
+            debugger_state.current_line = (filepath, linenumber)
+            debugger_state.stacktrace = [
+                Frame.from_dap(frame) for frame in [first_frame, *other_frames]
+            ]
+            debugger_state.stop_history.record(
+                debugger_state.stop_id,
+                filepath,
+                linenumber,
+                len(debugger_state.stacktrace),
+            )
+            debugger_state.list_position = None
+        case _:
+            print(f"Unhandled message type: {body_json}")
+            return
+
+    if debugger_state.origin_search is not None:
+        # the search runs cmake until it is done, past any breakpoints
+        if origin_step(debugger_state):
+            return
+        debugger_state.watch_stepping = False
+        run_user_commands(debugger_state)
+        return
+
+    # variables are only fetched once a command asks for them
+    stop = breakpoint_hit(debugger_state, reason)
+    if debugger_state.watches:
+        watch_output = check_watches(debugger_state)
+        if watch_output is not None:
+            show_event_output(debugger_state, "watchpoint", watch_output)
+            stop = True
+    if stop is None:
+        stop = not debugger_state.watch_stepping
+    if not stop:
+        logger.info("not stopping at %s:%d", *debugger_state.current_line)
+        invalidate_frames(debugger_state)
+        if debugger_state.watch_stepping:
+            dap_session(debugger_state).request(step_into)
+        else:
+            dap_session(debugger_state).request(dbg_continue)
+        return
+    debugger_state.watch_stepping = False
+    run_user_commands(debugger_state)
+
+
+def handle_events(debugger_state: DebuggerState) -> None:
+    # reacts to cmake's events until dbg_quit exits
+    while True:
+        try:
+            body_json = dap_session(debugger_state).next_event()
+        except ConnectionError:
+            print("Lost the connection to cmake")
+            dbg_quit(debugger_state)
+        match body_json:
+            case {"type": "event", "event": "initialized"}:
+                run_user_commands(debugger_state)
+            case {"type": "event", "event": "stopped"}:
+                handle_stopped(debugger_state, body_json.get("body", {}).get("reason"))
+            case {
+                "type": "event",
+                "event": "breakpoint",
+                "body": {"breakpoint": dap_breakpoint},
+            }:
+                debugger_state.breakpoints.update_from_event(dap_breakpoint)
+            case {"type": "event", "event": "terminated"}:
+                if debugger_state.origin_search is not None:
+                    search = debugger_state.origin_search
+                    command_output = io.StringIO()
+                    print(
+                        f"CMake finished and {search.varname} never "
+                        f"{search.describe().removeprefix(search.varname + ' ')}"
+                        f" ({search.stops} stops, {search.elapsed():.2f} s); {search.varname}="
+                        f"{search.last_value if search.last_value is not None else ''}",
+                        file=command_output,
+                    )
+                    show_event_output(debugger_state, "origin", command_output)
+                    end_origin_search(debugger_state)
+                dbg_quit(debugger_state, terminated=True)
+
+            case _:  # Default case if no other case is matched
+                # Consider logging this for debugging.
+                print(f"Unhandled message type: {body_json}")
+                pass
+
+
+def run_debugger(
+    debugger_state: DebuggerState,
+    cmd: list,
+    print_help: Callable,
+    timeout: float,
+    loop_thread: EventLoopThread | None = None,
+    record: str | None = None,
+    replay: str | None = None,
+    stats_json: str | None = None,
+) -> None:
+    # runs one cmake under the debugger until dbg_quit exits. With replay, a
+    # recorded session is played back in place of cmake. With stats_json,
+    # statistics are collected from the start and written there on the way out
+    start = time.perf_counter()
+    if replay is not None:
+        debugger_state.cmake_process_handle = launch_replay(
+            replay, debugger_state.host, stdout=sys.stdout
+        )
+    else:
+        # before launch_cmake adds the debugger options to cmd
+        debugger_state.source_dir = source_dir(cmd)
+        debugger_state.cmake_process_handle = launch_cmake(
+            cmd, debugger_state.host, print_help, stdout=sys.stdout
+        )
+    logger.info(debugger_state.cmake_process_handle)
+    logger.info(
+        f"startup: cmake launched in {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+    try:
+        s = connect_to_cmake(
+            debugger_state.host, debugger_state.cmake_process_handle, timeout
+        )
+    except (RuntimeError, TimeoutError) as e:
+        print(e)
+        debugger_state.cmake_process_handle.kill()
+        sys.exit(1)
+    try:
+        recorder = Recorder.open(record) if record is not None else None
+    except OSError as e:
+        print(f"Could not record the session: {e}")
+        debugger_state.cmake_process_handle.kill()
+        sys.exit(1)
+    with s:
+        # responses and events are read in the session's own thread, so cmake
+        # is never left waiting on us while the prompt is up
+        if stats_json is not None:
+            debugger_state.stats_enabled = True
+        session = debugger_state.session = SyncSession(
+            s,
+            loop_thread,
+            recorder=recorder,
+            metrics=debugger_state.metrics if debugger_state.stats_enabled else None,
+        )
+        try:
+            body_json = session.request(initialize)
+            debugger_state.capabilities = body_json.get("body") or {}
+            logger.info(
+                f"startup: debugger initialized {(time.perf_counter() - start) * 1000:.1f} ms after launch"
+            )
+
+            handle_events(debugger_state)
+        finally:
+            session.close()
+            if recorder is not None:
+                recorder.close()
+            if stats_json is not None:
+                write_stats(debugger_state.metrics, stats_json)
+
+
+def write_stats(metrics: Metrics, path: str) -> None:
+    try:
+        with open(path, "w") as f:
+            json.dump(metrics.to_dict(), f, indent=2)
+    except OSError as e:
+        print(f"Could not write the statistics: {e}")
+
+
 def main():
     debugger_state = DebuggerState()
-    # TODO: add argparsing to get the -v|--verbose flag
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "mode",
+        help="'debug' (the default) to debug cmake interactively or with a script, "
+        "'profile' to step through the whole configure and report where the time goes, "
+        "'serve' to run a debug session that clients connect to on --socket, and "
+        "'attach' for a prompt on such a session",
+        nargs="?",
+        choices=["debug", "profile", "serve", "attach"],
+        default="debug",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
-        help="increase output verbosity",
+        help="log every DAP message (-vv also logs their bodies, cut at 2 KB)",
+        action="count",
+        default=0,
+    )
+    parser.add_argument(
+        "--timeout",
+        help="seconds to wait for cmake to open the debugger pipe (default: 30)",
+        action="store",
+        type=float,
+        default=30.0,
+    )
+    parser.add_argument(
+        "--batch",
+        help="run the debugger commands in FILE without prompting, print the results as JSON lines and exit",
+        action="store",
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--commands",
+        help="like --batch, with the commands given as a ';' separated string",
+        action="store",
+        metavar="COMMANDS",
+    )
+    parser.add_argument(
+        "--nx",
+        help="do not read the .cmakedbgrc files",
         action="store_true",
         default=False,
     )
@@ -466,95 +1957,194 @@ def main():
         action="store",
         nargs="+",
         metavar=("cmake", "OPTIONS"),
-        required=True,
+    )
+    parser.add_argument(
+        "--configs",
+        help="run the --batch/--commands script against every cmake command line in FILE "
+        "(one per line) in parallel instead of --cmd, and report the commands whose "
+        "output differs between them",
+        action="store",
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="number of cmake configurations to run at once with --configs (default: all)",
+        action="store",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--record",
+        help="save every DAP message of the session, timestamped, to FILE",
+        action="store",
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--replay",
+        help="debug a session saved with --record instead of running cmake",
+        action="store",
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--stats-json",
+        help="collect the statistics of the stats command from the start and write "
+        "them as JSON to FILE at exit",
+        action="store",
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--socket",
+        help="Unix socket of a serve session (default for serve: session.sock in a "
+        "new private directory under the temporary directory, printed at startup)",
+        action="store",
+        metavar="PATH",
+    )
+    profile_options = parser.add_argument_group("profile mode")
+    profile_options.add_argument(
+        "--top",
+        help="rows in each table of the profile report (default: 20)",
+        action="store",
+        type=int,
+    )
+    profile_options.add_argument(
+        "--folded",
+        help="also write the profile as folded stacks (for flamegraph.pl or speedscope) to FILE",
+        action="store",
+        metavar="FILE",
+    )
+    profile_options.add_argument(
+        "--trace",
+        help="also write every command and call as a timed event to FILE, as it happens",
+        action="store",
+        metavar="FILE",
+    )
+    profile_options.add_argument(
+        "--trace-format",
+        help="chrome (Trace Event JSON for chrome://tracing or Perfetto, the default) "
+        "or speedscope",
+        action="store",
+        choices=["chrome", "speedscope"],
     )
     args = parser.parse_args()
-    if args.verbose:
+    # the profile options have no argparse defaults, so that giving them to
+    # another mode can be told apart from leaving them out
+    profile_args = [args.top, args.folded, args.trace, args.trace_format]
+    if args.mode != "profile" and profile_args.count(None) != len(profile_args):
+        parser.error(
+            "--top, --folded, --trace and --trace-format only work in profile mode"
+        )
+    if args.mode == "attach":
+        if args.socket is None:
+            parser.error("attach needs the --socket of the session")
+        from cmakedbg import client
+
+        sys.exit(client.run_client(args.socket))
+    if [args.cmd, args.configs, args.replay].count(None) != 2:
+        parser.error("exactly one of --cmd, --configs and --replay is required")
+    if args.configs is not None and args.batch is None and args.commands is None:
+        parser.error("--configs needs a script to run with --batch or --commands")
+    if args.mode == "profile" and (
+        args.cmd is None or args.batch is not None or args.commands is not None
+    ):
+        parser.error("profile needs --cmd, and takes no --batch/--commands script")
+    if args.mode == "serve" and (
+        args.configs is not None or args.batch is not None or args.commands is not None
+    ):
+        parser.error(
+            "serve takes its commands from the clients, not --configs/--batch/--commands"
+        )
+    if args.record is not None and (args.mode == "profile" or args.configs is not None):
+        parser.error("--record only works on a single debug session")
+    if args.stats_json is not None and (
+        args.mode == "profile" or args.configs is not None
+    ):
+        parser.error("--stats-json only works on a single debug session")
+    if args.verbose > 1:
+        loglevel = logging.DEBUG
+    elif args.verbose:
         loglevel = logging.INFO
     else:
         loglevel = logging.WARN
 
+    debugger_state.batch = args.batch is not None or args.commands is not None
+    if debugger_state.batch or args.mode == "profile":
+        # stdout is kept for the JSON lines, everything else (including cmake's
+        # own output) goes to stderr
+        debugger_state.json_output = sys.stdout
+        sys.stdout = sys.stderr
     logging.basicConfig(stream=sys.stdout, level=loglevel)
-    debugger_state.cmake_process_handle = launch_cmake(
-        args.cmd, debugger_state.host, parser.print_help
-    )
-    logger.info(debugger_state.cmake_process_handle)
-    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
-
-        s.connect(debugger_state.host)
+    if args.mode == "profile":
+        from cmakedbg import profile
+
+        sys.exit(
+            profile.run_profile(
+                args.cmd,
+                parser.print_help,
+                args.timeout,
+                profile.TOP_N if args.top is None else args.top,
+                args.folded,
+                debugger_state.json_output,
+                args.trace,
+                args.trace_format or "chrome",
+            )
+        )
+    try:
+        command_files = [] if args.nx else rc_files()
+        if args.batch is not None:
+            command_files.append(args.batch)
+        for command_file in command_files:
+            debugger_state.command_queue.extend(read_command_file(command_file))
+    except OSError as e:
+        print(f"Could not read commands: {e}")
+        sys.exit(1)
+    if args.commands is not None:
+        debugger_state.command_queue.extend(
+            command.split() for command in args.commands.split(";") if command.strip()
+        )
 
-        send_request(s, initialize)
+    if args.configs is not None:
+        # imported here since the driver itself is built on this module
+        from cmakedbg import multi
 
-        while True:
-            body_json, debugger_state.response = recv_response(
-                s, debugger_state.response
+        try:
+            configs = multi.read_configs(args.configs)
+        except OSError as e:
+            print(f"Could not read configurations: {e}")
+            sys.exit(1)
+        sys.exit(
+            multi.run_configs(
+                configs,
+                list(debugger_state.command_queue),
+                args.jobs,
+                args.timeout,
+                parser.print_help,
+                debugger_state.json_output,
             )
-            match body_json:
-                case {"type": "response", "command": "initialize"}:
-                    pass
-                case {"type": "event", "event": "initialized"}:
-                    request_func, args = process_user_input(debugger_state)
-                    send_request(s, request_func, *args)
-                case {"type": "response", "command": "setBreakpoints"}:
-                    request_func, args = process_user_input(debugger_state)
-                    send_request(s, request_func, *args)
-                case {"type": "response", "command": "configurationDone"}:
-                    debugger_state.already_running = True
-                case {"type": "event", "event": "stopped"}:
-                    send_request(s, stacktrace)
-                case {
-                    "type": "response",
-                    "command": "stackTrace",
-                    "body": {
-                        "stackFrames": [
-                            {
-                                "id": frame_id,
-                                "line": linenumber,
-                                "source": {"path": filepath},
-                            } as first_frame,
-                            *other_frames,
-                        ]
-                    },
-                }:
-                    send_request(s, scopes, frame_id)
-                    debugger_state.current_line = (filepath, linenumber)
-                    debugger_state.stacktrace = [first_frame, *other_frames]
-                case {
-                    "type": "response",
-                    "command": "scopes",
-                    "body": {"scopes": [{"variablesReference": var_ref}]},
-                }:
-                    send_request(s, variables, var_ref)
-                case {"type": "response", "command": "variables"}:
-                    for variable in body_json["body"]["variables"]:
-                        debugger_state.cmake_variables[variable["name"]] = variable[
-                            "value"
-                        ]
-                        if variable["name"] in [
-                            "CacheVariables",
-                            "Directories",
-                            "Locals",
-                        ]:
-                            debugger_state.top_level_vars = (
-                                debugger_state.top_level_vars + 1
-                            )
-                            send_request(s, variables, variable["variablesReference"])
-                    if debugger_state.top_level_vars > 0:
-                        debugger_state.top_level_vars = (
-                            debugger_state.top_level_vars - 1
-                        )
-                        continue
-
-                    request_func, args = process_user_input(debugger_state)
-                    send_request(s, request_func, *args)
-
-                case {"type": "event", "event": "terminated"}:
-                    dbg_quit(debugger_state)
-
-                case _:  # Default case if no other case is matched
-                    # Consider logging this for debugging.
-                    print(f"Unhandled message type: {body_json}")
-                    pass
+        )
+    if args.mode == "serve":
+        from cmakedbg import server
+
+        server.run_server(
+            debugger_state,
+            args.cmd,
+            args.socket,
+            parser.print_help,
+            args.timeout,
+            record=args.record,
+            replay=args.replay,
+            stats_json=args.stats_json,
+        )
+        return
+    run_debugger(
+        debugger_state,
+        args.cmd,
+        parser.print_help,
+        args.timeout,
+        record=args.record,
+        replay=args.replay,
+        stats_json=args.stats_json,
+    )
 
 
 if __name__ == "__main__":
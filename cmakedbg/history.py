@@ -0,0 +1,165 @@
+import bisect
+import time
+from array import array
+from dataclasses import dataclass
+
+# stops kept by default, about 22 MB of arrays once full
+DEFAULT_CAPACITY = 1_000_000
+
+
+@dataclass(slots=True)
+class Stop:
+    stop_id: int
+    path: str
+    line: int
+    depth: int
+    # seconds since the history started
+    elapsed: float
+
+    def __str__(self) -> str:
+        return f"{self.stop_id:>7} {self.elapsed:10.3f}s {self.depth:>5}  {self.path}:{self.line}"
+
+
+class StopHistory:
+    """Ring buffer of the last `capacity` stops of a session.
+
+    Every stop is a row of parallel arrays (stop number, file id, line,
+    stack depth, nanoseconds since the start), 22 bytes in all, and paths
+    are stored once in a file table. Once full, the oldest stop is
+    overwritten. Also kept, for all the stops ever recorded: the last visit
+    of every file:line, and for every variable the stops at which it was seen
+    to change, as far back as the ring goes, and its last change.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.files: list[str] = []
+        self._file_ids: dict[str, int] = {}
+        self._stop_ids = array("I")
+        self._file_column = array("I")
+        self._lines = array("I")
+        self._depths = array("H")
+        self._times = array("Q")
+        # total stops recorded; the newest is at (count - 1) % capacity
+        self.count = 0
+        self._start = time.monotonic_ns()
+        # (file id, line) -> (last stop there, visits)
+        self._visits: dict[tuple[int, int], tuple[int, int]] = {}
+        # name -> stops it changed at, oldest first, and its last change as
+        # (stop, old value, new value)
+        self._changed_at: dict[str, array] = {}
+        self._last_change: dict[str, tuple[int, str | None, str | None]] = {}
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def file_id(self, path: str) -> int:
+        file_id = self._file_ids.get(path)
+        if file_id is None:
+            file_id = self._file_ids[path] = len(self.files)
+            self.files.append(path)
+        return file_id
+
+    def record(self, stop_id: int, path: str, line: int, depth: int) -> None:
+        file_id = self.file_id(path)
+        elapsed = time.monotonic_ns() - self._start
+        depth = min(depth, 0xFFFF)
+        if self.count < self.capacity:
+            self._stop_ids.append(stop_id)
+            self._file_column.append(file_id)
+            self._lines.append(line)
+            self._depths.append(depth)
+            self._times.append(elapsed)
+        else:
+            i = self.count % self.capacity
+            self._stop_ids[i] = stop_id
+            self._file_column[i] = file_id
+            self._lines[i] = line
+            self._depths[i] = depth
+            self._times[i] = elapsed
+        self.count = self.count + 1
+        _, visits = self._visits.get((file_id, line), (0, 0))
+        self._visits[(file_id, line)] = (stop_id, visits + 1)
+
+    def record_changes(self, stop_id: int, changes: dict) -> None:
+        # changes as VariableHistory.record returns them, {name: (old, new)}
+        # seen at stop_id
+        for name, (old, new) in changes.items():
+            stops = self._changed_at.get(name)
+            if stops is None:
+                stops = self._changed_at[name] = array("I")
+            if not stops or stops[-1] != stop_id:
+                stops.append(stop_id)
+            if len(stops) > 2 * self.capacity and self.count:
+                # the stops the ring no longer has are dropped in bulk
+                del stops[: bisect.bisect_left(stops, self.oldest())]
+            self._last_change[name] = (stop_id, old, new)
+
+    def _index(self, age: int) -> int:
+        # position in the arrays of the stop `age` stops before the newest
+        return (self.count - 1 - age) % self.capacity
+
+    def _stop(self, i: int) -> Stop:
+        return Stop(
+            self._stop_ids[i],
+            self.files[self._file_column[i]],
+            self._lines[i],
+            self._depths[i],
+            self._times[i] / 1e9,
+        )
+
+    def oldest(self) -> int | None:
+        # stop number of the oldest stop still held
+        if self.count == 0:
+            return None
+        return self._stop_ids[self._index(len(self) - 1)]
+
+    def last(self, n: int) -> list[Stop]:
+        # the last n stops, oldest first
+        n = min(n, len(self))
+        return [self._stop(self._index(age)) for age in range(n - 1, -1, -1)]
+
+    def find(self, stop_id: int) -> Stop | None:
+        # stop numbers only grow along the ring, so this is a binary search
+        # over the ages
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._stop_ids[self._index(middle)] > stop_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self._stop_ids[self._index(low)] == stop_id:
+            return self._stop(self._index(low))
+        return None
+
+    def last_visit(self, path: str, line: int) -> tuple[int, int] | None:
+        # (last stop at path:line, visits) over the whole session
+        file_id = self._file_ids.get(path)
+        if file_id is None:
+            return None
+        return self._visits.get((file_id, line))
+
+    def last_change(self, name: str) -> tuple[int, str | None, str | None] | None:
+        return self._last_change.get(name)
+
+    def changed_at(self, name: str) -> list[int]:
+        # stops name changed at, as far back as the ring goes
+        stops = self._changed_at.get(name, array("I"))
+        oldest = self.oldest()
+        if oldest is None:
+            return []
+        return list(stops[bisect.bisect_left(stops, oldest) :])
+
+    def nbytes(self) -> int:
+        # memory held by the arrays of the ring
+        return sum(
+            column.itemsize * len(column)
+            for column in (
+                self._stop_ids,
+                self._file_column,
+                self._lines,
+                self._depths,
+                self._times,
+            )
+        )
@@ -0,0 +1,339 @@
+import concurrent.futures
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# bumped whenever what is stored per file changes, so old indexes are rebuilt
+INDEX_VERSION = 1
+# below this many files to scan a pool costs more to start than it saves
+POOL_THRESHOLD = 200
+# files handed to a worker at a time
+CHUNK_SIZE = 50
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# matches the start of a command invocation on a line of a listfile
+COMMAND_RE = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+# the tokens of the CMake language that matter for finding commands. Anything
+# else (whitespace, a stray quote) is skipped over
+TOKEN_RE = re.compile(
+    r"""
+    (?P<comment>\#\[(?P<comment_eq>=*)\[.*?\](?P=comment_eq)\]|\#[^\n]*)
+    |(?P<bracket>\[(?P<bracket_eq>=*)\[.*?\](?P=bracket_eq)\])
+    |(?P<quoted>"(?:\\.|[^"\\])*")
+    |(?P<open>\()
+    |(?P<close>\))
+    |(?P<word>[^\s()\#"]+)
+    """,
+    re.S | re.X,
+)
+
+
+def listfiles(root: str) -> list[str]:
+    paths = []
+    for directory, subdirectories, filenames in os.walk(root):
+        # build trees are full of generated .cmake files cmake does not run
+        subdirectories[:] = [
+            subdirectory
+            for subdirectory in subdirectories
+            if subdirectory != "CMakeFiles"
+        ]
+        for filename in filenames:
+            if filename == "CMakeLists.txt" or filename.endswith(".cmake"):
+                paths.append(os.path.join(directory, filename))
+    return sorted(paths)
+
+
+def default_index_path() -> str:
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache, "cmakedbg", "index.json")
+
+
+def module_dirs(cmake: str = "cmake") -> list[str]:
+    # cmake's own modules, next to the executable as PREFIX/share/cmake-X.Y
+    executable = shutil.which(cmake)
+    if executable is None:
+        return []
+    prefix = os.path.dirname(os.path.dirname(os.path.realpath(executable)))
+    return sorted(glob.glob(os.path.join(prefix, "share", "cmake-*", "Modules")))[-1:]
+
+
+def source_dir(cmd: list[str]) -> str:
+    # the source tree of a cmake command line: -S DIR, or else the first path
+    # argument, which for an existing build tree is where its cache points
+    args = cmd[1:]
+    path = None
+    for i, arg in enumerate(args):
+        if arg == "-S" and i + 1 < len(args):
+            path = args[i + 1]
+            break
+        if arg.startswith("-S") and len(arg) > 2:
+            path = arg[2:]
+            break
+    if path is None:
+        options_with_values = {
+            "-B",
+            "-C",
+            "-G",
+            "-T",
+            "-A",
+            "-D",
+            "-U",
+            "-P",
+            "--preset",
+        }
+        previous = ""
+        for arg in args:
+            if not arg.startswith("-") and previous not in options_with_values:
+                path = arg
+                break
+            previous = arg
+    path = os.path.abspath(os.path.expanduser(path or "."))
+    try:
+        with open(os.path.join(path, "CMakeCache.txt")) as f:
+            for line in f:
+                if line.startswith("CMAKE_HOME_DIRECTORY:"):
+                    return line.split("=", 1)[1].strip()
+    except OSError:
+        pass
+    return path
+
+
+def scan(text: str) -> tuple[list[list], dict[str, list[int]]]:
+    # the function()/macro() definitions of a listfile, as [kind, name, line,
+    # line of the first command of the body], and the lines every command is
+    # called on, by lowercase name. A command is at the line of its name
+    definitions: list[list] = []
+    calls: dict[str, list[int]] = {}
+    # definitions whose body has not started yet
+    waiting: list[list] = []
+    depth = 0
+    name = argument = None
+    name_start = 0
+    command = ""
+    linenum, counted = 1, 0
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        if depth == 0:
+            if kind == "word" and IDENTIFIER_RE.fullmatch(match.group()):
+                name, name_start = match.group(), match.start()
+            elif kind == "open" and name is not None:
+                linenum = linenum + text.count("\n", counted, name_start)
+                counted = name_start
+                command = name.lower()
+                calls.setdefault(command, []).append(linenum)
+                for definition in waiting:
+                    definition[3] = linenum
+                waiting.clear()
+                depth, name, argument = 1, None, None
+            else:
+                name = None
+        elif kind == "open":
+            depth = depth + 1
+        elif kind == "close":
+            depth = depth - 1
+            if depth == 0 and command in ("function", "macro") and argument:
+                definition = [command, argument, linenum, 0]
+                definitions.append(definition)
+                waiting.append(definition)
+        elif depth == 1 and argument is None:
+            argument = match.group().strip('"')
+    return definitions, calls
+
+
+def scan_file(path: str) -> dict | None:
+    try:
+        stat = os.stat(path)
+        with open(path, errors="replace") as f:
+            text = f.read()
+    except OSError:
+        return None
+    definitions, calls = scan(text)
+    return {
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "definitions": definitions,
+        "calls": calls,
+    }
+
+
+def scan_files(paths: list[str]) -> list[tuple[str, dict | None]]:
+    return [(path, scan_file(path)) for path in paths]
+
+
+def scan_all(
+    paths: list[str], jobs: int | None = None
+) -> Iterator[tuple[str, dict | None]]:
+    # in chunks over a pool of processes, since tokenizing is all Python
+    workers = jobs or os.cpu_count() or 1
+    if workers == 1 or len(paths) < POOL_THRESHOLD:
+        yield from scan_files(paths)
+        return
+    chunks = [paths[i : i + CHUNK_SIZE] for i in range(0, len(paths), CHUNK_SIZE)]
+    # spawned rather than forked: the debugger has its event loop thread
+    # running by now
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        for results in pool.map(scan_files, chunks):
+            yield from results
+
+
+@dataclass(slots=True)
+class Definition:
+    kind: str
+    name: str
+    path: str
+    line: int
+    # first command of the body, where a call to it is first stopped at
+    body_line: int
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.name} at {self.path}:{self.line}"
+
+
+class ListfileIndex:
+    """Functions, macros and command calls of every listfile under some roots.
+
+    update() walks the roots and tokenizes the files that are new or whose
+    mtime or size changed since they were last scanned, in a process pool when
+    there are many of them. The scanned files are kept in a JSON file (shared
+    by all projects, so every query is limited to the files under the roots
+    of the last update) and the next session only rescans what changed.
+    """
+
+    def __init__(self, path: str | None = None):
+        # where the index is saved, None to keep it in memory only
+        self.path = path
+        self.files: dict[str, dict] = {}
+        # the files under the roots, as of the last update
+        self.paths: list[str] = []
+        self._loaded = False
+
+    def load(self) -> None:
+        self._loaded = True
+        if self.path is None:
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(saved, dict) and saved.get("version") == INDEX_VERSION:
+            self.files = saved.get("files", {})
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # written aside and renamed, so a concurrent session never reads
+            # half an index
+            temporary = f"{self.path}.{os.getpid()}"
+            with open(temporary, "w") as f:
+                json.dump(
+                    {"version": INDEX_VERSION, "files": self.files},
+                    f,
+                    separators=(",", ":"),
+                )
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save the listfile index to {self.path}: {e}")
+
+    def update(self, roots: Iterable[str], jobs: int | None = None) -> int:
+        # returns the number of files (re)scanned
+        if not self._loaded:
+            self.load()
+        start = time.perf_counter()
+        roots = [os.path.abspath(root) for root in roots]
+        paths: set[str] = set()
+        for root in roots:
+            paths.update(listfiles(root))
+        stale = []
+        for path in sorted(paths):
+            entry = self.files.get(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if entry is None or (entry["mtime"], entry["size"]) != (
+                stat.st_mtime_ns,
+                stat.st_size,
+            ):
+                stale.append(path)
+        for path, entry in scan_all(stale, jobs):
+            if entry is None:
+                self.files.pop(path, None)
+            else:
+                self.files[path] = entry
+        # files under the roots that are gone
+        removed = [
+            path
+            for path in self.files
+            if path not in paths
+            and any(path.startswith(os.path.join(root, "")) for root in roots)
+        ]
+        for path in removed:
+            del self.files[path]
+        self.paths = sorted(path for path in paths if path in self.files)
+        if stale or removed:
+            self.save()
+        logger.info(
+            "indexed %d listfiles (%d scanned) in %.2f s",
+            len(self.paths),
+            len(stale),
+            time.perf_counter() - start,
+        )
+        return len(stale)
+
+    def definitions(self, name: str) -> list[Definition]:
+        # command names are case insensitive
+        name = name.lower()
+        return self._definitions(
+            lambda definition_name: definition_name.lower() == name
+        )
+
+    def functions(self, regex: re.Pattern | None = None) -> list[Definition]:
+        # every function and macro whose name matches regex, by name
+        if regex is None:
+            return self._definitions(lambda definition_name: True)
+        return self._definitions(
+            lambda definition_name: regex.search(definition_name) is not None
+        )
+
+    def _definitions(self, matches: Callable[[str], bool]) -> list[Definition]:
+        definitions = [
+            Definition(kind, name, path, line, body_line or line)
+            for path in self.paths
+            for kind, name, line, body_line in self.files[path]["definitions"]
+            if matches(name)
+        ]
+        return sorted(
+            definitions,
+            key=lambda definition: (
+                definition.name.lower(),
+                definition.path,
+                definition.line,
+            ),
+        )
+
+    def calls(self, name: str) -> dict[str, list[int]]:
+        # path -> lines of the calls to a command
+        name = name.lower()
+        calls = {}
+        for path in self.paths:
+            lines = self.files[path]["calls"].get(name)
+            if lines:
+                calls[path] = lines
+        return calls
@@ -0,0 +1,171 @@
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+# buckets per doubling of the value, so a percentile read off the histogram is
+# within 25% of the real one
+SUB_BUCKETS = 4
+
+
+def bucket_index(value: int) -> int:
+    # values below 2 * SUB_BUCKETS get a bucket each, after that every power
+    # of two is split into SUB_BUCKETS equal parts
+    if value < 2 * SUB_BUCKETS:
+        return max(value, 0)
+    shift = value.bit_length() - SUB_BUCKETS.bit_length()
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def bucket_bounds(index: int) -> tuple[int, int]:
+    # [low, high) of the values in bucket index
+    if index < 2 * SUB_BUCKETS:
+        return index, index + 1
+    shift = index // SUB_BUCKETS - 1
+    low = (index % SUB_BUCKETS + SUB_BUCKETS) << shift
+    return low, low + (1 << shift)
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers (nanoseconds, bytes).
+
+    Adding a value is a few integer operations and a dict update, and the
+    memory used only grows with the range of the values, not their number.
+    """
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.buckets: dict[int, int] = {}
+
+    def add(self, value: int) -> None:
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count = self.count + 1
+        self.total = self.total + value
+        index = bucket_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def percentile(self, fraction: float) -> float:
+        # the middle of the bucket the percentile falls in, kept within the
+        # smallest and largest values seen
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen = seen + self.buckets[index]
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return min(max((low + high - 1) / 2, self.min), self.max)
+        return float(self.max)
+
+    def to_dict(self, scale: float = 1.0) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count / scale if self.count else 0.0,
+            "min": self.min / scale,
+            "p50": self.percentile(0.5) / scale,
+            "p90": self.percentile(0.9) / scale,
+            "p99": self.percentile(0.99) / scale,
+            "max": self.max / scale,
+        }
+
+
+@dataclass(slots=True)
+class CommandStats:
+    # requests sent, and responses (or events) received
+    sent: int = 0
+    received: int = 0
+    failed: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    # request sent to response decoded
+    round_trip_ns: Histogram = field(default_factory=Histogram)
+    decode_ns: Histogram = field(default_factory=Histogram)
+    size: Histogram = field(default_factory=Histogram)
+
+
+class Metrics:
+    """Counters and histograms per DAP command, and per event as "event NAME".
+
+    Sizes are of the JSON bodies, without the Content-Length header.
+
+    A DAPSession only records into a Metrics it has been given, so with none
+    the cost is one attribute check per message.
+    """
+
+    def __init__(self):
+        self.commands: dict[str, CommandStats] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.commands)
+
+    def _stats(self, name: str) -> CommandStats:
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        return stats
+
+    def sent(self, command: str, size: int) -> None:
+        stats = self._stats(command)
+        stats.sent = stats.sent + 1
+        stats.bytes_sent = stats.bytes_sent + size
+
+    def received(
+        self,
+        name: str,
+        size: int,
+        decode_ns: int,
+        round_trip_ns: int | None = None,
+        success: bool = True,
+    ) -> None:
+        stats = self._stats(name)
+        stats.received = stats.received + 1
+        stats.bytes_received = stats.bytes_received + size
+        stats.size.add(size)
+        stats.decode_ns.add(decode_ns)
+        if round_trip_ns is not None:
+            stats.round_trip_ns.add(round_trip_ns)
+        if not success:
+            stats.failed = stats.failed + 1
+
+    def reset(self) -> None:
+        self.commands.clear()
+
+    def to_dict(self) -> dict:
+        return {
+            name: {
+                "sent": stats.sent,
+                "received": stats.received,
+                "failed": stats.failed,
+                "bytes_sent": stats.bytes_sent,
+                "bytes_received": stats.bytes_received,
+                "round_trip_ms": stats.round_trip_ns.to_dict(1e6),
+                "decode_ms": stats.decode_ns.to_dict(1e6),
+                "size_bytes": stats.size.to_dict(),
+            }
+            for name, stats in sorted(self.commands.items())
+        }
+
+    def report(self) -> Iterator[str]:
+        yield (
+            f"{'command':<22} {'count':>6} {'failed':>6} {'sent KB':>9} {'recv KB':>9} "
+            f"{'rtt p50':>8} {'rtt p99':>8} {'rtt max':>8} {'decode p50':>10} {'decode max':>10}\n"
+        )
+        # a copy, as the session's thread may add a command in the meantime
+        for name, stats in sorted(dict(self.commands).items()):
+            rtt = stats.round_trip_ns
+            decode = stats.decode_ns
+            yield (
+                f"{name:<22} {max(stats.sent, stats.received):6} {stats.failed:6} "
+                f"{stats.bytes_sent / 1024:9.1f} {stats.bytes_received / 1024:9.1f} "
+                f"{rtt.percentile(0.5) / 1e6:8.2f} {rtt.percentile(0.99) / 1e6:8.2f} "
+                f"{rtt.max / 1e6:8.2f} {decode.percentile(0.5) / 1e6:10.3f} "
+                f"{decode.max / 1e6:10.3f}\n"
+            )
+        yield "(times in ms)\n"
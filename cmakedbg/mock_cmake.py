@@ -0,0 +1,352 @@
+import json
+import logging
+import os
+import socket
+import threading
+
+from cmakedbg.indexer import COMMAND_RE
+from cmakedbg.profile import Frame
+from cmakedbg.transport import FrameDecoder, read_frame
+
+logger = logging.getLogger(__name__)
+
+THREAD_ID = 1
+
+
+def frame(message: dict) -> bytes:
+    body = json.dumps(message).encode()
+    return f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+def synthetic_program(
+    lines: int,
+    path: str = "/mock/CMakeLists.txt",
+    call_every: int = 4,
+) -> list[tuple[Frame, ...]]:
+    # `lines` lines of `path`, every call_every-th of them a call to a
+    # function whose body (one command) is in another file. The call is a
+    # step of its own, like in cmake, before the one into the body
+    functions_path = os.path.join(os.path.dirname(path), "functions.cmake")
+    program: list[tuple[Frame, ...]] = []
+    for i in range(lines):
+        if call_every and i % call_every == call_every - 1:
+            call = ("my_function", path, i + 1)
+            program.append((call,))
+            program.append((call, ("set", functions_path, 2)))
+        else:
+            program.append((("set", path, i + 1),))
+    return program
+
+
+def program_from_listfile(path: str) -> list[tuple[Frame, ...]]:
+    # one step per command in the file, without going into add_subdirectory
+    # or include
+    program: list[tuple[Frame, ...]] = []
+    with open(path) as f:
+        for linenum, line in enumerate(f, 1):
+            match = COMMAND_RE.match(line)
+            if match is not None:
+                program.append(((match.group(1), path, linenum),))
+    return program
+
+
+def synthetic_cache(entries: int) -> dict[str, str]:
+    return {
+        f"PROJECT_CACHE_VARIABLE_{i}": f"/opt/toolchains/lib/cmake/pkg_{i}"
+        for i in range(entries)
+    }
+
+
+class MockCMake:
+    """A stand-in for cmake --debugger, for tests and benchmarks.
+
+    Implements the part of DAP cmake does (initialize, setBreakpoints,
+    configurationDone, pause, stackTrace, scopes, variables, next, stepIn,
+    stepOut, continue and disconnect, plus the thread, breakpoint, stopped,
+    terminated and exited events) over a "program": the stack, root frame
+    first, at every step of a configure. Variables are laid out like cmake's,
+    a Locals scope holding the CacheVariables, Directories and Locals
+    containers. With changes_every=N, every Nth cache entry has a different
+    value at every stop, so there is something for the history to record.
+    effects maps FILE, LINE to the local variables the command there sets
+    each time it runs.
+    """
+
+    def __init__(
+        self,
+        program: list[tuple[Frame, ...]],
+        cache: dict[str, str] | None = None,
+        local_variables: dict[str, str] | None = None,
+        changes_every: int = 0,
+        capabilities: dict | None = None,
+        effects: dict[tuple[str, int], dict[str, str]] | None = None,
+    ):
+        self.program = program
+        self.cache = cache if cache is not None else {}
+        self.local_variables = (
+            dict(local_variables) if local_variables is not None else {}
+        )
+        self.changes_every = changes_every
+        self.effects = effects if effects is not None else {}
+        self.capabilities = (
+            capabilities
+            if capabilities is not None
+            else {"supportsConfigurationDoneRequest": True}
+        )
+        self.requests: list[dict] = []
+        self.stops = 0
+        self._cache_entries = [
+            {"name": name, "value": value, "type": "STRING", "variablesReference": 0}
+            for name, value in self.cache.items()
+        ]
+        # path -> line -> breakpoint id
+        self._breakpoints: dict[str, dict[int, int]] = {}
+        self._breakpoint_ids = 0
+        self._seq = 0
+        self._step = 0
+        self._pause = False
+        self._finished = False
+        self._sock: socket.socket | None = None
+
+    def start(self, sock: socket.socket) -> threading.Thread:
+        thread = threading.Thread(target=self.serve, args=(sock,), daemon=True)
+        thread.start()
+        return thread
+
+    def listen(self, pipe_host: str) -> threading.Thread:
+        # serves one debugger on a Unix socket, like cmake --debugger-pipe
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(pipe_host)
+        listener.listen(1)
+
+        def accept_and_serve():
+            with listener:
+                conn, _ = listener.accept()
+            with conn:
+                self.serve(conn)
+
+        thread = threading.Thread(target=accept_and_serve, daemon=True)
+        thread.start()
+        return thread
+
+    def serve(self, sock: socket.socket) -> None:
+        self._sock = sock
+        decoder = FrameDecoder()
+        while True:
+            try:
+                request = json.loads(read_frame(sock, decoder).tobytes())
+            except (ConnectionError, OSError):
+                return
+            self.requests.append(request)
+            try:
+                self.handle(request)
+            except OSError:
+                return
+            if request["command"] == "disconnect":
+                return
+
+    def send(self, message: dict) -> None:
+        if self._sock is None:
+            raise ConnectionError("No debugger is connected yet")
+        self._seq = self._seq + 1
+        self._sock.sendall(frame({"seq": self._seq, **message}))
+
+    def event(self, event: str, body: dict | None = None) -> None:
+        self.send({"type": "event", "event": event, "body": body or {}})
+
+    def respond(
+        self, request: dict, body: dict | None = None, message: str | None = None
+    ) -> None:
+        response = {
+            "type": "response",
+            "request_seq": request["seq"],
+            "command": request["command"],
+            "success": message is None,
+            "body": body or {},
+        }
+        if message is not None:
+            response["message"] = message
+        self.send(response)
+
+    def handle(self, request: dict) -> None:
+        arguments = request.get("arguments", {})
+        match request["command"]:
+            case "initialize":
+                self.respond(request, self.capabilities)
+                self.event("initialized")
+            case "setBreakpoints":
+                self.respond(request, {"breakpoints": self.set_breakpoints(arguments)})
+            case "pause":
+                self._pause = True
+                self.respond(request)
+            case "configurationDone":
+                self.respond(request)
+                self.event("thread", {"reason": "started", "threadId": THREAD_ID})
+                for path, lines in self._breakpoints.items():
+                    for line, breakpoint_id in lines.items():
+                        self.event(
+                            "breakpoint",
+                            {
+                                "reason": "changed",
+                                "breakpoint": {
+                                    "id": breakpoint_id,
+                                    "line": line,
+                                    "verified": True,
+                                },
+                            },
+                        )
+                self.run("continue", first=True)
+            case "stackTrace":
+                self.respond(request, {"stackFrames": self.stack_frames()})
+            case "scopes":
+                base = arguments["frameId"] * 4
+                self.respond(
+                    request,
+                    {"scopes": [{"name": "Locals", "variablesReference": base}]},
+                )
+            case "variables":
+                self.respond(
+                    request,
+                    {"variables": self.variables(arguments["variablesReference"])},
+                )
+            case "next" | "stepIn" | "stepOut" | "continue":
+                if self._finished:
+                    self.respond(request, message="cmake is not running")
+                else:
+                    self.respond(request)
+                    self.run(request["command"])
+            case "disconnect":
+                self.respond(request)
+            case _:
+                self.respond(
+                    request, message=f"unsupported command {request['command']}"
+                )
+
+    def set_breakpoints(self, arguments: dict) -> list[dict]:
+        path = arguments["source"]["path"]
+        lines = {
+            frame[2] for stack in self.program for frame in stack if frame[1] == path
+        }
+        self._breakpoints[path] = {}
+        breakpoints = []
+        for breakpoint in arguments.get("breakpoints", []):
+            self._breakpoint_ids = self._breakpoint_ids + 1
+            verified = breakpoint["line"] in lines
+            if verified:
+                self._breakpoints[path][breakpoint["line"]] = self._breakpoint_ids
+            breakpoints.append(
+                {
+                    "id": self._breakpoint_ids,
+                    "line": breakpoint["line"],
+                    "verified": verified,
+                }
+            )
+        return breakpoints
+
+    def breakpoint_at(self, step: int) -> int | None:
+        _, path, line = self.program[step][-1]
+        return self._breakpoints.get(path, {}).get(line)
+
+    def run(self, command: str, first: bool = False) -> None:
+        # moves on from the current step (or, at the start, from before the
+        # first one) until a stop, or to the end of the configure
+        depth = len(self.program[self._step]) if self.program else 0
+        step = self._step if first else self._step + 1
+        if not first:
+            self.execute(self._step)
+        while step < len(self.program):
+            breakpoint_id = self.breakpoint_at(step)
+            reason = None
+            if first and self._pause:
+                reason = "pause"
+            elif breakpoint_id is not None:
+                reason = "breakpoint"
+            elif (
+                command == "stepIn"
+                or (command == "next" and len(self.program[step]) <= depth)
+                or (command == "stepOut" and len(self.program[step]) < depth)
+            ):
+                reason = "step"
+            if reason is not None:
+                self._step = step
+                self.stops = self.stops + 1
+                body = {
+                    "reason": reason,
+                    "threadId": THREAD_ID,
+                    "allThreadsStopped": True,
+                }
+                if reason == "breakpoint":
+                    body["hitBreakpointIds"] = [breakpoint_id]
+                self.event("stopped", body)
+                return
+            self.execute(step)
+            step = step + 1
+        self._finished = True
+        self.event("terminated")
+        self.event("exited", {"exitCode": 0})
+
+    def execute(self, step: int) -> None:
+        _, path, line = self.program[step][-1]
+        self.local_variables.update(self.effects.get((path, line), {}))
+
+    def stack_frames(self) -> list[dict]:
+        # innermost first, frame ids counting from 1 at the innermost
+        stack = self.program[self._step]
+        return [
+            {
+                "id": frame_id,
+                "name": name,
+                "line": line,
+                "column": 1,
+                "source": {"name": os.path.basename(path), "path": path},
+            }
+            for frame_id, (name, path, line) in enumerate(reversed(stack), 1)
+        ]
+
+    def variables(self, reference: int) -> list[dict]:
+        frame_id, container = divmod(reference, 4)
+        stack = self.program[self._step]
+        name, path, line = stack[len(stack) - frame_id]
+        match container:
+            case 0:
+                return [
+                    {
+                        "name": "CacheVariables",
+                        "value": "",
+                        "variablesReference": reference + 1,
+                    },
+                    {
+                        "name": "Directories",
+                        "value": "",
+                        "variablesReference": reference + 2,
+                    },
+                    {
+                        "name": "Locals",
+                        "value": "",
+                        "variablesReference": reference + 3,
+                    },
+                ]
+            case 1:
+                return self.cache_variables()
+            case 2:
+                values = {
+                    "CMAKE_CURRENT_SOURCE_DIR": os.path.dirname(path),
+                    "CMAKE_CURRENT_LIST_FILE": path,
+                }
+            case _:
+                values = {"CMAKE_CURRENT_LIST_LINE": str(line), **self.local_variables}
+        return [
+            {"name": variable, "value": value, "variablesReference": 0}
+            for variable, value in values.items()
+        ]
+
+    def cache_variables(self) -> list[dict]:
+        if not self.changes_every:
+            return self._cache_entries
+        entries = list(self._cache_entries)
+        for i in range(0, len(entries), self.changes_every):
+            entries[i] = {
+                **entries[i],
+                "value": f"{entries[i]['value']};stop{self.stops}",
+            }
+        return entries
@@ -0,0 +1,124 @@
+import concurrent.futures
+import io
+import json
+import shlex
+import sys
+from collections.abc import Callable
+from typing import IO
+
+from cmakedbg import debugger
+from cmakedbg.session import EventLoopThread
+
+
+def read_configs(path: str) -> list[list[str]]:
+    # one cmake command line per line, e.g.
+    #   cmake -S . -B build-gcc -DCMAKE_CXX_COMPILER=g++
+    configs = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line != "" and not line.startswith("#"):
+                configs.append(shlex.split(line))
+    return configs
+
+
+def run_config(
+    cmd: list[str],
+    commands: list[list[str]],
+    timeout: float,
+    print_help: Callable,
+    loop_thread: EventLoopThread,
+) -> tuple[int, list[dict]]:
+    json_output = io.StringIO()
+    debugger_state = debugger.DebuggerState(batch=True, json_output=json_output)
+    debugger_state.command_queue.extend(list(command) for command in commands)
+    try:
+        debugger.run_debugger(
+            debugger_state, list(cmd), print_help, timeout, loop_thread
+        )
+    except SystemExit as e:
+        # a debugger session always ends in dbg_quit's sys.exit
+        status = e.code if isinstance(e.code, int) else 1
+    else:
+        status = 1
+    records = [json.loads(line) for line in json_output.getvalue().splitlines()]
+    return status, records
+
+
+def find_divergences(results: list[list[dict]]) -> list[dict]:
+    # the same script runs everywhere, so the n-th command of every
+    # configuration is the same command; report the ones whose output differs
+    outputs: dict[tuple[int, str], dict[str, list[int]]] = {}
+    for config, records in enumerate(results):
+        commands = [record for record in records if "command" in record]
+        for index, record in enumerate(commands):
+            values = outputs.setdefault((index, record["command"]), {})
+            values.setdefault(record["output"], []).append(config)
+    divergences = []
+    for (index, command), values in sorted(outputs.items()):
+        configs_seen = sum(len(configs) for configs in values.values())
+        if len(values) > 1 or configs_seen < len(results):
+            divergences.append(
+                {
+                    "event": "divergence",
+                    "index": index,
+                    "command": command,
+                    "outputs": [
+                        {"output": output, "configs": configs}
+                        for output, configs in values.items()
+                    ],
+                    "missing": [
+                        config
+                        for config in range(len(results))
+                        if not any(config in configs for configs in values.values())
+                    ],
+                }
+            )
+    return divergences
+
+
+def run_configs(
+    configs: list[list[str]],
+    commands: list[list[str]],
+    jobs: int | None,
+    timeout: float,
+    print_help: Callable,
+    output: IO[str] | None = None,
+) -> int:
+    # every cmake gets its own debugger session and thread to run the script
+    # in, and all the sessions share one event loop for their sockets
+    if output is None:
+        output = sys.stdout
+    loop_thread = EventLoopThread()
+    results: list[list[dict]] = [[] for _ in configs]
+    statuses = [0 for _ in configs]
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=jobs or len(configs)
+    ) as pool:
+        futures = {
+            pool.submit(run_config, cmd, commands, timeout, print_help, loop_thread): i
+            for i, cmd in enumerate(configs)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            config = futures[future]
+            statuses[config], results[config] = future.result()
+            for record in results[config]:
+                print(json.dumps({"config": config, **record}), file=output, flush=True)
+    loop_thread.stop()
+
+    for divergence in find_divergences(results):
+        print(json.dumps(divergence), file=output)
+    print(
+        json.dumps(
+            {
+                "event": "summary",
+                "configs": [
+                    {"config": i, "cmd": " ".join(cmd), "status": statuses[i]}
+                    for i, cmd in enumerate(configs)
+                ],
+            }
+        ),
+        file=output,
+        flush=True,
+    )
+    return max(statuses, default=0)
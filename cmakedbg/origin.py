@@ -0,0 +1,88 @@
+import re
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from cmakedbg.indexer import COMMAND_RE
+
+
+def mention_re(varname: str) -> re.Pattern:
+    # varname as a whole word, but not where it is only read with ${VAR}
+    return re.compile(rf"(?<![\w{{]){re.escape(varname)}(?!\w)")
+
+
+def candidate_lines(paths: Iterable[str], varname: str) -> dict[str, set[int]]:
+    # path -> the lines of the commands that mention varname outside of a
+    # ${} reference: set(), list(APPEND), string(APPEND) and the like, along
+    # with some that only test it (if(VAR ...)). A command spread over several
+    # lines is counted at its first line, where cmake stops for it
+    mention = mention_re(varname)
+    candidates: dict[str, set[int]] = {}
+    for path in paths:
+        command_line = 0
+        try:
+            with open(path, errors="replace") as f:
+                for linenum, line in enumerate(f, 1):
+                    if COMMAND_RE.match(line):
+                        command_line = linenum
+                    code = line.split("#", 1)[0]
+                    if command_line and mention.search(code):
+                        candidates.setdefault(path, set()).add(command_line)
+        except OSError:
+            continue
+    return candidates
+
+
+@dataclass
+class OriginSearch:
+    """State of a find-origin run, from one stop to the next.
+
+    Without a value the search is for the first change of the variable from
+    its value when the search started, with one for the first value that
+    contains it. At every stop the variable is looked up and compared. In
+    the default, coarse mode cmake only stops at the candidate lines, and
+    each of them is stepped over, so a change is pinned to the line that
+    made it. A change somewhere else (in a module of cmake's own, say) is
+    only narrowed down to the stretch between two stops. In fine mode every
+    command is stepped into.
+    """
+
+    varname: str
+    value: str | None
+    start_value: str | None
+    candidates: dict[str, set[int]] = field(default_factory=dict)
+    fine: bool = False
+    # value, location and stack at the last check
+    last_value: str | None = None
+    last_location: tuple[str, int] = ("", 0)
+    last_stack: list = field(default_factory=list)
+    # whether the last move was a single step, so that a change seen at the
+    # stop after it was made by the command at last_location
+    stepped: bool = False
+    # variablesReference of the container the variable was found in last,
+    # tried first at the next stop
+    reference: int | None = None
+    stops: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    def __post_init__(self):
+        self.last_value = self.start_value
+
+    def found(self, value: str | None) -> bool:
+        if self.value is None:
+            return value != self.start_value
+        return value is not None and self.value in value
+
+    def is_candidate(self, filepath: str, linenum: int) -> bool:
+        return linenum in self.candidates.get(filepath, ())
+
+    def candidate_count(self) -> int:
+        return sum(len(lines) for lines in self.candidates.values())
+
+    def describe(self) -> str:
+        if self.value is None:
+            return f"{self.varname} changed"
+        return f"{self.varname} got {self.value!r}"
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
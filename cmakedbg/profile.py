@@ -0,0 +1,216 @@
+import logging
+import sys
+import time
+from collections.abc import Callable
+from typing import IO, Any
+
+from cmakedbg import debugger
+from cmakedbg.session import SyncSession
+
+logger = logging.getLogger(__name__)
+
+# rows in each table of the report
+TOP_N = 20
+
+# (name, file, line) of a stack frame
+Frame = tuple[str, str, int]
+
+
+class Profile:
+    """Self and inclusive time per file, line and function from a series of
+    timestamped stacks (root frame first), one per step.
+
+    The time from one sample to the next is charged to the first: self time to
+    the file, line and command of its top frame, inclusive time once to every
+    file, line and function on its stack. Every table entry is
+    [self ns, inclusive ns, steps], steps counting the samples it was on top.
+    """
+
+    def __init__(self):
+        self.files: dict[str, list[int]] = {}
+        self.lines: dict[tuple[str, int], list[int]] = {}
+        self.functions: dict[str, list[int]] = {}
+        self.stacks: dict[tuple[Frame, ...], int] = {}
+        self.steps = 0
+        self.total_ns = 0
+        self._last: tuple[int, tuple[Frame, ...]] | None = None
+
+    def sample(self, timestamp_ns: int, stack: tuple[Frame, ...]) -> None:
+        if self._last is not None:
+            last_timestamp, last_stack = self._last
+            self._charge(last_stack, timestamp_ns - last_timestamp)
+        self._last = (timestamp_ns, stack)
+
+    def finish(self, timestamp_ns: int) -> None:
+        if self._last is not None:
+            last_timestamp, last_stack = self._last
+            self._charge(last_stack, timestamp_ns - last_timestamp)
+            self._last = None
+
+    def _charge(self, stack: tuple[Frame, ...], elapsed: int) -> None:
+        self.steps = self.steps + 1
+        self.total_ns = self.total_ns + elapsed
+        self.stacks[stack] = self.stacks.get(stack, 0) + elapsed
+        if not stack:
+            return
+        name, path, line = stack[-1]
+        tables: tuple[tuple[dict[Any, list[int]], Any, set[Any]], ...] = (
+            (self.files, path, {frame[1] for frame in stack}),
+            (self.lines, (path, line), {(frame[1], frame[2]) for frame in stack}),
+            (self.functions, name, {frame[0] for frame in stack}),
+        )
+        for table, top, keys in tables:
+            for key in keys:
+                entry = table.get(key)
+                if entry is None:
+                    entry = table[key] = [0, 0, 0]
+                entry[1] = entry[1] + elapsed
+            entry = table[top]
+            entry[0] = entry[0] + elapsed
+            entry[2] = entry[2] + 1
+
+
+def stack_from_frames(stack_frames: list[dict]) -> tuple[Frame, ...]:
+    # DAP lists the innermost frame first
+    return tuple(
+        (
+            frame.get("name", "?"),
+            frame.get("source", {}).get("path", "?"),
+            frame.get("line", 0),
+        )
+        for frame in reversed(stack_frames)
+    )
+
+
+def print_table(
+    title: str, table: dict, key_format: Callable, top: int, output
+) -> None:
+    print(f"\n{title}", file=output)
+    print(f"{'self ms':>10} {'incl ms':>10} {'steps':>8}  name", file=output)
+    rows = sorted(table.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for key, (self_ns, inclusive_ns, steps) in rows:
+        print(
+            f"{self_ns / 1e6:10.1f} {inclusive_ns / 1e6:10.1f} {steps:8}  {key_format(key)}",
+            file=output,
+        )
+
+
+def print_report(
+    profile: Profile, top: int = TOP_N, output: IO[str] | None = None
+) -> None:
+    if output is None:
+        output = sys.stdout
+    print(
+        f"Profiled {profile.steps} steps, {profile.total_ns / 1e9:.3f} s "
+        "(times include the debugger's own overhead of a round trip per step)",
+        file=output,
+    )
+    print_table(f"Top {top} files by self time", profile.files, str, top, output)
+    print_table(
+        f"Top {top} lines by self time",
+        profile.lines,
+        lambda key: f"{key[0]}:{key[1]}",
+        top,
+        output,
+    )
+    print_table(
+        f"Top {top} commands and functions by self time",
+        profile.functions,
+        str,
+        top,
+        output,
+    )
+
+
+def write_folded(profile: Profile, output: IO[str]) -> None:
+    # one "frame;frame;...;frame microseconds" line per distinct stack, the
+    # input format of flamegraph.pl and speedscope
+    for stack, elapsed in profile.stacks.items():
+        microseconds = elapsed // 1000
+        if microseconds > 0:
+            labels = ";".join(
+                f"{name} ({path}:{line})".replace(";", ":")
+                for name, path, line in stack
+            )
+            print(f"{labels} {microseconds}", file=output)
+
+
+def profile_cmake(
+    cmd: list,
+    print_help: Callable,
+    timeout: float,
+    recorders: list,
+) -> int:
+    # steps through the whole configure and hands the stack at every stop to
+    # each recorder's sample(). No variables are fetched, each step is just a
+    # stackTrace and a stepIn
+    host = debugger.pipe_name()
+    cmake_process = debugger.launch_cmake(cmd, host, print_help, stdout=sys.stdout)
+    try:
+        s = debugger.connect_to_cmake(host, cmake_process, timeout)
+    except (RuntimeError, TimeoutError) as e:
+        print(e)
+        cmake_process.kill()
+        return 1
+    with s:
+        session = SyncSession(s)
+        try:
+            session.request(debugger.initialize)
+            while True:
+                body_json = session.next_event()
+                match body_json:
+                    case {"type": "event", "event": "initialized"}:
+                        # pausing before configurationDone stops at the very
+                        # first command
+                        session.request(debugger.pause)
+                        session.request(debugger.configuration_done)
+                    case {"type": "event", "event": "stopped"}:
+                        timestamp = time.perf_counter_ns()
+                        # cmake answers in order, so the stack is taken before
+                        # the step even though both are sent at once
+                        body_json, _ = session.request_many(
+                            [(debugger.stacktrace,), (debugger.step_into,)]
+                        )
+                        stack = stack_from_frames(
+                            body_json.get("body", {}).get("stackFrames", [])
+                        )
+                        for recorder in recorders:
+                            recorder.sample(timestamp, stack)
+                    case {"type": "event", "event": "terminated" | "exited"}:
+                        break
+        except ConnectionError:
+            logger.info("cmake closed the debugger connection")
+        finally:
+            timestamp = time.perf_counter_ns()
+            for recorder in recorders:
+                recorder.finish(timestamp)
+            session.close()
+    return cmake_process.wait()
+
+
+def run_profile(
+    cmd: list,
+    print_help: Callable,
+    timeout: float,
+    top: int = TOP_N,
+    folded: str | None = None,
+    output: IO[str] | None = None,
+    trace: str | None = None,
+    trace_format: str = "chrome",
+) -> int:
+    profile = Profile()
+    if trace is None:
+        returncode = profile_cmake(cmd, print_help, timeout, [profile])
+    else:
+        # imported here since the writers use this module's Frame
+        from cmakedbg.trace import trace_writer
+
+        with open(trace, "w") as f:
+            returncode = profile_cmake(
+                cmd, print_help, timeout, [profile, trace_writer(trace_format, f)]
+            )
+    print_report(profile, top, output)
+    if folded is not None:
+        with open(folded, "w") as f:
+            write_folded(profile, f)
+    return returncode
@@ -0,0 +1,210 @@
+import io
+import json
+import logging
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from collections.abc import Iterator
+
+from cmakedbg.codec import STDLIB_CODEC
+from cmakedbg.transport import FrameDecoder, read_frame
+
+logger = logging.getLogger(__name__)
+
+# A recording is this line followed by one record per DAP message: a header
+# of the direction, the nanoseconds since the recording started and the body
+# length, then the JSON body exactly as it went over the wire. Records are
+# only ever appended, so a recording cut short by a crash is still readable
+# up to its last whole record
+MAGIC = b"CMAKEDBG-DAP 1\n"
+RECORD_HEADER = struct.Struct("<cQI")
+SENT = b">"
+RECEIVED = b"<"
+# requests after which cmake runs on. The replay cannot know where one the
+# recording did not make would stop, so it ends there instead
+RESUME_COMMANDS = {"configurationDone", "continue", "next", "stepIn", "stepOut"}
+
+
+class Recorder:
+    """Appends every DAP message of a session to a recording file."""
+
+    def __init__(self, output: io.BufferedIOBase):
+        self.output = output
+        self._start = time.perf_counter_ns()
+        self.output.write(MAGIC)
+
+    @classmethod
+    def open(cls, path: str) -> "Recorder":
+        return cls(open(path, "wb"))
+
+    def record(self, direction: bytes, body: bytes | memoryview) -> None:
+        self.output.write(
+            RECORD_HEADER.pack(
+                direction, time.perf_counter_ns() - self._start, len(body)
+            )
+        )
+        self.output.write(body)
+        # flushed every time, so the recording is complete up to the last
+        # message even if the debugger is killed
+        self.output.flush()
+
+    def close(self) -> None:
+        self.output.close()
+
+
+def read_recording(path: str) -> Iterator[tuple[bytes, int, bytes]]:
+    # (direction, timestamp ns, body) for every whole record in the file
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a cmakedbg recording")
+        while len(header := f.read(RECORD_HEADER.size)) == RECORD_HEADER.size:
+            direction, timestamp, size = RECORD_HEADER.unpack(header)
+            body = f.read(size)
+            if len(body) < size:
+                logger.warning(f"{path} ends in the middle of a record")
+                return
+            yield direction, timestamp, body
+
+
+def frame(message: dict) -> bytes:
+    body = STDLIB_CODEC.encode(message)
+    return f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+class ReplayServer:
+    """Plays the cmake side of a recording back to a debugger.
+
+    Walks the recording in order: every message cmake sent is sent again as
+    soon as the requests recorded before it have come in. A request that
+    matches the next recorded one (same command and arguments) moves the
+    replay along. Any other request is answered with the response to the same
+    request made at the same stop, when there was one, and fails otherwise;
+    either way the replay stays where it was. A step or continue that was not
+    recorded there ends the replay with a terminated event. Responses carry
+    the seq of the live request they answer.
+    """
+
+    def __init__(self, messages: list[tuple[bytes, dict]]):
+        self.messages = messages
+        self._pos = 0
+        # where the messages after the last stopped event start
+        self._stop_start = 0
+        # recorded request seq -> live request seq
+        self._seqs: dict[int, int] = {}
+        self._seq = 0
+        # set once a resume request goes somewhere the recording did not
+        self.off_script = False
+
+    @classmethod
+    def from_recording(cls, path: str) -> "ReplayServer":
+        return cls(
+            [
+                (direction, json.loads(body))
+                for direction, _, body in read_recording(path)
+            ]
+        )
+
+    def serve(self, sock: socket.socket) -> None:
+        decoder = FrameDecoder()
+        while True:
+            for message in self.replies():
+                sock.sendall(frame(message))
+            if self._pos == len(self.messages):
+                # all played back; exit the way cmake does after terminating
+                return
+            try:
+                request = json.loads(read_frame(sock, decoder).tobytes())
+            except ConnectionError:
+                return
+            for message in self.handle(request):
+                sock.sendall(frame(message))
+            if self.off_script:
+                return
+
+    def replies(self) -> Iterator[dict]:
+        # the recorded messages from cmake up to the next recorded request
+        while (
+            self._pos < len(self.messages) and self.messages[self._pos][0] == RECEIVED
+        ):
+            message = dict(self.messages[self._pos][1])
+            if message.get("type") == "event" and message.get("event") == "stopped":
+                self._stop_start = self._pos + 1
+            if "request_seq" in message:
+                message["request_seq"] = self._seqs.get(
+                    message["request_seq"], message["request_seq"]
+                )
+            self._pos = self._pos + 1
+            yield message
+
+    def handle(self, request: dict) -> Iterator[dict]:
+        if self._pos < len(self.messages) and same_request(
+            self.messages[self._pos][1], request
+        ):
+            self._seqs[self.messages[self._pos][1]["seq"]] = request["seq"]
+            self._pos = self._pos + 1
+            return
+        response = self.recorded_response(request)
+        if response is None:
+            logger.warning(
+                f"replay: {request.get('command')} is not in the recording here"
+            )
+            response = {
+                "type": "response",
+                "command": request.get("command"),
+                "success": False,
+                "message": "not in the recording",
+            }
+        self._seq = self._seq + 1
+        yield {**response, "seq": self._seq, "request_seq": request["seq"]}
+        if request.get("command") in RESUME_COMMANDS:
+            self.off_script = True
+            self._seq = self._seq + 1
+            yield {"seq": self._seq, "type": "event", "event": "terminated"}
+
+    def recorded_response(self, request: dict) -> dict | None:
+        recorded_seq = None
+        for direction, message in self.messages[self._stop_start :]:
+            if direction == SENT:
+                if recorded_seq is None and same_request(message, request):
+                    recorded_seq = message["seq"]
+            elif (
+                recorded_seq is not None and message.get("request_seq") == recorded_seq
+            ):
+                return message
+            elif message.get("event") == "stopped":
+                # past the next stop the answers belong to another state
+                return None
+        return None
+
+
+def same_request(recorded: dict, request: dict) -> bool:
+    return recorded.get("command") == request.get("command") and recorded.get(
+        "arguments"
+    ) == request.get("arguments")
+
+
+def serve_recording(path: str, pipe_host: str) -> None:
+    # listens on pipe_host the way cmake --debugger-pipe does, for one debugger
+    server = ReplayServer.from_recording(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        listener.bind(pipe_host)
+        listener.listen(1)
+        conn, _ = listener.accept()
+        with conn:
+            server.serve(conn)
+    os.unlink(pipe_host)
+
+
+def launch_replay(path: str, pipe_host: str, stdout=None) -> subprocess.Popen:
+    # a stand-in for the cmake process, so the debugger connects and quits
+    # the same way as with a real one
+    return subprocess.Popen(
+        [sys.executable, "-m", "cmakedbg.recording", path, pipe_host], stdout=stdout
+    )
+
+
+if __name__ == "__main__":
+    serve_recording(sys.argv[1], sys.argv[2])
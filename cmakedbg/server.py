@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from cmakedbg import debugger
+from cmakedbg.session import EventLoopThread
+
+logger = logging.getLogger(__name__)
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+INVALID_PARAMS = -32602
+# longest request line read from a client
+MAX_REQUEST = 1 << 20
+# a client with more than this much of its output not read yet is dropped
+# rather than letting the daemon's memory grow
+MAX_BUFFERED = 16 << 20
+# seconds given to the clients to read their last messages on shutdown
+CLOSE_TIMEOUT = 5.0
+
+
+def is_variable_query(argv: list[str]) -> bool:
+    # commands that only read variables, so that the same one asked by several
+    # clients at the same stop can be answered with one run of it
+    match argv:
+        case ["info", "variables" | "vars" | "locals", *_]:
+            return True
+        case ["get", "variable" | "var", _]:
+            return True
+        case ["search", "value" | "values", *_]:
+            return True
+    return False
+
+
+class ClientConnection:
+    # one client of the server; only ever used from the event loop's thread
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.subscribed = False
+        self.closed = False
+
+    def send(self, message: dict) -> None:
+        if self.closed:
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+            logger.warning("Dropping a client that stopped reading its messages")
+            self.close()
+            return
+        self.writer.write(json.dumps(message).encode() + b"\n")
+
+    def close(self) -> None:
+        self.closed = True
+        self.writer.close()
+
+
+@dataclass(slots=True)
+class Request:
+    # client is None for the startup commands (rc files), whose output is
+    # printed by the daemon; wants_reply is False for JSON-RPC notifications
+    client: ClientConnection | None
+    id: Any
+    argv: list[str]
+    wants_reply: bool = True
+
+
+def check_socket_path(path: str) -> None:
+    # an existing file of someone else's at path could be a socket they
+    # listen on, or one they could swap for theirs after ours is bound
+    try:
+        stat = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if stat.st_uid != os.getuid():
+        raise PermissionError(f"{path} already exists and belongs to another user")
+
+
+def response(request_id: Any, result: Any) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+
+def error_response(request_id: Any, code: int, message: str) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {"code": code, "message": message},
+    }
+
+
+class Server:
+    """JSON-RPC 2.0 server of a cmakedbg serve session, on a Unix socket.
+
+    Messages are one JSON object per line. A request's method is a debugger
+    command verb and its params the rest of the command's words, so
+    {"method": "get", "params": ["var", "CMAKE_BUILD_TYPE"]} runs
+    `get var CMAKE_BUILD_TYPE`, and the result is the command's output and
+    whether it failed. subscribe, unsubscribe and status are handled by the
+    server itself: subscribers are sent every stop, resume and the end of the
+    session as "event" notifications, and status gives the last of them.
+
+    Connections are served on the event loop the DAP session runs on, while
+    the commands themselves run one at a time in the debugger's thread, which
+    takes them from a queue whenever cmake is stopped. Commands sent while
+    cmake runs wait for the next stop. Queued variable queries that are the
+    same as the one about to run are answered together with it, and since
+    variables are memoized per stop any others reuse what it fetched.
+    """
+
+    def __init__(self, path: str, loop_thread: EventLoopThread):
+        self.path = path
+        self.loop_thread = loop_thread
+        self.clients: set[ClientConnection] = set()
+        self.requests: deque[Request] = deque()
+        self._requests_ready = threading.Condition()
+        # the last stopped, running or exit event, for status and new subscribers
+        self.last_event: dict = {"event": "starting"}
+        # requests answered by running another one
+        self.coalesced = 0
+        self._server: asyncio.AbstractServer | None = loop_thread.run(self._listen())
+
+    async def _listen(self) -> asyncio.AbstractServer:
+        # whoever can connect can run commands (and source files), so the
+        # socket is created only accessible to us rather than restricted after
+        check_socket_path(self.path)
+        umask = os.umask(0o077)
+        try:
+            return await asyncio.start_unix_server(
+                self._serve_client, self.path, limit=MAX_REQUEST
+            )
+        finally:
+            os.umask(umask)
+
+    async def _serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        client = ClientConnection(writer)
+        self.clients.add(client)
+        try:
+            while not client.closed:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._handle(client, line)
+        except (ConnectionError, ValueError) as e:
+            # ValueError: a line longer than MAX_REQUEST
+            logger.info(f"Client connection closed: {e!r}")
+        finally:
+            self.clients.discard(client)
+            client.close()
+
+    def _handle(self, client: ClientConnection, line: bytes) -> None:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            client.send(error_response(None, PARSE_ERROR, "Parse error"))
+            return
+        if not isinstance(message, dict) or not isinstance(message.get("method"), str):
+            client.send(error_response(None, INVALID_REQUEST, "Invalid request"))
+            return
+        request_id = message.get("id")
+        method = message["method"]
+        params = message.get("params", [])
+        match method:
+            case "subscribe" | "unsubscribe":
+                client.subscribed = method == "subscribe"
+                client.send(response(request_id, self.last_event))
+            case "status":
+                client.send(
+                    response(
+                        request_id,
+                        {
+                            **self.last_event,
+                            "clients": len(self.clients),
+                            "queued": len(self.requests),
+                            "coalesced": self.coalesced,
+                        },
+                    )
+                )
+            case "pipe":
+                client.send(
+                    error_response(
+                        request_id, INVALID_PARAMS, "pipe is up to the client"
+                    )
+                )
+            case _:
+                if not isinstance(params, list) or not all(
+                    isinstance(p, str) for p in params
+                ):
+                    client.send(
+                        error_response(
+                            request_id,
+                            INVALID_PARAMS,
+                            "params should be a list of strings",
+                        )
+                    )
+                    return
+                self.enqueue(
+                    Request(client, request_id, [method, *params], "id" in message)
+                )
+
+    def enqueue(self, request: Request) -> None:
+        with self._requests_ready:
+            self.requests.append(request)
+            self._requests_ready.notify()
+
+    def next_requests(self) -> list[Request]:
+        # blocks until there is a request; a variable query comes with the
+        # queued requests for the same command
+        with self._requests_ready:
+            while not self.requests:
+                self._requests_ready.wait()
+            first = self.requests.popleft()
+            batch = [first]
+            if is_variable_query(first.argv):
+                rest: deque[Request] = deque()
+                for request in self.requests:
+                    (batch if request.argv == first.argv else rest).append(request)
+                self.requests = rest
+                self.coalesced = self.coalesced + len(batch) - 1
+            return batch
+
+    def reply(self, request: Request, result: dict) -> None:
+        if request.client is None:
+            print(result["output"])
+        elif request.wants_reply:
+            self.loop_thread.loop.call_soon_threadsafe(
+                request.client.send, response(request.id, result)
+            )
+
+    def publish(self, event: dict) -> None:
+        self.loop_thread.loop.call_soon_threadsafe(self._publish, event)
+
+    def _publish(self, event: dict) -> None:
+        if event["event"] in ("stopped", "running", "exit"):
+            self.last_event = event
+        notification = {"jsonrpc": "2.0", "method": "event", "params": event}
+        for client in list(self.clients):
+            if client.subscribed:
+                client.send(notification)
+
+    def run_commands(
+        self, debugger_state: "debugger.DebuggerState"
+    ) -> tuple[Callable, list[Any]]:
+        # process_user_input of a serve session: tells the subscribers about
+        # the stop, then runs the clients' commands until one resumes cmake
+        if debugger_state.current_line != ("", 0):
+            filepath, linenum = debugger_state.current_line
+            self.publish(
+                {
+                    "event": "stopped",
+                    "stop": debugger_state.stop_id,
+                    "file": filepath,
+                    "line": linenum,
+                }
+            )
+        while True:
+            if debugger_state.command_queue:
+                requests = [Request(None, None, debugger_state.command_queue.popleft())]
+            else:
+                requests = self.next_requests()
+            argv = requests[0].argv
+            debugger_state.command_failed = False
+            output_or_command = debugger.parse_command(debugger_state, argv)
+            if debugger_state.command_failed:
+                debugger_state.failed_commands = debugger_state.failed_commands + 1
+            resumed = isinstance(output_or_command, tuple)
+            result = {
+                "output": (
+                    ""
+                    if isinstance(output_or_command, tuple)
+                    else debugger.output_text(output_or_command)
+                ),
+                "failed": debugger_state.command_failed,
+                "resumed": resumed,
+            }
+            for request in requests:
+                self.reply(request, result)
+            if isinstance(output_or_command, tuple):
+                self.publish({"event": "running", "command": " ".join(argv)})
+                return output_or_command
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self.loop_thread.run(self._close(self._server), CLOSE_TIMEOUT)
+        except TimeoutError:
+            logger.warning("Gave up waiting for the clients to disconnect")
+        self._server = None
+
+    async def _close(self, server: asyncio.AbstractServer) -> None:
+        server.close()
+        # what was sent before, like the exit event, still goes out first
+        for client in list(self.clients):
+            client.close()
+            try:
+                await client.writer.wait_closed()
+            except ConnectionError:
+                pass
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def run_server(
+    debugger_state: "debugger.DebuggerState",
+    cmd: list,
+    socket_path: str | None,
+    print_help: Callable,
+    timeout: float,
+    record: str | None = None,
+    replay: str | None = None,
+    stats_json: str | None = None,
+) -> None:
+    # cmakedbg serve: a debug session driven by the clients of socket_path,
+    # until one of them quits or cmake is done. Without a socket_path the
+    # socket goes in a new directory only we can enter
+    private_dir = None
+    if socket_path is None:
+        private_dir = tempfile.mkdtemp(prefix="cmakedbg-")
+        socket_path = os.path.join(private_dir, "session.sock")
+    loop_thread = EventLoopThread()
+    try:
+        debugger_state.server = Server(socket_path, loop_thread)
+    except OSError as e:
+        print(f"Could not listen on {socket_path}: {e}")
+        loop_thread.stop()
+        if private_dir is not None:
+            shutil.rmtree(private_dir, ignore_errors=True)
+        sys.exit(1)
+    print(f"Serving the debug session on {socket_path}", flush=True)
+    try:
+        debugger.run_debugger(
+            debugger_state,
+            cmd,
+            print_help,
+            timeout,
+            loop_thread,
+            record=record,
+            replay=replay,
+            stats_json=stats_json,
+        )
+    except KeyboardInterrupt:
+        debugger.dbg_quit(debugger_state)
+    finally:
+        debugger_state.server.close()
+        loop_thread.stop()
+        if private_dir is not None:
+            shutil.rmtree(private_dir, ignore_errors=True)
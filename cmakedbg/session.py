@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+from collections.abc import Callable
+
+from cmakedbg.codec import Codec, default_codec
+from cmakedbg.metrics import Metrics
+from cmakedbg.recording import RECEIVED, SENT, Recorder
+from cmakedbg.transport import HEADER_END, FrameDecoder, create_request
+
+logger = logging.getLogger(__name__)
+
+# the most of a message body logged at DEBUG level
+LOG_BODY_LIMIT = 2048
+
+
+def message_name(message: dict) -> str:
+    # what a message is in the metrics and the log: the command of a response
+    # or "event NAME"
+    if message.get("type") == "event":
+        return f"event {message.get('event')}"
+    return str(message.get("command"))
+
+
+class DAPSession:
+    """Client side of a DAP connection, driven by an asyncio event loop.
+
+    Every request gets its own seq and a future that is resolved when the
+    response with the matching request_seq comes in, so any number of requests
+    can be in flight at once. Events are put on the events queue as they
+    arrive, independently of any outstanding request.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        decoder: FrameDecoder | None = None,
+        codec: Codec | None = None,
+        recorder: Recorder | None = None,
+        metrics: Metrics | None = None,
+    ):
+        self.sock = sock
+        self.decoder = decoder if decoder is not None else FrameDecoder()
+        self.codec = codec if codec is not None else default_codec()
+        self.recorder = recorder
+        self.metrics = metrics
+        # seq -> when the request was sent, while metrics are being kept
+        self._sent_at: dict[int, int] = {}
+        # bytes written to and read from the socket
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.closed: BaseException | None = None
+        self._seq = 0
+        self._pending: dict[int, asyncio.Future] = {}
+        self._reader: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self.sock.setblocking(False)
+        self._reader = asyncio.get_running_loop().create_task(self._read_loop())
+
+    async def request(self, request_func: Callable, *args) -> dict:
+        future = await self.send(request_func, *args)
+        return await future
+
+    async def request_many(self, requests: list[tuple]) -> list[dict]:
+        # requests is a list of (request_func, *args); they are all written out
+        # before waiting on the first response
+        futures = [await self.send(*request) for request in requests]
+        return list(await asyncio.gather(*futures))
+
+    async def send(self, request_func: Callable, *args) -> asyncio.Future:
+        if self.closed is not None:
+            raise ConnectionError("DAP connection is closed") from self.closed
+        self._seq = self._seq + 1
+        payload = request_func(*args)
+        request_bytes = create_request(payload, self._seq, self.codec)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._seq] = future
+        body_start = request_bytes.index(HEADER_END) + len(HEADER_END)
+        logger.info(
+            "-> %s seq=%d, %d bytes",
+            payload["command"],
+            self._seq,
+            len(request_bytes) - body_start,
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "-> %s", request_bytes[body_start : body_start + LOG_BODY_LIMIT]
+            )
+        if self.metrics is not None:
+            self.metrics.sent(payload["command"], len(request_bytes) - body_start)
+            self._sent_at[self._seq] = time.perf_counter_ns()
+        if self.recorder is not None:
+            self.recorder.record(SENT, memoryview(request_bytes)[body_start:])
+        await asyncio.get_running_loop().sock_sendall(self.sock, request_bytes)
+        self.bytes_sent = self.bytes_sent + len(request_bytes)
+        return future
+
+    async def next_event(self) -> dict:
+        event = await self.events.get()
+        if isinstance(event, BaseException):
+            # leave the error in place for anyone else waiting on events
+            self.events.put_nowait(event)
+            raise ConnectionError("DAP connection is closed") from event
+        return event
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except (asyncio.CancelledError, ConnectionError):
+                pass
+
+    async def _read_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                body = self.decoder.next_frame()
+                if body is None:
+                    nbytes = await loop.sock_recv_into(
+                        self.sock, self.decoder.writable()
+                    )
+                    if nbytes == 0:
+                        raise ConnectionError("DAP connection closed by cmake")
+                    self.decoder.advance(nbytes)
+                    self.bytes_received = self.bytes_received + nbytes
+                    continue
+                if self.recorder is not None:
+                    self.recorder.record(RECEIVED, body)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("<- %s", bytes(body[:LOG_BODY_LIMIT]))
+                # decoded straight from the view, before the next read reuses
+                # the buffer under it
+                if self.metrics is None:
+                    self._dispatch(self.codec.decode(body), len(body))
+                else:
+                    start = time.perf_counter_ns()
+                    message = self.codec.decode(body)
+                    self._measure(self.metrics, message, len(body), start)
+                    self._dispatch(message, len(body))
+        except (Exception, asyncio.CancelledError) as e:
+            self.closed = e
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("DAP connection is closed"))
+            self._pending.clear()
+            self.events.put_nowait(e)
+            if not isinstance(e, (ConnectionError, asyncio.CancelledError)):
+                logger.error(f"DAP session stopped reading: {e!r}")
+
+    def set_metrics(self, metrics: Metrics | None) -> None:
+        self.metrics = metrics
+        self._sent_at.clear()
+
+    def _measure(
+        self, metrics: Metrics, message: dict, size: int, decode_start: int
+    ) -> None:
+        decoded = time.perf_counter_ns()
+        round_trip = None
+        if message.get("type") == "response":
+            sent_at = self._sent_at.pop(message.get("request_seq", 0), None)
+            if sent_at is not None:
+                round_trip = decoded - sent_at
+        metrics.received(
+            message_name(message),
+            size,
+            decoded - decode_start,
+            round_trip,
+            message.get("success", True),
+        )
+
+    def _dispatch(self, message: dict, size: int = 0) -> None:
+        logger.info(
+            "<- %s seq=%s, %d bytes", message_name(message), message.get("seq"), size
+        )
+        if message.get("type") == "response":
+            # seqs start at 1, so a response without request_seq matches nothing
+            future = self._pending.pop(message.get("request_seq", 0), None)
+            if future is None:
+                logger.warning(
+                    "Response to unknown request %s (%s)",
+                    message.get("request_seq"),
+                    message_name(message),
+                )
+            elif not future.done():
+                future.set_result(message)
+        else:
+            self.events.put_nowait(message)
+
+
+class EventLoopThread:
+    # runs an asyncio event loop in a daemon thread, so blocking code (the
+    # REPL's input(), command handling) can talk to DAP sessions while they keep
+    # reading from their sockets. Several sessions can share one loop.
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout: float | None = None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self) -> None:
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+        self.loop.close()
+
+
+class SyncSession:
+    """Blocking facade over a DAPSession running in an EventLoopThread."""
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        loop_thread: EventLoopThread | None = None,
+        codec: Codec | None = None,
+        recorder: Recorder | None = None,
+        metrics: Metrics | None = None,
+    ):
+        self._owns_loop = loop_thread is None
+        self.loop_thread = loop_thread if loop_thread is not None else EventLoopThread()
+        self.session = self.loop_thread.run(self._start(sock, codec, recorder, metrics))
+
+    @staticmethod
+    async def _start(
+        sock: socket.socket,
+        codec: Codec | None,
+        recorder: Recorder | None,
+        metrics: Metrics | None,
+    ) -> DAPSession:
+        session = DAPSession(sock, codec=codec, recorder=recorder, metrics=metrics)
+        session.start()
+        return session
+
+    def request(self, request_func: Callable, *args) -> dict:
+        return self.loop_thread.run(self.session.request(request_func, *args))
+
+    def request_many(self, requests: list[tuple]) -> list[dict]:
+        return self.loop_thread.run(self.session.request_many(requests))
+
+    def set_metrics(self, metrics: Metrics | None) -> None:
+        # the session is only touched from its own loop
+        self.loop_thread.loop.call_soon_threadsafe(self.session.set_metrics, metrics)
+
+    def next_event(self, timeout: float | None = None) -> dict:
+        return self.loop_thread.run(
+            asyncio.wait_for(self.session.next_event(), timeout)
+        )
+
+    def close(self) -> None:
+        if self.loop_thread.loop.is_running():
+            self.loop_thread.run(self.session.close())
+        if self._owns_loop:
+            self.loop_thread.stop()
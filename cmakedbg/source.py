@@ -0,0 +1,101 @@
+import mmap
+import os
+from array import array
+from collections import OrderedDict
+
+# files at least this big are mapped instead of read into memory
+MMAP_THRESHOLD = 1024 * 1024
+
+
+class SourceFile:
+    # the contents of one file plus the offset of the start of every line, so
+    # any range of lines can be sliced out without splitting the whole file
+    def __init__(self, path: str, stat: os.stat_result, mmap_threshold: int):
+        self.key = (stat.st_mtime_ns, stat.st_size)
+        self.data: bytes | mmap.mmap
+        with open(path, "rb") as f:
+            if stat.st_size >= mmap_threshold and stat.st_size > 0:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = f.read()
+        self.offsets = line_offsets(self.data)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def line(self, linenum: int) -> str:
+        # linenum starts at 1
+        start = self.offsets[linenum - 1]
+        if linenum < len(self.offsets):
+            end = self.offsets[linenum]
+        else:
+            end = len(self.data)
+        return self.data[start:end].decode("utf-8", errors="replace").strip()
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+def line_offsets(data: bytes | mmap.mmap) -> array:
+    offsets = array("q", [0])
+    newline = data.find(b"\n")
+    while newline >= 0:
+        offsets.append(newline + 1)
+        newline = data.find(b"\n", newline + 1)
+    if offsets[-1] == len(data):
+        # nothing after the last newline (or an empty file)
+        offsets.pop()
+    return offsets
+
+
+class SourceCache:
+    """Line-indexed contents of recently listed files.
+
+    Entries are keyed by path and revalidated against the file's mtime and
+    size on every lookup. At most max_files are kept, least recently used
+    first out.
+    """
+
+    def __init__(self, max_files: int = 32, mmap_threshold: int = MMAP_THRESHOLD):
+        self.max_files = max_files
+        self.mmap_threshold = mmap_threshold
+        self._files: OrderedDict[str, SourceFile] = OrderedDict()
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._files
+
+    def get(self, path: str) -> SourceFile:
+        stat = os.stat(path)
+        source_file = self._files.get(path)
+        if source_file is not None and source_file.key != (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            source_file.close()
+            source_file = None
+        if source_file is None:
+            source_file = SourceFile(path, stat, self.mmap_threshold)
+            self._files[path] = source_file
+        self._files.move_to_end(path)
+        while len(self._files) > self.max_files:
+            _, evicted = self._files.popitem(last=False)
+            evicted.close()
+        return source_file
+
+    def line_count(self, path: str) -> int:
+        return len(self.get(path))
+
+    def lines(self, path: str, first: int, last: int) -> list[tuple[int, str]]:
+        # (line number, text) for the lines first..last that exist
+        source_file = self.get(path)
+        first = max(first, 1)
+        last = min(last, len(source_file))
+        return [
+            (linenum, source_file.line(linenum)) for linenum in range(first, last + 1)
+        ]
+
+    def clear(self) -> None:
+        for source_file in self._files.values():
+            source_file.close()
+        self._files.clear()
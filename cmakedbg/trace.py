@@ -0,0 +1,143 @@
+import io
+import json
+from abc import ABC, abstractmethod
+
+from cmakedbg.profile import Frame
+
+
+class TraceWriter(ABC):
+    """Turns the stacks sampled at every step into frame open/close events
+    written straight to a file, so a long configure is never held in memory.
+
+    Consecutive stacks are compared from the root: the frames past the common
+    part of the old stack are closed (innermost first) and those of the new
+    one opened. The top frame is the command being run, so every command gets
+    its own event pair, nested under the function, include or find_package
+    call it is part of. Timestamps are relative to the first sample.
+    """
+
+    def __init__(self, output: io.TextIOBase):
+        self.output = output
+        self._start: int | None = None
+        self._stack: tuple[Frame, ...] = ()
+        self._events = 0
+        self.write_header()
+
+    def sample(self, timestamp_ns: int, stack: tuple[Frame, ...]) -> None:
+        if self._start is None:
+            self._start = timestamp_ns
+        at = timestamp_ns - self._start
+        common = 0
+        for old, new in zip(self._stack, stack):
+            if old != new:
+                break
+            common = common + 1
+        for frame in reversed(self._stack[common:]):
+            self.write_event(self.close_event(frame, at))
+        for frame in stack[common:]:
+            self.write_event(self.open_event(frame, at))
+        self._stack = stack
+
+    def finish(self, timestamp_ns: int) -> None:
+        if self._start is not None:
+            self.sample(timestamp_ns, ())
+            at = timestamp_ns - self._start
+        else:
+            at = 0
+        self.write_footer(at)
+        self.output.flush()
+
+    def write_event(self, event: dict) -> None:
+        if self._events:
+            self.output.write(",\n")
+        self.output.write(json.dumps(event, separators=(",", ":")))
+        self._events = self._events + 1
+
+    @abstractmethod
+    def write_header(self) -> None:
+        pass
+
+    @abstractmethod
+    def write_footer(self, end_ns: int) -> None:
+        pass
+
+    @abstractmethod
+    def open_event(self, frame: Frame, at: int) -> dict:
+        pass
+
+    @abstractmethod
+    def close_event(self, frame: Frame, at: int) -> dict:
+        pass
+
+
+class ChromeTraceWriter(TraceWriter):
+    # Trace Event Format, for chrome://tracing and Perfetto
+    def write_header(self) -> None:
+        self.output.write('{"displayTimeUnit":"ms","traceEvents":[\n')
+
+    def write_footer(self, end_ns: int) -> None:
+        self.output.write("\n]}\n")
+
+    def open_event(self, frame: Frame, at: int) -> dict:
+        name, path, line = frame
+        return {
+            "name": name,
+            "cat": "cmake",
+            "ph": "B",
+            "ts": at / 1000,
+            "pid": 1,
+            "tid": 1,
+            "args": {"file": path, "line": line},
+        }
+
+    def close_event(self, frame: Frame, at: int) -> dict:
+        return {"ph": "E", "ts": at / 1000, "pid": 1, "tid": 1}
+
+
+class SpeedscopeWriter(TraceWriter):
+    # speedscope's evented profile. Its frame table goes after the events,
+    # since the frames are only all known at the end
+    def __init__(self, output: io.TextIOBase, name: str = "cmake"):
+        self.name = name
+        self._frames: dict[Frame, int] = {}
+        super().__init__(output)
+
+    def write_header(self) -> None:
+        self.output.write(
+            '{"$schema":"https://www.speedscope.app/file-format-schema.json",'
+            '"profiles":[{"type":"evented","name":'
+            + json.dumps(self.name)
+            + ',"unit":"nanoseconds","startValue":0,"events":[\n'
+        )
+
+    def write_footer(self, end_ns: int) -> None:
+        frames = [
+            {"name": name, "file": path, "line": line}
+            for name, path, line in self._frames
+        ]
+        self.output.write(
+            f'\n],"endValue":{end_ns}}}],"shared":{{"frames":'
+            + json.dumps(frames, separators=(",", ":"))
+            + "}}\n"
+        )
+
+    def frame_index(self, frame: Frame) -> int:
+        index = self._frames.get(frame)
+        if index is None:
+            index = self._frames[frame] = len(self._frames)
+        return index
+
+    def open_event(self, frame: Frame, at: int) -> dict:
+        return {"type": "O", "frame": self.frame_index(frame), "at": at}
+
+    def close_event(self, frame: Frame, at: int) -> dict:
+        return {"type": "C", "frame": self.frame_index(frame), "at": at}
+
+
+def trace_writer(trace_format: str, output: io.TextIOBase) -> TraceWriter:
+    match trace_format:
+        case "chrome":
+            return ChromeTraceWriter(output)
+        case "speedscope":
+            return SpeedscopeWriter(output)
+    raise ValueError(f"Unknown trace format {trace_format}")
@@ -0,0 +1,118 @@
+import socket
+
+from cmakedbg.codec import STDLIB_CODEC, Codec
+
+HEADER_END = b"\r\n\r\n"
+# smallest amount of free space handed to recv_into; the buffer grows past this
+# to fit whatever the largest frame seen so far was, so big replies are read in
+# big chunks
+MIN_READ_SIZE = 64 * 1024
+
+
+class FrameDecoder:
+    """Incremental decoder for DAP frames ("Content-Length: N\\r\\n\\r\\n<body>").
+
+    Data is received straight into a preallocated bytearray (see writable() and
+    advance()), and complete frame bodies are handed out as memoryviews into that
+    buffer, so assembling a frame never copies what has already been received.
+    A view returned by next_frame() is only valid until the next call to
+    writable() or feed().
+    """
+
+    def __init__(self, initial_size: int = MIN_READ_SIZE):
+        self._buf = bytearray(initial_size)
+        self._view = memoryview(self._buf)
+        self._start = 0  # first byte not yet handed out
+        self._end = 0  # one past the last received byte
+        self._body_start = 0
+        self._body_size = -1  # -1 until the header of the next frame is parsed
+
+    @property
+    def buffered(self) -> int:
+        return self._end - self._start
+
+    def writable(self, min_size: int = 1) -> memoryview:
+        # free space to receive into. If the header of the pending frame has
+        # been parsed, make room for the whole frame up front so that it can be
+        # received without any further compaction or growth
+        if self._body_size >= 0:
+            needed = self._body_start + self._body_size - self._start
+        else:
+            needed = self.buffered + max(min_size, MIN_READ_SIZE)
+        needed = max(needed, self.buffered + min_size)
+        if self._start + needed > len(self._buf):
+            self._make_room(needed)
+        return self._view[self._end :]
+
+    def advance(self, nbytes: int) -> None:
+        self._end = self._end + nbytes
+
+    def feed(self, data: bytes) -> None:
+        self.writable(len(data))[: len(data)] = data
+        self.advance(len(data))
+
+    def next_frame(self) -> memoryview | None:
+        if self._body_size < 0:
+            header_end = self._buf.find(HEADER_END, self._start, self._end)
+            if header_end < 0:
+                return None
+            self._body_size = parse_header(self._view[self._start : header_end])
+            self._body_start = header_end + len(HEADER_END)
+        body_end = self._body_start + self._body_size
+        if body_end > self._end:
+            return None
+        body = self._view[self._body_start : body_end]
+        self._body_size = -1
+        if body_end == self._end:
+            # nothing left over, start the next frame at the front of the buffer
+            self._start = self._end = 0
+        else:
+            self._start = body_end
+        return body
+
+    def _make_room(self, needed: int) -> None:
+        pending = self._view[self._start : self._end]
+        if needed <= len(self._buf):
+            # only the unconsumed tail moves; copy it out first since the source
+            # and destination can overlap
+            self._buf[: len(pending)] = pending.tobytes()
+        else:
+            size = len(self._buf)
+            while size < needed:
+                size = size * 2
+            buf = bytearray(size)
+            buf[: len(pending)] = pending
+            self._buf = buf
+            self._view = memoryview(buf)
+        self._body_start = self._body_start - self._start
+        self._end = self._end - self._start
+        self._start = 0
+
+
+def create_request(payload: dict, seq: int, codec: Codec | None = None) -> bytes:
+    if codec is None:
+        codec = STDLIB_CODEC
+    payload["seq"] = seq
+    payload["type"] = "request"
+    body = codec.encode(payload)
+    return f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+def parse_header(header: bytes | memoryview) -> int:
+    for field in bytes(header).split(b"\r\n"):
+        name, _, value = field.partition(b":")
+        if name.strip().lower() == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                break
+    raise ValueError(f"Invalid DAP frame header: {bytes(header)!r}")
+
+
+def read_frame(s: socket.socket, decoder: FrameDecoder) -> memoryview:
+    while (body := decoder.next_frame()) is None:
+        nbytes = s.recv_into(decoder.writable())
+        if nbytes == 0:
+            raise ConnectionError("DAP connection closed by cmake")
+        decoder.advance(nbytes)
+    return body
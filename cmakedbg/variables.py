@@ -0,0 +1,258 @@
+import bisect
+import fnmatch
+import re
+import sys
+from collections import OrderedDict
+from collections.abc import Iterable
+
+# marks a variable that is not set at a given stop
+MISSING = None
+# more added or removed names than this and the index is sorted from scratch
+REBUILD_THRESHOLD = 64
+
+
+def container_values(variables: list[dict]) -> dict[str, str]:
+    # name -> value for the entries of a variables reply. The names are
+    # interned, so the ones that repeat at every stop (all of them, mostly)
+    # share one string across the snapshots, the index and the history
+    return {sys.intern(variable["name"]): variable["value"] for variable in variables}
+
+
+class VariableHistory:
+    """Snapshots of the CMake variables, keyed by stop number.
+
+    Only the newest snapshot is held in full. Every other snapshot is stored as
+    the changes ({name: (old, new)}) against the snapshot recorded before it,
+    so values that do not change are shared by all snapshots and the diff
+    between consecutive stops is O(changed). At most max_snapshots are kept;
+    the least recently used one is evicted by folding its changes into the
+    snapshot that follows it.
+    """
+
+    def __init__(self, max_snapshots: int = 64):
+        self.max_snapshots = max_snapshots
+        self._current: dict[str, str] = {}
+        # False until a full snapshot has been recorded. Until then a name that
+        # has not been seen before has no known previous value, so it is not
+        # reported as a change
+        self._complete = False
+        self._newest: int | None = None
+        # stop -> (previous stop, changes since the previous stop), oldest stop first
+        self._deltas: dict[int, tuple[int | None, dict]] = {}
+        self._lru: OrderedDict[int, None] = OrderedDict()
+        # the names of the newest snapshot
+        self.index = VariableIndex()
+
+    def __contains__(self, stop_id: int) -> bool:
+        return stop_id in self._deltas
+
+    def __len__(self) -> int:
+        return len(self._deltas)
+
+    @property
+    def newest(self) -> int | None:
+        return self._newest
+
+    def stops(self) -> list[int]:
+        return list(self._deltas)
+
+    def record(self, stop_id: int, values: dict, partial: bool = False) -> dict:
+        # values becomes the newest snapshot without being copied, so the caller
+        # must not modify it afterwards. With partial=True only the given names
+        # were looked at, and anything not in values is assumed unchanged.
+        if self._newest is not None and stop_id < self._newest:
+            raise ValueError(f"Stop {stop_id} is older than stop {self._newest}")
+        changes = {}
+        added = []
+        for name, value in values.items():
+            if name not in self._current:
+                added.append(name)
+                if not self._complete:
+                    continue
+            old = self._current.get(name, MISSING)
+            if old != value:
+                changes[name] = (old, value)
+        removed = []
+        if partial:
+            self._current.update(values)
+        else:
+            for name, old in self._current.items():
+                if name not in values:
+                    removed.append(name)
+                    if self._complete:
+                        changes[name] = (old, MISSING)
+            self._current = values
+            self._complete = True
+        self.index.update(added, removed, self._current)
+
+        if stop_id == self._newest:
+            previous, merged = self._deltas[stop_id]
+            self._deltas[stop_id] = (previous, compose(merged, changes))
+        else:
+            self._deltas[stop_id] = (self._newest, changes)
+            self._newest = stop_id
+        self._touch(stop_id)
+        self._evict()
+        return changes
+
+    def changes(self, stop_id: int | None = None) -> tuple[int | None, dict]:
+        # (previous stop, {name: (old, new)}) for what changed since the
+        # snapshot recorded before stop_id
+        if stop_id is None:
+            stop_id = self._newest
+        if stop_id not in self._deltas:
+            raise KeyError(stop_id)
+        self._touch(stop_id)
+        return self._deltas[stop_id]
+
+    def value(self, name: str, stop_id: int | None = None) -> str | None:
+        if stop_id is None or stop_id == self._newest:
+            return self._current.get(name, MISSING)
+        if stop_id not in self._deltas:
+            raise KeyError(stop_id)
+        self._touch(stop_id)
+        value = self._current.get(name, MISSING)
+        # undo the changes of every snapshot newer than stop_id
+        for newer in reversed(self._deltas):
+            if newer == stop_id:
+                break
+            _, changes = self._deltas[newer]
+            if name in changes:
+                value = changes[name][0]
+        return value
+
+    def snapshot(self, stop_id: int | None = None) -> dict:
+        if stop_id is None or stop_id == self._newest:
+            return dict(self._current)
+        if stop_id not in self._deltas:
+            raise KeyError(stop_id)
+        self._touch(stop_id)
+        values = dict(self._current)
+        for newer in reversed(self._deltas):
+            if newer == stop_id:
+                break
+            for name, (old, _) in self._deltas[newer][1].items():
+                if old is MISSING:
+                    values.pop(name, None)
+                else:
+                    values[name] = old
+        return values
+
+    def _touch(self, stop_id: int) -> None:
+        self._lru[stop_id] = None
+        self._lru.move_to_end(stop_id)
+
+    def _evict(self) -> None:
+        while len(self._deltas) > self.max_snapshots:
+            for victim in self._lru:
+                if victim != self._newest:
+                    break
+            del self._lru[victim]
+            stops = list(self._deltas)
+            successor = stops[stops.index(victim) + 1]
+            previous, changes = self._deltas.pop(victim)
+            if victim != stops[0]:
+                # a stop in the middle: its successor now covers both steps
+                _, successor_changes = self._deltas[successor]
+                self._deltas[successor] = (
+                    previous,
+                    compose(changes, successor_changes),
+                )
+
+
+def compose(first: dict, second: dict) -> dict:
+    # changes equivalent to applying first and then second
+    combined = dict(first)
+    for name, (old, new) in second.items():
+        if name in combined:
+            old = combined[name][0]
+        if old == new:
+            combined.pop(name, None)
+        else:
+            combined[name] = (old, new)
+    return combined
+
+
+class VariableIndex:
+    """Sorted variable names, for glob and regex lookups without going through
+    every name.
+
+    A glob with a literal prefix (CMAKE_*) is a binary search on the sorted
+    names. Anything else is narrowed down with a trigram index of the names,
+    built on first use. Both are updated with the names added and removed
+    between stops instead of being rebuilt.
+    """
+
+    def __init__(self):
+        self._names: list[str] = []
+        self._trigrams: dict[str, set[str]] | None = None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def update(
+        self, added: list[str], removed: list[str], names: Iterable[str]
+    ) -> None:
+        # names is the full set of names after the change
+        if len(added) + len(removed) > REBUILD_THRESHOLD:
+            self._names = sorted(names)
+            self._trigrams = None
+            return
+        for name in removed:
+            i = bisect.bisect_left(self._names, name)
+            if i < len(self._names) and self._names[i] == name:
+                del self._names[i]
+                if self._trigrams is not None:
+                    for trigram in trigrams(name):
+                        self._trigrams[trigram].discard(name)
+        for name in added:
+            i = bisect.bisect_left(self._names, name)
+            if i == len(self._names) or self._names[i] != name:
+                self._names.insert(i, name)
+                if self._trigrams is not None:
+                    for trigram in trigrams(name):
+                        self._trigrams.setdefault(trigram, set()).add(name)
+
+    def with_prefix(self, prefix: str) -> list[str]:
+        first = bisect.bisect_left(self._names, prefix)
+        last = bisect.bisect_left(self._names, prefix + "\U0010ffff")
+        return self._names[first:last]
+
+    def containing(self, substring: str) -> list[str]:
+        # names with substring in them, sorted
+        if len(substring) < 3:
+            return [name for name in self._names if substring in name]
+        if self._trigrams is None:
+            self._trigrams = {}
+            for name in self._names:
+                for trigram in trigrams(name):
+                    self._trigrams.setdefault(trigram, set()).add(name)
+        postings = sorted(
+            (self._trigrams.get(trigram, set()) for trigram in trigrams(substring)),
+            key=len,
+        )
+        candidates = set.intersection(*postings)
+        return sorted(name for name in candidates if substring in name)
+
+    def glob(self, pattern: str) -> list[str]:
+        # case sensitive, like CMake variable names
+        literal = re.split(r"\*|\?|\[!?\]?[^\]]*\]|\[", pattern)
+        if len(literal) == 1:
+            return [pattern] if self.with_prefix(pattern)[:1] == [pattern] else []
+        if literal[0]:
+            candidates = self.with_prefix(literal[0])
+        else:
+            longest = max(literal, key=len)
+            candidates = self.containing(longest) if longest else self._names
+        return [name for name in candidates if fnmatch.fnmatchcase(name, pattern)]
+
+    def regex(self, pattern: str) -> list[str]:
+        compiled = re.compile(pattern)
+        return [name for name in self._names if compiled.search(name)]
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
@@ -1,13 +1,21 @@
-from cmakedbg import cmakedbg
+from cmakedbg import debugger as cmakedbg
+from cmakedbg import transport
+from cmakedbg.mock_cmake import MockCMake, program_from_listfile, synthetic_program
+from cmakedbg.session import SyncSession
+import io
 import os
 from pprint import pprint
 from pathlib import Path
 import time
 import shutil
+import sys
 import pytest
+import re
 import socket
+import subprocess
 from subprocess import Popen
 import json
+import threading
 
 
 def test_validate_filepath_and_linenum():
@@ -34,8 +42,8 @@ def test_debugger_state():
     assert len(debugger_state.host.split('-')) == 6
     assert "/tmp/cmake" in debugger_state.host
     assert debugger_state.already_running is False
-    assert debugger_state.cmake_variables == {}
-    assert debugger_state.top_level_vars == 0
+    assert debugger_state.frame_cache == {}
+    assert debugger_state.selected_frame == 0
 
 
 def test_initialize():
@@ -43,35 +51,96 @@ def test_initialize():
     assert initi['command'] == 'initialize'
 
 
+MPI_EXAMPLE = Path(__file__).parent / "cmake-examples-master" / "08-mpi"
+
+
+def cmake_has_debugger():
+    # cmake gained --debugger in 3.27
+    if shutil.which("cmake") is None:
+        return False
+    version = subprocess.run(["cmake", "--version"], capture_output=True, text=True).stdout
+    match = re.search(r"(\d+)\.(\d+)", version)
+    return match is not None and tuple(map(int, match.groups())) >= (3, 27)
+
+
 @pytest.fixture(scope='class')
 def debugger_state():
     return cmakedbg.DebuggerState()
 
 
-@pytest.fixture(scope='class')
-def cmake_background_process(debugger_state):
-    cmake_dir = Path("./tests/cmake-examples-master/08-mpi").resolve()
-    curr_dir = Path(".").resolve()
-    build_dir = cmake_dir.joinpath("build").resolve()
-    if build_dir.is_dir():
-        shutil.rmtree(build_dir)
-    build_dir.mkdir()
-    os.chdir(str(build_dir))
-    bg_process = cmakedbg.launch_cmake(["cmake", ".."], debugger_state.host, lambda: print("help"))
+@pytest.fixture(scope='class', params=[
+    "mock",
+    pytest.param("cmake", marks=pytest.mark.skipif(not cmake_has_debugger(),
+                                                   reason="needs cmake 3.27 or newer")),
+])
+def cmake_background_process(request, debugger_state, tmp_path_factory):
+    # None for the mock, which runs in a thread of the test process
+    if request.param == "mock":
+        yield None
+        return
+    build_dir = tmp_path_factory.mktemp("build")
+    bg_process = cmakedbg.launch_cmake(["cmake", "-S", str(MPI_EXAMPLE), "-B", str(build_dir)],
+                                       debugger_state.host, lambda: print("help"))
     yield bg_process
     bg_process.kill()
-    os.chdir(str(curr_dir))
 
 
 @pytest.fixture(scope='class')
 def cmake_dap_socket(debugger_state, cmake_background_process):
-    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
-        s.connect(debugger_state.host)
+    if cmake_background_process is None:
+        # the 08-mpi listfile, with the variables the tests look at
+        mock = MockCMake(program_from_listfile(str(MPI_EXAMPLE.resolve() / "CMakeLists.txt")),
+                         cache={"CMAKE_C_COMPILER": "/usr/bin/cc"},
+                         local_variables={"PROJECT_NAME": "MY_PROJECT"})
+        client, server = socket.socketpair()
+        mock.start(server)
+        with client, server:
+            yield client
+        return
+    with cmakedbg.connect_to_cmake(debugger_state.host, cmake_background_process) as s:
         yield s
 
 
+@pytest.fixture(scope='class')
+def dap_session(cmake_dap_socket):
+    session = SyncSession(cmake_dap_socket)
+    yield session
+    session.close()
+
+
+def test_connect_to_cmake(tmp_path):
+    pipe_host = str(tmp_path / "pipe")
+    # cmake exiting before the pipe exists fails straight away
+    exited = Popen([sys.executable, "-c", "import sys; sys.exit(3)"])
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError, match="code 3"):
+        cmakedbg.connect_to_cmake(pipe_host, exited, timeout=30)
+    assert time.perf_counter() - start < 5
+
+    sleeper = Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    with pytest.raises(TimeoutError):
+        cmakedbg.connect_to_cmake(pipe_host, sleeper, timeout=0.2)
+    sleeper.kill()
+    sleeper.wait()
+
+    # the pipe shows up late, and is listened on a bit after being created
+    server = Popen([sys.executable, "-c", f"""
+import socket, time
+time.sleep(0.2)
+s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+s.bind({pipe_host!r})
+time.sleep(0.1)
+s.listen(1)
+conn, _ = s.accept()
+conn.sendall(b"ok")
+"""])
+    with cmakedbg.connect_to_cmake(pipe_host, server, timeout=30) as s:
+        assert s.recv(2) == b"ok"
+    server.wait()
+
+
 def test_create_request():
-    request_bytes = cmakedbg.create_request(cmakedbg.initialize())
+    request_bytes = transport.create_request(cmakedbg.initialize(), 1)
     assert type(request_bytes) is bytes
     header, request = request_bytes.split(b"\r\n\r\n")
     content_length = header.decode().split()[-1]
@@ -81,80 +150,449 @@ def test_create_request():
     assert payload['type'] == 'request'
 
 
-def test_send_request(debugger_state, cmake_dap_socket, cmake_background_process):
+def test_send_request(debugger_state, dap_session, cmake_background_process):
     debugger_state.cmake_process_handle = cmake_background_process
-    cmakedbg.send_request(cmake_dap_socket, cmakedbg.initialize)
-    body_json, debugger_state.response = cmakedbg.recv_response(cmake_dap_socket,
-                                                                debugger_state.response)
+    body_json = dap_session.request(cmakedbg.initialize)
     assert (body_json["type"], body_json["command"]) == ("response", "initialize")
-    body_json, debugger_state.response = cmakedbg.recv_response(
-        cmake_dap_socket, debugger_state.response)
+    body_json = dap_session.next_event()
     assert (body_json["type"], body_json["event"]) == ("event", "initialized")
 
 
+class FakeDAPServer(threading.Thread):
+    # answers requests on one end of a socketpair from canned variable trees,
+    # which is enough to exercise the client side without cmake
+    scopes = {1: [{"name": "Locals", "variablesReference": 1}]}
+    variables = {
+        1: [
+            {"name": "CacheVariables", "value": "", "variablesReference": 2},
+            {"name": "Directories", "value": "", "variablesReference": 3},
+            {"name": "Locals", "value": "", "variablesReference": 4},
+        ],
+        2: [
+            {"name": "CMAKE_BUILD_TYPE", "value": "Release", "variablesReference": 0},
+            {"name": "FOO", "value": "cached", "variablesReference": 0},
+        ],
+        3: [{"name": "CMAKE_CURRENT_SOURCE_DIR", "value": "/src", "variablesReference": 0}],
+        4: [{"name": "FOO", "value": "local", "variablesReference": 0}],
+    }
+    stack_frames = [{"id": 1, "line": 3, "source": {"path": "/src/CMakeLists.txt"}}]
+
+    def __init__(self, sock):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.requests = []
+        self.breakpoint_ids = 0
+
+    def run(self):
+        decoder = transport.FrameDecoder()
+        while True:
+            try:
+                request = json.loads(transport.read_frame(self.sock, decoder).tobytes())
+            except (ConnectionError, OSError):
+                return
+            self.requests.append(request)
+            arguments = request["arguments"]
+            match request["command"]:
+                case "scopes":
+                    body = {"scopes": self.scopes[arguments["frameId"]]}
+                case "variables":
+                    body = {"variables": self.variables[arguments["variablesReference"]]}
+                case "stackTrace":
+                    body = {"stackFrames": self.stack_frames}
+                case "setBreakpoints":
+                    body = {"breakpoints": []}
+                    for bp in arguments["breakpoints"]:
+                        self.breakpoint_ids = self.breakpoint_ids + 1
+                        body["breakpoints"].append({"id": self.breakpoint_ids, "line": bp["line"],
+                                                    "verified": bp["line"] != 2})
+                case _:
+                    body = {}
+            response = json.dumps({"type": "response", "request_seq": request["seq"],
+                                   "command": request["command"], "success": True,
+                                   "body": body}).encode()
+            self.sock.sendall(f"Content-Length: {len(response)}\r\n\r\n".encode() + response)
+
+    def commands(self):
+        return [(r["command"], r["arguments"].get("variablesReference")) for r in self.requests]
+
+
+@pytest.fixture
+def fake_dap_state():
+    client, server = socket.socketpair()
+    fake_server = FakeDAPServer(server)
+    fake_server.start()
+    session = SyncSession(client)
+    state = cmakedbg.DebuggerState(session=session, already_running=True)
+    cmakedbg.reset_variables(state, 1)
+    yield state, fake_server
+    session.close()
+    client.close()
+    server.close()
+
+
+def test_get_variable_is_lazy(fake_dap_state):
+    state, fake_server = fake_dap_state
+    output = cmakedbg.parse_command(state, ["get", "var", "FOO"])
+    assert output.getvalue() == "FOO=local\n"
+    # the local hit means the cache and directory containers are never fetched
+    assert fake_server.commands() == [("scopes", None), ("variables", 1), ("variables", 4)]
+    output = cmakedbg.parse_command(state, ["get", "var", "CMAKE_BUILD_TYPE"])
+    assert output.getvalue() == "CMAKE_BUILD_TYPE=Release\n"
+    output = cmakedbg.parse_command(state, ["get", "var", "NOT_SET"])
+    assert output.getvalue() == "NOT_SET=\n"
+    assert len(fake_server.requests) == 5
+
+
+def test_all_variables_memoized_per_stop(fake_dap_state):
+    state, fake_server = fake_dap_state
+    all_vars = cmakedbg.get_all_variables(state)
+    assert all_vars["FOO"] == "local"
+    assert all_vars["CMAKE_CURRENT_SOURCE_DIR"] == "/src"
+    cmakedbg.parse_command(state, ["info", "vars"])
+    cmakedbg.parse_command(state, ["get", "var", "FOO"])
+    assert len(fake_server.requests) == 5
+    # a new stop drops everything fetched for the previous one
+    cmakedbg.reset_variables(state, 1)
+    assert state.frame_cache == {}
+    cmakedbg.get_variable(state, "FOO")
+    assert len(fake_server.requests) == 8
+
+
+def test_info_changed_and_watch(fake_dap_state):
+    state, fake_server = fake_dap_state
+    output = cmakedbg.parse_command(state, ["info", "changed"])
+    assert "No earlier snapshot" in output.getvalue()
+    cmakedbg.parse_command(state, ["watch", "FOO"])
+    assert state.watches == {"FOO": "local"}
+    assert cmakedbg.check_watches(state) is None
+
+    fake_server.variables = dict(fake_server.variables)
+    fake_server.variables[4] = [{"name": "FOO", "value": "changed", "variablesReference": 0}]
+    cmakedbg.reset_variables(state, 1)
+    output = cmakedbg.check_watches(state)
+    assert output.getvalue() == "Watchpoint FOO: 'local' -> 'changed'\n"
+    output = cmakedbg.parse_command(state, ["info", "changed"])
+    assert output.getvalue() == f"Changed since stop {state.stop_id - 1}:\n  FOO: 'local' -> 'changed'\n"
+    # with watches set, continue single steps so every stop can be checked
+    assert cmakedbg.parse_command(state, ["c"]) == (cmakedbg.step_into, [])
+    cmakedbg.parse_command(state, ["unwatch", "FOO"])
+    assert cmakedbg.parse_command(state, ["c"]) == (cmakedbg.dbg_continue, [])
+
+
+def test_find_variables(fake_dap_state):
+    state, fake_server = fake_dap_state
+
+    def run(command):
+        return cmakedbg.output_text(cmakedbg.parse_command(state, command))
+
+    assert run(["info", "vars"]) == (
+        "CMAKE_BUILD_TYPE=Release\nCMAKE_CURRENT_SOURCE_DIR=/src\nCacheVariables=\n"
+        "Directories=\nFOO=local\nLocals=\n")
+    assert run(["info", "vars", "CMAKE_*"]) == "CMAKE_BUILD_TYPE=Release\nCMAKE_CURRENT_SOURCE_DIR=/src\n"
+    assert run(["info", "vars", "-r", "DIR$|^FO"]) == "CMAKE_CURRENT_SOURCE_DIR=/src\nFOO=local\n"
+    assert run(["search", "value", "Rel"]) == "CMAKE_BUILD_TYPE=Release\n"
+    assert "invalid regex" in run(["info", "vars", "-r", "("])
+    assert len(fake_server.requests) == 5
+    # a command that resumes cmake has no output
+    assert cmakedbg.output_text((cmakedbg.dbg_next, [])) == ""
+
+
+def test_output_is_streamed_to_the_shell(tmp_path):
+    state = cmakedbg.DebuggerState()
+    produced = 0
+
+    def lines():
+        nonlocal produced
+        for i in range(1_000_000):
+            produced = produced + 1
+            yield f"VAR_{i}=value\n"
+
+    state.shell_command = f"head -n 2 > {tmp_path / 'out'}"
+    cmakedbg.pipe_to_shell_or_print(state, lines())
+    assert (tmp_path / "out").read_text() == "VAR_0=value\nVAR_1=value\n"
+    # once head exits, nothing more is formatted
+    assert produced < 100_000
+    assert state.shell_command == ""
+
+
+def test_expect_variable(fake_dap_state):
+    state, fake_server = fake_dap_state
+    output = cmakedbg.parse_command(state, ["expect", "var", "CMAKE_BUILD_TYPE", "Release"])
+    assert output.getvalue() == "CMAKE_BUILD_TYPE=Release\n"
+    assert state.command_failed is False
+    output = cmakedbg.parse_command(state, ["expect", "var", "FOO", "cached"])
+    assert output.getvalue() == "Expected FOO='cached', got 'local'\n"
+    assert state.command_failed is True
+
+
+def test_batch_commands(fake_dap_state, tmp_path):
+    state, fake_server = fake_dap_state
+    script = tmp_path / "script.dbg"
+    script.write_text("# comment\n\nget var FOO\n  bogus command  \nnext\n")
+    state.command_queue.extend(cmakedbg.read_command_file(str(script)))
+    state.batch = True
+    state.json_output = io.StringIO()
+    assert cmakedbg.process_user_input(state) == (cmakedbg.dbg_next, [])
+    records = [json.loads(line) for line in state.json_output.getvalue().splitlines()]
+    assert records == [
+        {"command": "get var FOO", "output": "FOO=local\n", "failed": False},
+        {"command": "bogus command", "output": "Unknown command\n", "failed": True},
+        {"command": "next", "output": "", "failed": False},
+    ]
+    assert state.failed_commands == 1
+
+
+def test_conditional_breakpoints(fake_dap_state, tmp_path):
+    state, fake_server = fake_dap_state
+    cmakelists = tmp_path / "CMakeLists.txt"
+    cmakelists.write_text("message(1)\nmessage(2)\nmessage(3)\n")
+    fake_server.stack_frames = [{"id": 1, "line": 3, "source": {"path": str(cmakelists)}}]
+    output = cmakedbg.parse_command(state, ["br", f"{cmakelists}:3", "if", "FOO", "STREQUAL", '"other"'])
+    assert output.getvalue() == f"Breakpoint 1 at {cmakelists}:3\n"
+    output = cmakedbg.parse_command(state, ["info", "breakpoints"])
+    assert output.getvalue() == f'1: {cmakelists}:3 if FOO STREQUAL "other" [pending]\n'
+    cmakedbg.sync_breakpoints(state)
+    # cmake doesn't advertise conditional breakpoints, so the condition stays here
+    assert fake_server.requests[-1]["arguments"]["breakpoints"] == [{"line": 3}]
+
+    fake_server.requests.clear()
+    cmakedbg.handle_stopped(state, "breakpoint")
+    # only Locals was needed to see that the condition is false (an unquoted
+    # other could be a variable name, and would be looked up everywhere)
+    assert fake_server.commands() == [
+        ("stackTrace", None), ("scopes", None), ("variables", 1), ("variables", 4), ("continue", None)]
+
+    cmakedbg.parse_command(state, ["br", f"{cmakelists}:3", "hits", "2"])
+    state.batch = True
+    state.json_output = io.StringIO()
+    state.command_queue.extend([["next"], ["next"]])
+    fake_server.requests.clear()
+    cmakedbg.handle_stopped(state, "breakpoint")
+    assert fake_server.commands()[-1] == ("continue", None)
+    cmakedbg.handle_stopped(state, "breakpoint")
+    assert fake_server.commands()[-1] == ("next", None)
+    # stepping onto the line doesn't count as a hit
+    cmakedbg.handle_stopped(state, "step")
+    assert state.breakpoints.find(str(cmakelists), 3).hit_count == 2
+
+    output = cmakedbg.parse_command(state, ["br", f"{cmakelists}:3", "hits", "x"])
+    assert "hit count should be" in output.getvalue()
+    output = cmakedbg.parse_command(state, ["br", f"{cmakelists}:3", "if", "FOO", "STREQUAL"])
+    assert "Invalid condition" in output.getvalue()
+    output = cmakedbg.parse_command(state, ["br", f"{cmakelists}:2", "if", "FOO", "MATCHES", '"("'])
+    assert "bad regex" in output.getvalue() and state.command_failed
+    assert state.breakpoints.find(str(cmakelists), 2) is None
+
+    # a bad pattern from a variable stops there, like cmake's if() would
+    cmakedbg.parse_command(state, ["delete"])
+    cmakedbg.parse_command(state, ["br", f"{cmakelists}:3", "if", "CMAKE_BUILD_TYPE", "MATCHES", "FOO"])
+    fake_server.variables = {
+        **fake_server.variables,
+        4: [{"name": "FOO", "value": "(", "variablesReference": 0}],
+    }
+    state.json_output = io.StringIO()
+    state.command_queue.append(["next"])
+    fake_server.requests.clear()
+    cmakedbg.handle_stopped(state, "breakpoint")
+    assert fake_server.commands()[-1] == ("next", None)
+    event = json.loads(state.json_output.getvalue().splitlines()[0])
+    assert event["event"] == "condition" and "bad regex" in event["output"]
+
+
+def test_breakpoint_manager(fake_dap_state, tmp_path):
+    state, fake_server = fake_dap_state
+    files = [tmp_path / "CMakeLists.txt", tmp_path / "other.cmake"]
+    for path in files:
+        path.write_text("message(1)\n" * 500)
+    script = tmp_path / "breakpoints.dbg"
+    script.write_text("".join(f"br {path}:{line}\n" for path in files for line in range(1, 301)))
+    state.command_queue.append(["next"])
+    cmakedbg.parse_command(state, ["source", str(script)])
+    state.batch = True
+    state.json_output = io.StringIO()
+    fake_server.requests.clear()
+    cmakedbg.run_user_commands(state)
+    # 600 breakpoints, one request per file, and none of them dropped
+    assert [r["command"] for r in fake_server.requests] == ["setBreakpoints", "setBreakpoints", "next"]
+    assert [len(r["arguments"]["breakpoints"]) for r in fake_server.requests[:2]] == [300, 300]
+    assert len(state.breakpoints) == 600
+    unverified = [bp.linenum for bp in state.breakpoints if not bp.verified]
+    assert unverified == [2, 2]
+
+    bp = state.breakpoints.find(str(files[0]), 2)
+    cmakedbg.parse_command(state, ["delete", "1", "3"])
+    cmakedbg.parse_command(state, ["disable", str(bp.number)])
+    assert "[disabled]" in str(bp)
+    output = cmakedbg.parse_command(state, ["delete", "12345"])
+    assert "no breakpoint number 12345" in output.getvalue()
+    # only the file whose breakpoints changed is sent again
+    fake_server.requests.clear()
+    cmakedbg.sync_breakpoints(state)
+    assert len(fake_server.requests) == 1
+    assert [b["line"] for b in fake_server.requests[0]["arguments"]["breakpoints"]][:3] == [4, 5, 6]
+
+    state.breakpoints.update_from_event({"id": bp.dap_id, "verified": True, "line": 2})
+    assert bp.verified
+    cmakedbg.parse_command(state, ["delete"])
+    assert len(state.breakpoints) == 0
+    assert [path for path, _, dap_bps in state.breakpoints.pending_requests({})] == [
+        str(path) for path in files]
+
+
+def test_list_command(tmp_path):
+    cmakelists = tmp_path / "CMakeLists.txt"
+    cmakelists.write_text("".join(f"message({i})\n" for i in range(1, 26)))
+    state = cmakedbg.DebuggerState()
+    output = cmakedbg.output_text(cmakedbg.parse_command(state, ["list"]))
+    assert "has not started running" in output
+
+    state.current_line = (str(cmakelists), 8)
+    assert cmakedbg.print_listing(str(cmakelists), 8, state.source_cache) == (
+        f"{cmakelists}:\n   6: message(6)\n   7: message(7)\n-> 8: message(8)\n"
+        "   9: message(9)\n   10: message(10)\n")
+
+    def listed(command):
+        output = cmakedbg.output_text(cmakedbg.parse_command(state, command)).splitlines()
+        return [int(line[3:].split(":")[0]) for line in output[1:]]
+
+    assert listed(["list"]) == list(range(3, 13))
+    assert listed(["list"]) == list(range(13, 23))
+    # an empty line repeats the last command, which carries on from there
+    state.last_command = ["list"]
+    assert listed([]) == [23, 24, 25]
+    assert "out of range" in cmakedbg.output_text(cmakedbg.parse_command(state, ["list"]))
+    assert listed(["list", "20"]) == list(range(15, 25))
+    assert listed(["list", "-"]) == list(range(5, 15))
+    assert listed(["list", "2,4"]) == [2, 3, 4]
+    assert listed(["l", f"{cmakelists}:1"]) == list(range(1, 11))
+    assert "-> 8: message(8)" in cmakedbg.output_text(cmakedbg.parse_command(state, ["list", "8"]))
+    output = cmakedbg.output_text(cmakedbg.parse_command(state, ["list", "x,y"]))
+    assert "invalid line specification" in output
+    assert state.command_failed
+
+
+def test_frame_navigation(tmp_path):
+    cmakelists = tmp_path / "CMakeLists.txt"
+    cmakelists.write_text("".join(f"message({i})\n" for i in range(1, 11)))
+    (tmp_path / "functions.cmake").write_text("function(my_function)\n  set(X 1)\nendfunction()\n")
+    mock = MockCMake(synthetic_program(10, str(cmakelists)))
+    client, server = socket.socketpair()
+    mock.start(server)
+    session = SyncSession(client)
+    state = cmakedbg.DebuggerState(session=session, already_running=True)
+    try:
+        session.request(cmakedbg.set_breakpoints, str(tmp_path / "functions.cmake"), 2)
+        session.request(cmakedbg.configuration_done)
+        while session.next_event()["event"] != "stopped":
+            pass
+        body_json = session.request(cmakedbg.stacktrace)
+        state.stacktrace = [cmakedbg.Frame.from_dap(frame) for frame in body_json["body"]["stackFrames"]]
+        state.current_line = (state.stacktrace[0].path, state.stacktrace[0].line)
+        cmakedbg.reset_variables(state, state.stacktrace[0].id)
+
+        def run(command):
+            return cmakedbg.output_text(cmakedbg.parse_command(state, command))
+
+        assert run(["get", "var", "CMAKE_CURRENT_LIST_LINE"]) == "CMAKE_CURRENT_LIST_LINE=2\n"
+        output = run(["up"])
+        assert output.startswith(f"#1   my_function at {cmakelists}:4\n{cmakelists}:\n")
+        assert "-> 4: message(4)" in output
+        assert run(["get", "var", "CMAKE_CURRENT_LIST_LINE"]) == "CMAKE_CURRENT_LIST_LINE=4\n"
+        assert run(["get", "var", "Directories.CMAKE_CURRENT_LIST_FILE"]) == (
+            f"Directories.CMAKE_CURRENT_LIST_FILE={cmakelists}\n")
+        assert run(["get", "var", "Locals.CMAKE_CURRENT_LIST_FILE"]) == (
+            "Locals.CMAKE_CURRENT_LIST_FILE=\n")
+        assert "CMAKE_CURRENT_LIST_LINE=4\n" in run(["info", "vars"])
+        assert run(["info", "vars", "CMAKE_CURRENT_LIST_L*"]) == "CMAKE_CURRENT_LIST_LINE=4\n"
+        assert run(["bt"]).splitlines()[1].startswith("*#1")
+        assert "-> 4: message(4)" in run(["list"])
+        assert "Initial frame selected" in run(["up"])
+
+        # going back to a frame already looked at costs no requests
+        requests = len(mock.requests)
+        assert run(["down"]).startswith(f"#0   set at {tmp_path / 'functions.cmake'}:2\n")
+        assert run(["get", "var", "CMAKE_CURRENT_LIST_LINE"]) == "CMAKE_CURRENT_LIST_LINE=2\n"
+        run(["frame", "1"])
+        assert run(["get", "var", "CMAKE_CURRENT_LIST_LINE"]) == "CMAKE_CURRENT_LIST_LINE=4\n"
+        assert len(mock.requests) == requests
+        assert "Bottom (innermost) frame selected" in run(["down", "2"])
+        assert "no frame #5" in run(["frame", "5"])
+        assert run(["frame"]).startswith("#1 ")
+
+        # the innermost frame is the one the variable history follows
+        assert state.variable_history.newest is None
+        cmakedbg.get_all_variables(state, state.frame_id)
+        assert state.variable_history.newest == state.stop_id
+
+        cmakedbg.invalidate_frames(state)
+        assert state.frame_cache == {}
+    finally:
+        session.close()
+        client.close()
+        server.close()
+
+
 # each function executes in sequence
 # TODO: add piece that will run these tests on different CMakeLists from the cmake example
 # collection.
+@pytest.mark.xdist_group("commands")
 class TestCommands:
-    def test_initialize(self, debugger_state, cmake_dap_socket, cmake_background_process):
+    def test_initialize(self, debugger_state, dap_session, cmake_background_process):
         debugger_state.cmake_process_handle = cmake_background_process
-        cmakedbg.send_request(cmake_dap_socket, cmakedbg.initialize)
-        body_json, debugger_state.response = cmakedbg.recv_response(cmake_dap_socket,
-                                                                    debugger_state.response)
+        body_json = dap_session.request(cmakedbg.initialize)
         assert (body_json["type"], body_json["command"]) == ("response", "initialize")
-        body_json, debugger_state.response = cmakedbg.recv_response(
-            cmake_dap_socket, debugger_state.response)
+        body_json = dap_session.next_event()
         assert (body_json["type"], body_json["event"]) == ("event", "initialized")
 
-    def test_set_breakpoints(self, debugger_state, cmake_dap_socket):
-        filepath, linenum = cmakedbg.validate_filepath_and_linenum("../CMakeLists.txt:6")
-        cmakedbg.send_request(cmake_dap_socket, cmakedbg.set_breakpoints,
-                              filepath, linenum)
-        body_json, debugger_state.response = cmakedbg.recv_response(cmake_dap_socket,
-                                                                    debugger_state.response)
+    def test_set_breakpoints(self, debugger_state, dap_session):
+        filepath, linenum = cmakedbg.validate_filepath_and_linenum(f"{MPI_EXAMPLE}/CMakeLists.txt:6")
+        body_json = dap_session.request(cmakedbg.set_breakpoints, filepath, linenum)
         assert (body_json["type"], body_json["command"]) == ("response", "setBreakpoints")
 
-    def test_configuration_done(self, debugger_state, cmake_dap_socket):
-        cmakedbg.send_request(cmake_dap_socket, cmakedbg.configuration_done)
-        body_json, debugger_state.response = cmakedbg.recv_response(
-            cmake_dap_socket, debugger_state.response)
+    def test_configuration_done(self, debugger_state, dap_session):
+        body_json = dap_session.request(cmakedbg.configuration_done)
         assert (body_json["type"], body_json["command"]) == ("response", "configurationDone")
 
-    def test_stop_at_first_breakpoint(self, debugger_state, cmake_dap_socket):
-        body_json, debugger_state.response = cmakedbg.recv_response(cmake_dap_socket,
-                                                                    debugger_state.response)
+    def test_stop_at_first_breakpoint(self, debugger_state, dap_session):
+        body_json = dap_session.next_event()
         assert (body_json["type"],
                 body_json["event"],
                 body_json["body"]["reason"]) == ("event",
                                                  "thread",
                                                  "started")
-        body_json, debugger_state.response = cmakedbg.recv_response(
-            cmake_dap_socket, debugger_state.response)
+        body_json = dap_session.next_event()
         assert (body_json["type"],
                 body_json["event"],
                 body_json["body"]["reason"],
                 body_json["body"]["breakpoint"]["verified"]) == ("event", "breakpoint", "changed", True)
-        body_json, debugger_state.response = cmakedbg.recv_response(
-            cmake_dap_socket, debugger_state.response)
+        body_json = dap_session.next_event()
         assert (body_json["type"],
                 body_json["event"],
                 body_json["body"]["reason"]) == ("event",
                                                  "stopped",
                                                  "breakpoint")
 
-    def test_get_breakpoints(self, debugger_state, cmake_dap_socket):
+    def test_get_breakpoints(self, debugger_state, dap_session):
         # cmake hasn't implemented the 'breakpointLocations' handler yet
         pass
 
-    def test_get_variables(self, debugger_state, cmake_dap_socket):
-        cmakedbg.send_request(cmake_dap_socket, cmakedbg.stacktrace)
-        body_json, debugger_state.response = cmakedbg.recv_response(cmake_dap_socket,
-                                                                    debugger_state.response)
-        # TODO: complete this
+    def test_get_variables(self, debugger_state, dap_session):
+        body_json = dap_session.request(cmakedbg.stacktrace)
+        frames = [cmakedbg.Frame.from_dap(frame) for frame in body_json["body"]["stackFrames"]]
+        debugger_state.session = dap_session
+        debugger_state.already_running = True
+        debugger_state.stacktrace = frames
+        cmakedbg.reset_variables(debugger_state, frames[0].id)
+        assert cmakedbg.get_variable(debugger_state, "PROJECT_NAME") == "MY_PROJECT"
+        assert "CMAKE_C_COMPILER" in cmakedbg.get_all_variables(debugger_state)
 
-    def test_get_source(self, debugger_state, cmake_dap_socket):
-        # TODO: complete this
-        pass
+    def test_get_source(self, debugger_state, dap_session):
+        frame = debugger_state.stacktrace[0]
+        filepath, linenum = cmakedbg.validate_filepath_and_linenum(f"{MPI_EXAMPLE}/CMakeLists.txt:6")
+        assert (frame.path, frame.line) == (filepath, linenum)
+        debugger_state.current_line = (frame.path, frame.line)
+        output = cmakedbg.output_text(cmakedbg.parse_command(debugger_state, ["list"]))
+        assert "-> 6: message(STATUS “Configuring src2”)" in output
 
 
 
@@ -0,0 +1,38 @@
+from cmakedbg import codec, transport
+import pytest
+
+MESSAGE = {
+    "seq": 3,
+    "type": "response",
+    "body": {"variables": [{"name": "Ä", "value": "a;b"}]},
+}
+
+
+def available_codecs():
+    codecs = []
+    for name in codec.CODECS:
+        try:
+            codecs.append(codec.get_codec(name))
+        except ImportError:
+            pass
+    return codecs
+
+
+@pytest.mark.parametrize("json_codec", available_codecs(), ids=repr)
+def test_decode_from_frame_views(json_codec):
+    decoder = transport.FrameDecoder()
+    decoder.feed(transport.create_request(dict(MESSAGE), 7, json_codec))
+    body = decoder.next_frame()
+    assert isinstance(body, memoryview)
+    assert json_codec.decode(body) == {**MESSAGE, "seq": 7, "type": "request"}
+    # every codec reads what the others write
+    assert codec.STDLIB_CODEC.decode(json_codec.encode(MESSAGE)) == MESSAGE
+
+
+def test_codec_selection(monkeypatch):
+    assert codec.get_codec("json") is codec.STDLIB_CODEC
+    assert codec.get_codec().name in codec.CODECS
+    monkeypatch.setenv(codec.CODEC_ENV, "json")
+    assert codec.default_codec() is codec.STDLIB_CODEC
+    with pytest.raises(ValueError):
+        codec.get_codec("yaml")
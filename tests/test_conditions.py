@@ -0,0 +1,121 @@
+import pytest
+
+from cmakedbg.conditions import Condition, hit_condition_met, validate_hit_condition
+
+VARIABLES = {
+    "CMAKE_BUILD_TYPE": "Release",
+    "ENABLE_MPI": "ON",
+    "EMPTY": "",
+    "MPI_LIB": "MPI_LIB-NOTFOUND",
+    "COUNT": "10",
+    "LANGUAGES": "C;CXX;Fortran",
+    "CMAKE_VERSION": "3.28.1",
+}
+
+
+def check(text):
+    return Condition(text).evaluate(VARIABLES.get)
+
+
+def test_truth():
+    assert check("ENABLE_MPI")
+    assert not check("EMPTY")
+    assert not check("MPI_LIB")
+    assert not check("UNSET")
+    assert check("CMAKE_BUILD_TYPE")
+    assert check("1") and not check("OFF")
+    assert not check('"CMAKE_BUILD_TYPE"')
+
+
+def test_comparisons():
+    assert check("CMAKE_BUILD_TYPE STREQUAL Release")
+    assert check('CMAKE_BUILD_TYPE STREQUAL "Release"')
+    assert not check('"CMAKE_BUILD_TYPE" STREQUAL Release')
+    assert check("CMAKE_BUILD_TYPE MATCHES ^Rel")
+    assert (
+        check("COUNT EQUAL 10")
+        and check("COUNT GREATER 9")
+        and check("COUNT LESS_EQUAL 10")
+    )
+    assert not check("CMAKE_BUILD_TYPE LESS 3")
+    assert check("CMAKE_VERSION VERSION_GREATER 3.27") and check(
+        "3.28.1.0 VERSION_EQUAL CMAKE_VERSION"
+    )
+    assert check("CMAKE_VERSION VERSION_GREATER_EQUAL 3.28.1") and check(
+        "CMAKE_VERSION VERSION_LESS_EQUAL 3.29"
+    )
+    assert not check("CMAKE_VERSION VERSION_GREATER_EQUAL 3.29")
+    assert check("CMAKE_BUILD_TYPE STRLESS_EQUAL Release") and check(
+        "CMAKE_BUILD_TYPE STRGREATER_EQUAL Debug"
+    )
+    assert not check("CMAKE_BUILD_TYPE STRLESS_EQUAL Debug")
+    assert check("CXX IN_LIST LANGUAGES") and not check("CUDA IN_LIST LANGUAGES")
+
+
+def test_logic():
+    assert check("DEFINED EMPTY AND NOT DEFINED UNSET")
+    assert check("UNSET OR ENABLE_MPI")
+    assert not check("NOT (UNSET OR ENABLE_MPI)")
+    # NOT binds tighter than AND, which binds tighter than OR
+    assert check("ENABLE_MPI OR UNSET AND UNSET")
+    assert not check("NOT ENABLE_MPI AND ENABLE_MPI")
+
+
+def test_only_referenced_variables_are_looked_up():
+    looked_up = []
+
+    def lookup(name):
+        looked_up.append(name)
+        return VARIABLES.get(name)
+
+    condition = Condition("CMAKE_BUILD_TYPE STREQUAL Debug OR COUNT EQUAL 10")
+    assert condition.evaluate(lookup)
+    assert looked_up == ["CMAKE_BUILD_TYPE", "Debug", "COUNT", "10"]
+    looked_up.clear()
+    # OR stops at the first true operand
+    Condition("ENABLE_MPI OR COUNT").evaluate(lookup)
+    assert looked_up == ["ENABLE_MPI"]
+
+
+@pytest.mark.parametrize("text", ["", "AND", "(FOO", "FOO STREQUAL", "FOO BAR", "FOO)"])
+def test_invalid_conditions(text):
+    with pytest.raises(ValueError):
+        Condition(text)
+
+
+def test_bad_regex():
+    # a literal pattern is rejected up front, one from a variable when used
+    with pytest.raises(ValueError, match="bad regex"):
+        Condition('CMAKE_BUILD_TYPE MATCHES "("')
+    condition = Condition("CMAKE_BUILD_TYPE MATCHES PATTERN")
+    with pytest.raises(ValueError, match="bad regex"):
+        condition.evaluate({**VARIABLES, "PATTERN": "("}.get)
+
+
+def test_hit_conditions():
+    assert [hit_condition_met("3", n) for n in range(1, 5)] == [
+        False,
+        False,
+        True,
+        True,
+    ]
+    assert [hit_condition_met("==3", n) for n in range(1, 5)] == [
+        False,
+        False,
+        True,
+        False,
+    ]
+    assert [hit_condition_met(">3", n) for n in range(1, 5)] == [
+        False,
+        False,
+        False,
+        True,
+    ]
+    assert [hit_condition_met("%2", n) for n in range(1, 5)] == [
+        False,
+        True,
+        False,
+        True,
+    ]
+    with pytest.raises(ValueError):
+        validate_hit_condition("three")
@@ -0,0 +1,72 @@
+from cmakedbg import debugger as cmakedbg
+from cmakedbg.history import StopHistory
+
+
+def test_ring_buffer():
+    history = StopHistory(capacity=100)
+    assert history.oldest() is None
+    assert history.last(5) == []
+    for stop_id in range(1, 251):
+        history.record(
+            stop_id, f"/src/file{stop_id % 3}.cmake", stop_id % 7, stop_id % 4
+        )
+    assert (len(history), history.count) == (100, 250)
+    assert history.oldest() == 151
+    assert [stop.stop_id for stop in history.last(3)] == [248, 249, 250]
+    assert history.last(1000)[0].stop_id == 151
+    stop = history.find(200)
+    assert (stop.path, stop.line, stop.depth) == ("/src/file2.cmake", 4, 0)
+    assert history.find(150) is None
+    assert history.find(251) is None
+    # the paths are stored once
+    assert history.files == ["/src/file1.cmake", "/src/file2.cmake", "/src/file0.cmake"]
+    assert history.nbytes() == 100 * 22
+    # visits are counted for the whole session, not only what the ring holds
+    assert history.last_visit("/src/file1.cmake", 1) == (232, 12)
+    assert history.last_visit("/src/file1.cmake", 100) is None
+    assert history.last_visit("/src/other.cmake", 1) is None
+
+
+def test_variable_changes():
+    history = StopHistory(capacity=10)
+    for stop_id in range(1, 51):
+        history.record(stop_id, "/src/CMakeLists.txt", stop_id, 1)
+        if stop_id % 2 == 0:
+            history.record_changes(stop_id, {"FOO": (str(stop_id - 2), str(stop_id))})
+    history.record_changes(50, {"BAR": (None, "1")})
+    assert history.last_change("FOO") == (50, "48", "50")
+    assert history.last_change("BAR") == (50, None, "1")
+    assert history.last_change("BAZ") is None
+    assert history.changed_at("FOO") == [42, 44, 46, 48, 50]
+    # the stops older than the ring are dropped from the index as it grows
+    assert len(history._changed_at["FOO"]) <= 2 * history.capacity + 1
+
+
+def test_history_commands(tmp_path):
+    cmakelists = tmp_path / "CMakeLists.txt"
+    cmakelists.write_text("project(p)\nset(FOO 1)\nset(FOO 2)\n")
+    state = cmakedbg.DebuggerState()
+
+    def run(command):
+        return cmakedbg.output_text(cmakedbg.parse_command(state, command))
+
+    assert run(["history"]) == "No stops yet\n"
+    for stop_id, line in enumerate([1, 2, 3, 2], 1):
+        state.stop_history.record(stop_id, str(cmakelists), line, 1)
+    state.stop_history.record_changes(3, {"FOO": ("1", "2")})
+
+    output = run(["history", "2"]).splitlines()
+    assert output[0].split() == ["stop", "time", "depth", "location"]
+    assert [line.split()[0] for line in output[1:]] == ["3", "4"]
+    assert output[2].endswith(f"{cmakelists}:2")
+    assert run(["where-was", f"{cmakelists}:2"]) == (
+        f"Last stopped at {cmakelists}:2 in stop 4 (2 stops there in all)\n"
+    )
+    assert "has not been stopped at" in run(["where-was", f"{cmakelists}:9"])
+    assert "not a valid file" in run(["where-was", str(tmp_path / "missing.cmake")])
+    assert (
+        run(["last-set", "FOO"])
+        == f"FOO last seen changing at stop 3, {cmakelists}:3: '1' -> '2'\n"
+    )
+    assert "No change of BAR seen" in run(["last-set", "BAR"])
+    assert "invalid number" in run(["history", "x"])
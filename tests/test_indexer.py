@@ -0,0 +1,173 @@
+from cmakedbg import debugger as cmakedbg
+from cmakedbg import indexer
+import re
+import pytest
+
+HELPERS = """# helpers
+function(add_component NAME)  # a comment (with parentheses
+  #[[ set(COMMENTED_OUT 1)
+  endfunction() ]]
+  add_library(${NAME} "${NAME}.c" [[bracket ) argument]])
+endfunction()
+
+MACRO(
+    "setup_flags")
+  set(FLAGS "-O2 \\" (")
+ENDMACRO()
+"""
+
+TOP = """project(p)
+include(helpers.cmake)
+add_component(foo)
+add_library(bar
+  bar.c)
+setup_flags()
+"""
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "CMakeLists.txt").write_text(TOP)
+    (tmp_path / "helpers.cmake").write_text(HELPERS)
+    # generated by cmake, not indexed
+    (tmp_path / "build" / "CMakeFiles").mkdir(parents=True)
+    (tmp_path / "build" / "CMakeFiles" / "generated.cmake").write_text(
+        "function(generated)\nendfunction()\n"
+    )
+    return tmp_path
+
+
+def test_scan():
+    definitions, calls = indexer.scan(HELPERS)
+    assert definitions == [
+        ["function", "add_component", 2, 5],
+        ["macro", "setup_flags", 8, 10],
+    ]
+    assert calls == {
+        "function": [2],
+        "add_library": [5],
+        "endfunction": [6],
+        "macro": [8],
+        "set": [10],
+        "endmacro": [11],
+    }
+    definitions, calls = indexer.scan(TOP)
+    assert definitions == []
+    assert calls["add_library"] == [4]
+    assert calls["setup_flags"] == [6]
+
+
+def test_index_update(project, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("cache") / "index.json")
+    index = indexer.ListfileIndex(path)
+    assert index.update([str(project)]) == 2
+    assert [str(definition) for definition in index.functions()] == [
+        f"function add_component at {project}/helpers.cmake:2",
+        f"macro setup_flags at {project}/helpers.cmake:8",
+    ]
+    assert [definition.name for definition in index.functions(re.compile("flag"))] == [
+        "setup_flags"
+    ]
+    assert index.definitions("SETUP_FLAGS")[0].body_line == 10
+    assert index.calls("add_library") == {
+        f"{project}/CMakeLists.txt": [4],
+        f"{project}/helpers.cmake": [5],
+    }
+
+    # nothing changed, so a new session scans nothing
+    index = indexer.ListfileIndex(path)
+    assert index.update([str(project)]) == 0
+    assert len(index.functions()) == 2
+    (project / "CMakeLists.txt").write_text(TOP + "function(late)\nendfunction()\n")
+    (project / "helpers.cmake").unlink()
+    assert index.update([str(project)]) == 1
+    assert [definition.name for definition in index.functions()] == ["late"]
+    saved = indexer.ListfileIndex(path)
+    saved.load()
+    assert list(saved.files) == [f"{project}/CMakeLists.txt"]
+
+
+def test_index_pool(tmp_path, monkeypatch):
+    for i in range(40):
+        (tmp_path / f"module{i}.cmake").write_text(
+            f"function(f{i})\n  message({i})\nendfunction()\n"
+        )
+    monkeypatch.setattr(indexer, "POOL_THRESHOLD", 10)
+    monkeypatch.setattr(indexer, "CHUNK_SIZE", 8)
+    index = indexer.ListfileIndex()
+    assert index.update([str(tmp_path)], jobs=2) == 40
+    assert len(index.functions()) == 40
+    assert index.definitions("f7")[0].body_line == 2
+
+
+def test_source_dir(tmp_path):
+    build = tmp_path / "build"
+    build.mkdir()
+    assert indexer.source_dir(["cmake", "-S", str(tmp_path), "-B", str(build)]) == str(
+        tmp_path
+    )
+    assert indexer.source_dir(["cmake", "-G", "Ninja", f"-S{tmp_path}"]) == str(
+        tmp_path
+    )
+    assert indexer.source_dir(["cmake", "-DX=1", str(tmp_path)]) == str(tmp_path)
+    (build / "CMakeCache.txt").write_text(f"CMAKE_HOME_DIRECTORY:INTERNAL={tmp_path}\n")
+    assert indexer.source_dir(["cmake", str(build)]) == str(tmp_path)
+
+
+def test_function_breakpoints(project, monkeypatch):
+    monkeypatch.setattr(cmakedbg, "module_dirs", lambda: [])
+    state = cmakedbg.DebuggerState(
+        listfile_index=indexer.ListfileIndex(), source_dir=str(project)
+    )
+    output = cmakedbg.parse_command(
+        state, ["br", "add_component", "if", "NAME", "STREQUAL", "foo"]
+    )
+    assert output.getvalue() == f"Breakpoint 1 at {project}/helpers.cmake:5\n"
+    assert next(iter(state.breakpoints)).condition.text == "NAME STREQUAL foo"
+    output = cmakedbg.parse_command(state, ["br", "-call", "ADD_LIBRARY", "hits", "2"])
+    assert output.getvalue().splitlines() == [
+        f"Breakpoint 2 at {project}/CMakeLists.txt:4",
+        # already a breakpoint, which is replaced
+        f"Breakpoint 1 at {project}/helpers.cmake:5",
+    ]
+    # both files in one batch of setBreakpoints
+    assert len(state.breakpoints.pending_requests({})) == 2
+    assert not state.command_failed
+
+    output = cmakedbg.parse_command(state, ["br", "no_such_function"])
+    assert (
+        "neither a file nor a function or macro in the 2 listfiles" in output.getvalue()
+    )
+    assert state.command_failed
+    output = cmakedbg.parse_command(state, ["br", "-call"])
+    assert "needs the name of a command" in output.getvalue()
+
+    # a file is still a file
+    monkeypatch.chdir(project)
+    output = cmakedbg.parse_command(state, ["br", "CMakeLists.txt"])
+    assert output.getvalue() == f"Breakpoint 3 at {project}/CMakeLists.txt:1\n"
+
+
+def test_info_functions(project, monkeypatch):
+    monkeypatch.setattr(cmakedbg, "module_dirs", lambda: [])
+    state = cmakedbg.DebuggerState(
+        listfile_index=indexer.ListfileIndex(), source_dir=str(project)
+    )
+    lines = cmakedbg.parse_command(state, ["info", "functions"]).getvalue().splitlines()
+    assert [line.split()[:2] for line in lines] == [
+        ["function", "add_component"],
+        ["macro", "setup_flags"],
+    ]
+    output = cmakedbg.parse_command(state, ["info", "functions", "^add_"])
+    assert output.getvalue().split() == [
+        "function",
+        "add_component",
+        f"{project}/helpers.cmake:2",
+    ]
+    output = cmakedbg.parse_command(state, ["info", "functions", "nothing"])
+    assert (
+        output.getvalue()
+        == "No functions or macros matching 'nothing' in the 2 listfiles indexed\n"
+    )
+    output = cmakedbg.parse_command(state, ["info", "functions", "("])
+    assert "invalid regex" in output.getvalue()
@@ -0,0 +1,94 @@
+from cmakedbg import debugger as cmakedbg
+from cmakedbg import metrics
+from cmakedbg import mock_cmake
+from cmakedbg.session import SyncSession
+import socket
+import pytest
+
+
+@pytest.fixture
+def mock_session():
+    client, server = socket.socketpair()
+    mock_cmake.MockCMake(
+        mock_cmake.synthetic_program(10), cache=mock_cmake.synthetic_cache(100)
+    ).start(server)
+    session = SyncSession(client)
+    yield session
+    session.close()
+    client.close()
+    server.close()
+
+
+def test_buckets():
+    previous_high = 0
+    for index in range(200):
+        low, high = metrics.bucket_bounds(index)
+        assert low == previous_high
+        assert metrics.bucket_index(low) == index
+        assert metrics.bucket_index(high - 1) == index
+        # no bucket is wider than a quarter of its values
+        assert high - low <= max(1, low // metrics.SUB_BUCKETS)
+        previous_high = high
+
+
+def test_histogram_percentiles():
+    histogram = metrics.Histogram()
+    assert histogram.percentile(0.5) == 0.0
+    for value in range(1, 10001):
+        histogram.add(value)
+    assert histogram.count == 10000
+    assert (histogram.min, histogram.max) == (1, 10000)
+    assert histogram.percentile(0.5) == pytest.approx(5000, rel=0.15)
+    assert histogram.percentile(0.99) == pytest.approx(9900, rel=0.15)
+    assert histogram.percentile(1.0) <= 10000
+    assert histogram.to_dict(1000)["mean"] == pytest.approx(5.0005)
+
+
+def test_session_metrics(mock_session):
+    recorded = metrics.Metrics()
+    mock_session.set_metrics(recorded)
+    mock_session.request(cmakedbg.initialize)
+    mock_session.request(cmakedbg.set_breakpoints, "/mock/CMakeLists.txt", 3)
+    mock_session.request(cmakedbg.configuration_done)
+    while mock_session.next_event()["event"] != "stopped":
+        pass
+    mock_session.request(cmakedbg.stacktrace)
+    mock_session.request_many([(cmakedbg.variables, 5), (cmakedbg.variables, 7)])
+    mock_session.request(cmakedbg.pause)
+    stats = recorded.commands
+    assert stats["variables"].sent == stats["variables"].received == 2
+    assert stats["variables"].round_trip_ns.count == 2
+    assert stats["variables"].decode_ns.count == 2
+    assert stats["variables"].bytes_received > 100 * len("PROJECT_CACHE_VARIABLE_0")
+    assert stats["stackTrace"].failed == 0
+    assert stats["pause"].received == 1
+    assert stats["event stopped"].received == 1
+    assert stats["event stopped"].round_trip_ns.count == 0
+    # the bodies, and the headers on top of them
+    sent = sum(command.bytes_sent for command in stats.values())
+    assert sent + sum(command.sent for command in stats.values()) * len(
+        "Content-Length: 10\r\n\r\n"
+    ) == pytest.approx(mock_session.session.bytes_sent, abs=7)
+
+    mock_session.set_metrics(None)
+    mock_session.request(cmakedbg.stacktrace)
+    assert stats["stackTrace"].sent == 1
+    assert set(recorded.to_dict()["stackTrace"]) >= {"round_trip_ms", "decode_ms"}
+
+
+def test_stats_command(mock_session):
+    state = cmakedbg.DebuggerState()
+    state.session = mock_session
+    output = cmakedbg.parse_command(state, ["stats"])
+    assert "Statistics are off" in output.getvalue()
+    cmakedbg.parse_command(state, ["stats", "on"])
+    assert "No DAP requests" in cmakedbg.parse_command(state, ["stats"]).getvalue()
+    mock_session.request(cmakedbg.initialize)
+    mock_session.next_event()
+    report = list(cmakedbg.parse_command(state, ["stats"]))
+    assert report[0].split()[:3] == ["command", "count", "failed"]
+    assert report[1].split()[:4] == ["event", "initialized", "1", "0"]
+    assert report[2].split()[:3] == ["initialize", "1", "0"]
+    assert report[-1] == "(times in ms)\n"
+    cmakedbg.parse_command(state, ["stats", "reset"])
+    assert not state.metrics
@@ -0,0 +1,101 @@
+from cmakedbg import debugger as cmakedbg
+from cmakedbg import mock_cmake
+from cmakedbg.session import SyncSession
+import socket
+import pytest
+
+
+@pytest.fixture
+def mock_session():
+    sessions = []
+
+    def start(mock):
+        client, server = socket.socketpair()
+        mock.start(server)
+        session = SyncSession(client)
+        sessions.append((session, client, server))
+        session.request(cmakedbg.initialize)
+        assert session.next_event()["event"] == "initialized"
+        return session
+
+    yield start
+    for session, client, server in sessions:
+        session.close()
+        client.close()
+        server.close()
+
+
+def next_stop(session):
+    while (event := session.next_event())["event"] not in ("stopped", "terminated"):
+        pass
+    return event
+
+
+def current_line(session):
+    frames = session.request(cmakedbg.stacktrace)["body"]["stackFrames"]
+    return frames[0]["line"], len(frames)
+
+
+def test_stepping(mock_session):
+    # lines 4 and 8 call my_function, whose body is one line deeper
+    mock = mock_cmake.MockCMake(mock_cmake.synthetic_program(10))
+    session = mock_session(mock)
+    session.request(cmakedbg.set_breakpoints, "/mock/CMakeLists.txt", 3)
+    session.request(cmakedbg.configuration_done)
+    assert next_stop(session)["body"]["reason"] == "breakpoint"
+    assert current_line(session) == (3, 1)
+    session.request(cmakedbg.step_into)
+    assert next_stop(session)["body"]["reason"] == "step"
+    assert current_line(session) == (4, 1)
+    session.request(cmakedbg.step_into)
+    next_stop(session)
+    assert current_line(session) == (2, 2)
+    session.request(cmakedbg.dbg_next)
+    next_stop(session)
+    assert current_line(session) == (5, 1)
+    # next steps over the call on line 8
+    for line in (6, 7, 8, 9):
+        session.request(cmakedbg.dbg_next)
+        next_stop(session)
+        assert current_line(session) == (line, 1)
+    session.request(cmakedbg.dbg_continue)
+    assert next_stop(session)["event"] == "terminated"
+    assert session.request(cmakedbg.dbg_continue)["success"] is False
+
+
+def test_pause_and_unverified_breakpoints(mock_session):
+    mock = mock_cmake.MockCMake(mock_cmake.synthetic_program(10))
+    session = mock_session(mock)
+    body = session.request(cmakedbg.set_breakpoints, "/mock/CMakeLists.txt", 50)["body"]
+    assert body["breakpoints"][0]["verified"] is False
+    session.request(cmakedbg.pause)
+    session.request(cmakedbg.configuration_done)
+    assert next_stop(session)["body"]["reason"] == "pause"
+    assert current_line(session) == (1, 1)
+
+
+def test_large_variable_trees(mock_session):
+    mock = mock_cmake.MockCMake(
+        mock_cmake.synthetic_program(4),
+        cache=mock_cmake.synthetic_cache(100_000),
+        changes_every=1000,
+    )
+    session = mock_session(mock)
+    session.request(cmakedbg.pause)
+    session.request(cmakedbg.configuration_done)
+    next_stop(session)
+    state = cmakedbg.DebuggerState(session=session, already_running=True)
+    cmakedbg.reset_variables(state, 1)
+    all_vars = cmakedbg.get_all_variables(state)
+    assert (
+        all_vars["PROJECT_CACHE_VARIABLE_99999"]
+        == "/opt/toolchains/lib/cmake/pkg_99999"
+    )
+    assert all_vars["CMAKE_CURRENT_LIST_LINE"] == "1"
+    session.request(cmakedbg.step_into)
+    next_stop(session)
+    cmakedbg.reset_variables(state, 1)
+    cmakedbg.get_all_variables(state)
+    _, changes = state.variable_history.changes()
+    # every 1000th cache entry and the line number
+    assert len(changes) == 101
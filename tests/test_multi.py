@@ -0,0 +1,106 @@
+from cmakedbg import debugger
+from cmakedbg import multi
+from cmakedbg.mock_cmake import MockCMake, program_from_listfile
+import io
+import json
+import subprocess
+import sys
+
+
+def test_read_configs(tmp_path):
+    configs = tmp_path / "configs.txt"
+    configs.write_text(
+        "# toolchains\ncmake -S . -B build-gcc '-DFLAGS=-O2 -g'\n\ncmake -S . -B build-clang\n"
+    )
+    assert multi.read_configs(str(configs)) == [
+        ["cmake", "-S", ".", "-B", "build-gcc", "-DFLAGS=-O2 -g"],
+        ["cmake", "-S", ".", "-B", "build-clang"],
+    ]
+
+
+def test_find_divergences():
+    def run(*outputs):
+        records = [{"event": "stopped", "stop": 1, "file": "CMakeLists.txt", "line": 3}]
+        for command, output in outputs:
+            records.append({"command": command, "output": output, "failed": False})
+        return records
+
+    results = [
+        run(
+            ("run", ""), ("get var CC", "CC=gcc\n"), ("get var TYPE", "TYPE=Release\n")
+        ),
+        run(
+            ("run", ""),
+            ("get var CC", "CC=clang\n"),
+            ("get var TYPE", "TYPE=Release\n"),
+        ),
+        run(("run", ""), ("get var CC", "CC=gcc\n")),
+    ]
+    divergences = multi.find_divergences(results)
+    assert [(d["index"], d["command"]) for d in divergences] == [
+        (1, "get var CC"),
+        (2, "get var TYPE"),
+    ]
+    assert divergences[0]["outputs"] == [
+        {"output": "CC=gcc\n", "configs": [0, 2]},
+        {"output": "CC=clang\n", "configs": [1]},
+    ]
+    assert divergences[0]["missing"] == []
+    # the third configuration never got as far as the last command
+    assert divergences[1]["missing"] == [2]
+    assert multi.find_divergences(results[:1]) == []
+
+
+def test_run_configs(tmp_path, monkeypatch):
+    listfile = tmp_path / "CMakeLists.txt"
+    listfile.write_text("project(p)\nset(TYPE Release)\nmessage(done)\n")
+
+    def launch_mock(cmd, pipe_host, print_help, stdout=None):
+        # a MockCMake per configuration in place of cmake, with the -D
+        # definitions of the command line as its variables
+        definitions = dict(arg[2:].split("=", 1) for arg in cmd if arg.startswith("-D"))
+        MockCMake(
+            program_from_listfile(str(listfile)), local_variables=definitions
+        ).listen(pipe_host)
+        return subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+
+    monkeypatch.setattr(debugger, "launch_cmake", launch_mock)
+    configs = [
+        ["cmake", "-S", str(tmp_path), "-DCC=gcc", "-DTYPE=Release"],
+        ["cmake", "-S", str(tmp_path), "-DCC=clang", "-DTYPE=Release"],
+        ["cmake", "-S", str(tmp_path), "-DCC=gcc", "-DTYPE=Release"],
+    ]
+    commands = [
+        ["br", f"{listfile}:2"],
+        ["run"],
+        ["get", "var", "CC"],
+        ["get", "var", "TYPE"],
+    ]
+    output = io.StringIO()
+    status = multi.run_configs(configs, commands, 2, 10.0, lambda: None, output)
+    assert status == 0
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    for config, cc in enumerate(["gcc", "clang", "gcc"]):
+        lines = [record for record in records if record.get("config") == config]
+        assert [record.get("command", record.get("event")) for record in lines] == [
+            f"br {listfile}:2",
+            "run",
+            "stopped",
+            "get var CC",
+            "get var TYPE",
+            "exit",
+        ]
+        assert lines[3]["output"] == f"CC={cc}\n"
+        assert lines[4]["output"] == "TYPE=Release\n"
+    divergences = [record for record in records if record.get("event") == "divergence"]
+    assert [(d["command"], d["outputs"]) for d in divergences] == [
+        (
+            "get var CC",
+            [
+                {"output": "CC=gcc\n", "configs": [0, 2]},
+                {"output": "CC=clang\n", "configs": [1]},
+            ],
+        )
+    ]
+    assert records[-1]["event"] == "summary"
+    assert [config["status"] for config in records[-1]["configs"]] == [0, 0, 0]
@@ -0,0 +1,115 @@
+from cmakedbg import debugger as cmakedbg
+from cmakedbg import indexer
+from cmakedbg import origin
+from cmakedbg.mock_cmake import MockCMake, program_from_listfile
+from cmakedbg.session import SyncSession
+import io
+import json
+import socket
+import subprocess
+import sys
+import pytest
+
+LISTFILE = """project(p)
+message(start)
+set(FLAGS "-O2")
+message(middle)
+{padding}string(APPEND FLAGS " -O0")
+message("${{FLAGS}}")
+if(OTHER)
+endif()
+message(done)
+"""
+
+
+@pytest.fixture
+def project(tmp_path):
+    cmakelists = tmp_path / "CMakeLists.txt"
+    cmakelists.write_text(LISTFILE.format(padding="message(padding)\n" * 50))
+    return str(cmakelists)
+
+
+def run_search(project, commands, effects):
+    mock = MockCMake(program_from_listfile(project), effects=effects)
+    client, server = socket.socketpair()
+    mock.start(server)
+    session = SyncSession(client)
+    json_output = io.StringIO()
+    state = cmakedbg.DebuggerState(session=session, batch=True, json_output=json_output)
+    state.cmake_process_handle = subprocess.Popen([sys.executable, "-c", "pass"])
+    state.command_queue.extend([["br", f"{project}:1"], ["run"], *commands, ["c"]])
+    try:
+        session.request(cmakedbg.initialize)
+        with pytest.raises(SystemExit):
+            cmakedbg.handle_events(state)
+    finally:
+        session.close()
+        client.close()
+        server.close()
+    records = [json.loads(line) for line in json_output.getvalue().splitlines()]
+    return [
+        record["output"] for record in records if record.get("event") == "origin"
+    ], mock
+
+
+def test_candidate_lines(tmp_path):
+    listfile = tmp_path / "flags.cmake"
+    listfile.write_text(
+        'set(CMAKE_CXX_FLAGS "-O2")\n'
+        'message("${CMAKE_CXX_FLAGS}")\n'
+        "list(APPEND\n"
+        "     CMAKE_CXX_FLAGS -g)\n"
+        "# set(CMAKE_CXX_FLAGS -O0)\n"
+        "set(CMAKE_CXX_FLAGS_RELEASE -O3)\n"
+    )
+    (tmp_path / "CMakeFiles").mkdir()
+    (tmp_path / "CMakeFiles" / "generated.cmake").write_text(
+        "set(CMAKE_CXX_FLAGS -O1)\n"
+    )
+    paths = indexer.listfiles(str(tmp_path))
+    assert paths == [str(listfile)]
+    assert origin.candidate_lines(paths, "CMAKE_CXX_FLAGS") == {str(listfile): {1, 3}}
+    assert origin.candidate_lines(paths, "NOT_THERE") == {}
+
+
+def test_find_origin_of_a_value(project):
+    effects = {(project, 3): {"FLAGS": "-O2"}, (project, 55): {"FLAGS": "-O2 -O0"}}
+    outputs, mock = run_search(project, [["find-origin", "FLAGS", "-O0"]], effects)
+    assert len(outputs) == 1
+    assert outputs[0].startswith(f"FLAGS got '-O0' at {project}:55 (")
+    assert outputs[0].endswith(f"'-O2' -> '-O2 -O0'\n#0   string at {project}:55\n")
+    # cmake only stopped around the lines that mention FLAGS, not at the
+    # 50 lines in between
+    assert mock.stops < 10
+
+
+def test_find_origin_of_a_change(project):
+    effects = {(project, 3): {"FLAGS": "-O2"}}
+    outputs, _ = run_search(project, [["find-origin", "FLAGS"]], effects)
+    assert outputs[0].startswith(f"FLAGS changed at {project}:3 (")
+    assert outputs[0].split(": ", 1)[1].startswith("None -> '-O2'")
+
+
+def test_find_origin_outside_the_candidates(project):
+    # set on a line that does not mention it, as cmake's own modules do
+    effects = {(project, 4): {"OTHER": "1"}}
+    outputs, _ = run_search(project, [["find-origin", "OTHER"]], effects)
+    assert outputs[0].startswith(
+        f"OTHER changed between {project}:2 and {project}:57 ("
+    )
+    assert "find-origin -step OTHER" in outputs[0]
+
+    outputs, mock = run_search(project, [["find-origin", "-step", "OTHER"]], effects)
+    assert outputs[0].startswith(f"OTHER changed at {project}:4 (")
+    # the breakpoint, then every command up to the one after line 4
+    assert mock.stops == 5
+
+
+def test_find_origin_not_found(project):
+    outputs, _ = run_search(
+        project,
+        [["get", "var", "FLAGS"], ["find-origin", "FLAGS", "-O3"]],
+        {(project, 3): {"FLAGS": "-O2"}},
+    )
+    assert outputs[0].startswith("CMake finished and FLAGS never got '-O3' (")
+    assert outputs[0].endswith("); FLAGS=-O2\n")
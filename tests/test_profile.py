@@ -0,0 +1,81 @@
+import io
+import sys
+
+import pytest
+
+from cmakedbg import debugger, profile
+
+TOP = ("CMakeLists.txt", "/src/CMakeLists.txt", 1)
+CALL = ("my_func", "/src/CMakeLists.txt", 3)
+
+
+def test_self_and_inclusive_time():
+    prof = profile.Profile()
+    prof.sample(0, (TOP, ("set", "/src/CMakeLists.txt", 2)))
+    prof.sample(100, (TOP, CALL, ("find_package", "/src/func.cmake", 10)))
+    prof.sample(400, (TOP, CALL, ("set", "/src/func.cmake", 11)))
+    prof.sample(450, (TOP, ("message", "/src/CMakeLists.txt", 4)))
+    prof.finish(500)
+
+    assert prof.steps == 4
+    assert prof.total_ns == 500
+    assert prof.files == {
+        "/src/CMakeLists.txt": [150, 500, 2],
+        "/src/func.cmake": [350, 350, 2],
+    }
+    assert prof.functions["my_func"] == [0, 350, 0]
+    assert prof.functions["set"] == [150, 150, 2]
+    assert prof.functions["CMakeLists.txt"] == [0, 500, 0]
+    assert prof.lines[("/src/CMakeLists.txt", 3)] == [0, 350, 0]
+    assert prof.lines[("/src/func.cmake", 10)] == [300, 300, 1]
+
+    output = io.StringIO()
+    profile.print_report(prof, top=1, output=output)
+    report = output.getvalue()
+    assert "Profiled 4 steps" in report
+    assert "/src/func.cmake:10\n" in report
+    assert "/src/CMakeLists.txt:2" not in report
+
+
+def test_recursion_is_counted_once():
+    prof = profile.Profile()
+    prof.sample(0, (TOP, CALL, CALL, ("set", "/src/CMakeLists.txt", 2)))
+    prof.finish(1000)
+    assert prof.functions["my_func"] == [0, 1000, 0]
+    assert prof.files["/src/CMakeLists.txt"] == [1000, 1000, 1]
+
+
+def test_folded_stacks():
+    prof = profile.Profile()
+    frames = [
+        {"id": 1, "name": "set", "line": 2, "source": {"path": "/src/CMakeLists.txt"}},
+        {
+            "id": 2,
+            "name": "CMakeLists.txt",
+            "line": 1,
+            "source": {"path": "/src/CMakeLists.txt"},
+        },
+    ]
+    stack = profile.stack_from_frames(frames)
+    assert stack == (TOP, ("set", "/src/CMakeLists.txt", 2))
+    prof.sample(0, stack)
+    prof.sample(2_000_000, stack)
+    prof.sample(3_000_000, (TOP,))
+    prof.finish(3_000_500)
+    output = io.StringIO()
+    profile.write_folded(prof, output)
+    # under a microsecond is left out
+    assert output.getvalue() == (
+        "CMakeLists.txt (/src/CMakeLists.txt:1);set (/src/CMakeLists.txt:2) 3000\n"
+    )
+
+
+@pytest.mark.parametrize(
+    "option", [["--top", "5"], ["--folded", "out.folded"], ["--trace-format", "chrome"]]
+)
+def test_profile_options_need_profile_mode(monkeypatch, capsys, option):
+    monkeypatch.setattr(sys, "argv", ["cmakedbg", "--cmd", "cmake", ".", *option])
+    with pytest.raises(SystemExit) as exit_info:
+        debugger.main()
+    assert exit_info.value.code == 2
+    assert "only work in profile mode" in capsys.readouterr().err
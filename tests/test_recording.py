@@ -0,0 +1,98 @@
+from cmakedbg import debugger as cmakedbg
+from cmakedbg import recording
+from cmakedbg.session import SyncSession
+from tests.test_cmakedbg import FakeDAPServer
+import socket
+import threading
+import pytest
+
+COMMANDS = [["get", "var", "FOO"], ["info", "vars", "CMAKE_*"], ["bt"]]
+
+
+def stop(state):
+    # what handle_stopped does at a stop, short of prompting for commands
+    body_json = cmakedbg.dap_session(state).request(cmakedbg.stacktrace)
+    state.stacktrace = [
+        cmakedbg.Frame.from_dap(frame) for frame in body_json["body"]["stackFrames"]
+    ]
+    cmakedbg.reset_variables(state, state.stacktrace[0].id)
+
+
+def run_commands(session, commands):
+    state = cmakedbg.DebuggerState(session=session, already_running=True)
+    outputs = []
+    for _ in range(2):
+        stop(state)
+        for command in commands:
+            outputs.append(cmakedbg.output_text(cmakedbg.parse_command(state, command)))
+    return outputs
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    # a session against the fake server, stopped twice with the same commands
+    # run at each stop
+    path = str(tmp_path / "session.dap")
+    cmakelists = tmp_path / "CMakeLists.txt"
+    cmakelists.write_text("message(1)\nmessage(2)\nmessage(3)\n")
+    client, server = socket.socketpair()
+    fake_server = FakeDAPServer(server)
+    fake_server.stack_frames = [
+        {"id": 1, "name": "message", "line": 3, "source": {"path": str(cmakelists)}}
+    ]
+    fake_server.start()
+    recorder = recording.Recorder.open(path)
+    session = SyncSession(client, recorder=recorder)
+    outputs = run_commands(session, COMMANDS)
+    session.close()
+    recorder.close()
+    client.close()
+    server.close()
+    return path, outputs
+
+
+def test_recording_format(recorded):
+    path, _ = recorded
+    records = list(recording.read_recording(path))
+    assert [direction for direction, _, _ in records[:2]] == [
+        recording.SENT,
+        recording.RECEIVED,
+    ]
+    timestamps = [timestamp for _, timestamp, _ in records]
+    assert timestamps == sorted(timestamps)
+    # a record cut short at the end is dropped
+    with open(path, "ab") as f:
+        f.write(recording.RECORD_HEADER.pack(recording.RECEIVED, 1, 100) + b"{")
+    assert len(list(recording.read_recording(path))) == len(records)
+
+
+def test_replay_gives_the_same_output(recorded):
+    path, outputs = recorded
+    client, server = socket.socketpair()
+    replay = recording.ReplayServer.from_recording(path)
+    threading.Thread(target=replay.serve, args=(server,), daemon=True).start()
+    session = SyncSession(client)
+    assert run_commands(session, COMMANDS) == outputs
+    session.close()
+    client.close()
+    server.close()
+
+
+def test_replay_off_the_recording(recorded, tmp_path):
+    path, outputs = recorded
+    pipe_host = str(tmp_path / "pipe")
+    replay_process = recording.launch_replay(path, pipe_host)
+    session = SyncSession(cmakedbg.connect_to_cmake(pipe_host, replay_process))
+    # a request made at the same stop in the recording is answered from there,
+    # even out of order
+    state = cmakedbg.DebuggerState(session=session, already_running=True)
+    stop(state)
+    assert cmakedbg.output_text(cmakedbg.parse_command(state, ["bt"])) == outputs[2]
+    assert cmakedbg.get_variable(state, "FOO") == "local"
+    # and one never made fails
+    assert session.request(cmakedbg.pause)["success"] is False
+    # a step the recording did not take ends the replay
+    session.request(cmakedbg.dbg_continue)
+    assert session.next_event()["event"] == "terminated"
+    assert replay_process.wait(timeout=10) == 0
+    session.close()
@@ -0,0 +1,168 @@
+from cmakedbg import debugger as cmakedbg
+from cmakedbg import server
+from cmakedbg.client import SessionClient, SessionError
+from cmakedbg.mock_cmake import MockCMake, program_from_listfile
+from cmakedbg.session import EventLoopThread, SyncSession
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import pytest
+
+
+@pytest.fixture
+def listfile(tmp_path):
+    path = tmp_path / "CMakeLists.txt"
+    path.write_text("project(p)\nset(FOO 1)\nmessage(hi)\nset(BAR 2)\n")
+    return str(path)
+
+
+def wait_for(condition, timeout=10.0):
+    start = time.perf_counter()
+    while not condition():
+        assert time.perf_counter() - start < timeout
+        time.sleep(0.01)
+
+
+def send(sock, request_id, method, *params):
+    request = {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "method": method,
+        "params": list(params),
+    }
+    sock.sendall(json.dumps(request).encode() + b"\n")
+
+
+def test_is_variable_query():
+    assert server.is_variable_query(["info", "vars"])
+    assert server.is_variable_query(["get", "var", "FOO"])
+    assert server.is_variable_query(["search", "value", "-O2"])
+    assert not server.is_variable_query(["info", "changed"])
+    assert not server.is_variable_query(["c"])
+
+
+def test_coalesced_requests(tmp_path):
+    loop_thread = EventLoopThread()
+    session_server = server.Server(str(tmp_path / "s.sock"), loop_thread)
+    try:
+        requests = [
+            server.Request(None, 1, ["get", "var", "FOO"]),
+            server.Request(None, 2, ["br", "CMakeLists.txt:2"]),
+            server.Request(None, 3, ["get", "var", "FOO"]),
+            server.Request(None, 4, ["info", "vars"]),
+            server.Request(None, 5, ["get", "var", "FOO"]),
+        ]
+        for request in requests:
+            session_server.enqueue(request)
+        assert [request.id for request in session_server.next_requests()] == [1, 3, 5]
+        assert [request.id for request in session_server.next_requests()] == [2]
+        assert [request.id for request in session_server.next_requests()] == [4]
+        assert session_server.coalesced == 2
+    finally:
+        session_server.close()
+        loop_thread.stop()
+    assert not (tmp_path / "s.sock").exists()
+
+
+def test_socket_is_private(tmp_path, monkeypatch):
+    loop_thread = EventLoopThread()
+    path = tmp_path / "s.sock"
+    session_server = server.Server(str(path), loop_thread)
+    try:
+        assert path.stat().st_mode & 0o077 == 0
+    finally:
+        session_server.close()
+    # a file someone else left at the path is not taken over
+    path.write_text("")
+    monkeypatch.setattr(os, "getuid", lambda: path.stat().st_uid + 1)
+    try:
+        with pytest.raises(PermissionError):
+            server.Server(str(path), loop_thread)
+    finally:
+        loop_thread.stop()
+
+
+def test_serve_session(tmp_path, listfile):
+    client, cmake_side = socket.socketpair()
+    MockCMake(program_from_listfile(listfile), local_variables={"FOO": "1"}).start(
+        cmake_side
+    )
+    session = SyncSession(client)
+    state = cmakedbg.DebuggerState(session=session)
+    state.cmake_process_handle = subprocess.Popen([sys.executable, "-c", "pass"])
+    path = str(tmp_path / "s.sock")
+    session_server = state.server = server.Server(path, session.loop_thread)
+
+    # two clients' commands, all queued before cmake is even initialized
+    first = SessionClient(path)
+    second = SessionClient(path)
+    assert first.call("subscribe") == {"event": "starting"}
+    second.call("subscribe")
+    send(first.sock, 10, "br", f"{listfile}:3")
+    send(first.sock, 11, "run")
+    send(first.sock, 12, "get", "var", "FOO")
+    send(second.sock, 20, "get", "var", "FOO")
+    wait_for(lambda: len(session_server.requests) == 4)
+
+    exit_status = []
+
+    def debug():
+        session.request(cmakedbg.initialize)
+        try:
+            cmakedbg.handle_events(state)
+        except SystemExit as e:
+            exit_status.append(e.code)
+
+    thread = threading.Thread(target=debug)
+    thread.start()
+    try:
+        responses: dict[int, dict] = {}
+        events = []
+        for sock_client in (first, second):
+            while len(responses) < (3 if sock_client is first else 4):
+                message = sock_client._read()
+                if message.get("method") == "event":
+                    events.append(message["params"])
+                else:
+                    responses[message["id"]] = message["result"]
+        assert responses[10]["output"] == f"Breakpoint 1 at {listfile}:3\n"
+        assert responses[11] == {"output": "", "failed": False, "resumed": True}
+        assert (
+            responses[12]
+            == responses[20]
+            == {"output": "FOO=1\n", "failed": False, "resumed": False}
+        )
+        assert session_server.coalesced == 1
+        stopped = {"event": "stopped", "stop": 1, "file": listfile, "line": 3}
+        assert events.count(stopped) == 2
+
+        # a client connecting now learns where cmake is
+        with SessionClient(path) as late:
+            status = late.call("status")
+            assert {key: status[key] for key in stopped} == stopped
+            assert status["clients"] == 3
+            with pytest.raises(SessionError):
+                late.call("pipe", ["info vars | grep FOO"])
+            with pytest.raises(SessionError):
+                late.call("get", {"var": "FOO"})
+            assert late.command(["bogus"])["failed"]
+
+        assert first.command(["c"])["resumed"]
+        assert first.next_event() == {"event": "running", "command": "c"}
+        exit_event = first.next_event()
+        assert exit_event["event"] == "exit" and exit_event["status"] == 0
+        assert second.next_event()["event"] == "running"
+        assert second.next_event()["event"] == "exit"
+        thread.join(10)
+        assert exit_status == [0]
+    finally:
+        first.close()
+        second.close()
+        session_server.close()
+        session.close()
+        client.close()
+        cmake_side.close()
@@ -0,0 +1,91 @@
+from cmakedbg import debugger as cmakedbg
+from cmakedbg import transport
+from cmakedbg.session import EventLoopThread, SyncSession
+import json
+import socket
+import threading
+import pytest
+
+
+def send_message(sock, message):
+    body = json.dumps(message).encode()
+    sock.sendall(f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+
+
+def reply_in_reverse(sock, count, sizes=None):
+    # waits until `count` requests are in flight, then answers them last to
+    # first with an event in between. sizes gets the bytes written
+    decoder = transport.FrameDecoder()
+    requests = [
+        json.loads(transport.read_frame(sock, decoder).tobytes()) for _ in range(count)
+    ]
+    messages = [{"type": "event", "event": "output", "seq": 100}]
+    for request in reversed(requests):
+        messages.append(
+            {
+                "type": "response",
+                "request_seq": request["seq"],
+                "command": request["command"],
+                "success": True,
+                "body": {
+                    "variablesReference": request["arguments"]["variablesReference"]
+                },
+            }
+        )
+    for message in messages:
+        send_message(sock, message)
+    if sizes is not None:
+        sizes["written"] = sum(
+            len(json.dumps(m)) + len(f"Content-Length: {len(json.dumps(m))}\r\n\r\n")
+            for m in messages
+        )
+
+
+def test_requests_in_flight_and_events():
+    client, server = socket.socketpair()
+    sizes = {}
+    responder = threading.Thread(target=reply_in_reverse, args=(server, 3, sizes))
+    responder.start()
+    session = SyncSession(client)
+    responses = session.request_many([(cmakedbg.variables, ref) for ref in (7, 8, 9)])
+    assert [r["body"]["variablesReference"] for r in responses] == [7, 8, 9]
+    assert [r["request_seq"] for r in responses] == [1, 2, 3]
+    assert session.next_event()["event"] == "output"
+    responder.join()
+    assert session.session.bytes_received == sizes["written"]
+    session.close()
+    client.close()
+    server.close()
+
+
+def test_sessions_share_a_loop():
+    loop_thread = EventLoopThread()
+    pairs = [socket.socketpair() for _ in range(4)]
+    sessions = [SyncSession(client, loop_thread) for client, _ in pairs]
+    responders = [
+        threading.Thread(target=reply_in_reverse, args=(server, 1))
+        for _, server in pairs
+    ]
+    for responder in responders:
+        responder.start()
+    for i, session in enumerate(sessions):
+        # every session numbers its own requests
+        assert session.request(cmakedbg.variables, i)["request_seq"] == 1
+    for responder, session, (client, server) in zip(responders, sessions, pairs):
+        responder.join()
+        session.close()
+        client.close()
+        server.close()
+    loop_thread.stop()
+
+
+def test_connection_closed():
+    client, server = socket.socketpair()
+    session = SyncSession(client)
+    server.close()
+    with pytest.raises(ConnectionError):
+        session.next_event(timeout=5)
+    with pytest.raises(ConnectionError):
+        session.request(cmakedbg.stacktrace)
+    session.close()
+    client.close()
@@ -0,0 +1,49 @@
+from cmakedbg import source
+import os
+
+
+def write_lines(path, count, prefix="line"):
+    path.write_text("".join(f"  {prefix} {i}\n" for i in range(1, count + 1)))
+
+
+def test_lines(tmp_path):
+    cmakelists = tmp_path / "CMakeLists.txt"
+    write_lines(cmakelists, 30)
+    cache = source.SourceCache()
+    assert cache.line_count(str(cmakelists)) == 30
+    assert cache.lines(str(cmakelists), 2, 3) == [(2, "line 2"), (3, "line 3")]
+    assert cache.lines(str(cmakelists), -1, 1) == [(1, "line 1")]
+    assert cache.lines(str(cmakelists), 29, 40) == [(29, "line 29"), (30, "line 30")]
+
+
+def test_line_offsets():
+    assert list(source.line_offsets(b"")) == []
+    assert list(source.line_offsets(b"a\nb")) == [0, 2]
+    assert list(source.line_offsets(b"a\nb\n")) == [0, 2]
+    assert list(source.line_offsets(b"\n\n")) == [0, 1]
+
+
+def test_reloads_modified_files(tmp_path):
+    cmakelists = tmp_path / "CMakeLists.txt"
+    write_lines(cmakelists, 5)
+    cache = source.SourceCache()
+    first = cache.get(str(cmakelists))
+    assert cache.get(str(cmakelists)) is first
+    write_lines(cmakelists, 6, prefix="changed")
+    stat = os.stat(cmakelists)
+    os.utime(cmakelists, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.lines(str(cmakelists), 6, 6) == [(6, "changed 6")]
+
+
+def test_mmap_and_eviction(tmp_path):
+    cache = source.SourceCache(max_files=2, mmap_threshold=100)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"module{i}.cmake"
+        write_lines(path, 50)
+        paths.append(str(path))
+        assert cache.lines(str(path), 50, 50) == [(50, "line 50")]
+    assert type(cache.get(paths[2]).data) is not bytes
+    assert paths[0] not in cache
+    assert paths[1] in cache and paths[2] in cache
+    cache.clear()
@@ -0,0 +1,71 @@
+import io
+import json
+
+from cmakedbg import trace
+
+TOP = ("CMakeLists.txt", "/src/CMakeLists.txt", 1)
+CALL = ("find_package", "/src/CMakeLists.txt", 3)
+SAMPLES = [
+    (1000, (TOP, ("set", "/src/CMakeLists.txt", 2))),
+    (3000, (TOP, CALL, ("set", "/usr/share/cmake/FindMPI.cmake", 10))),
+    (7000, (TOP, CALL, ("if", "/usr/share/cmake/FindMPI.cmake", 11))),
+    (8000, (TOP, ("message", "/src/CMakeLists.txt", 4))),
+]
+
+
+def record(writer):
+    for timestamp, stack in SAMPLES:
+        writer.sample(timestamp, stack)
+    writer.finish(9000)
+
+
+def test_chrome_trace():
+    output = io.StringIO()
+    record(trace.ChromeTraceWriter(output))
+    events = json.loads(output.getvalue())["traceEvents"]
+    assert [(e["ph"], e.get("name"), e["ts"]) for e in events] == [
+        ("B", "CMakeLists.txt", 0),
+        ("B", "set", 0),
+        ("E", None, 2),
+        ("B", "find_package", 2),
+        ("B", "set", 2),
+        ("E", None, 6),
+        ("B", "if", 6),
+        ("E", None, 7),
+        ("E", None, 7),
+        ("B", "message", 7),
+        ("E", None, 8),
+        ("E", None, 8),
+    ]
+    assert events[3]["args"] == {"file": "/src/CMakeLists.txt", "line": 3}
+
+
+def test_speedscope():
+    output = io.StringIO()
+    record(trace.SpeedscopeWriter(output))
+    data = json.loads(output.getvalue())
+    frames = data["shared"]["frames"]
+    profile = data["profiles"][0]
+    assert profile["endValue"] == 8000
+    opened = []
+    for event in profile["events"]:
+        if event["type"] == "O":
+            opened.append(event["frame"])
+        else:
+            # properly nested
+            assert opened.pop() == event["frame"]
+    assert opened == []
+    assert frames[profile["events"][3]["frame"]] == {
+        "name": "find_package",
+        "file": "/src/CMakeLists.txt",
+        "line": 3,
+    }
+
+
+def test_empty_trace_is_valid():
+    output = io.StringIO()
+    trace.trace_writer("speedscope", output).finish(5)
+    assert json.loads(output.getvalue())["profiles"][0]["events"] == []
+    output = io.StringIO()
+    trace.trace_writer("chrome", output).finish(5)
+    assert json.loads(output.getvalue())["traceEvents"] == []
@@ -0,0 +1,71 @@
+from cmakedbg import transport
+import json
+import socket
+import threading
+import pytest
+
+
+def frame(payload):
+    body = json.dumps(payload).encode()
+    return f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+def test_multiple_frames_in_one_chunk():
+    decoder = transport.FrameDecoder()
+    decoder.feed(frame({"seq": 1}) + frame({"seq": 2}) + frame({"seq": 3})[:10])
+    assert json.loads(decoder.next_frame().tobytes()) == {"seq": 1}
+    assert json.loads(decoder.next_frame().tobytes()) == {"seq": 2}
+    assert decoder.next_frame() is None
+    decoder.feed(frame({"seq": 3})[10:])
+    assert json.loads(decoder.next_frame().tobytes()) == {"seq": 3}
+    assert decoder.next_frame() is None
+    assert decoder.buffered == 0
+
+
+def test_partial_frames_byte_by_byte():
+    decoder = transport.FrameDecoder(initial_size=16)
+    data = frame({"seq": 1, "body": "x" * 100}) + frame({"seq": 2})
+    bodies = []
+    for i in range(len(data)):
+        decoder.feed(data[i : i + 1])
+        body = decoder.next_frame()
+        if body is not None:
+            bodies.append(json.loads(body.tobytes())["seq"])
+    assert bodies == [1, 2]
+
+
+def test_frame_larger_than_buffer():
+    decoder = transport.FrameDecoder(initial_size=64)
+    payload = {
+        "variables": [{"name": f"VAR_{i}", "value": "v" * 50} for i in range(5000)]
+    }
+    decoder.feed(frame(payload))
+    assert json.loads(decoder.next_frame().tobytes()) == payload
+
+
+def test_header_fields():
+    assert transport.parse_header(b"Content-Type: x\r\ncontent-length: 12") == 12
+    with pytest.raises(ValueError):
+        transport.parse_header(b"Content-Type: x")
+    with pytest.raises(ValueError):
+        transport.parse_header(b"Content-Length: abc")
+
+
+def test_read_frame_from_socket():
+    payload = {
+        "body": {
+            "variables": [{"name": f"V{i}", "value": str(i)} for i in range(50000)]
+        }
+    }
+    data = frame({"seq": 1}) + frame(payload)
+    a, b = socket.socketpair()
+    sender = threading.Thread(target=a.sendall, args=(data,))
+    sender.start()
+    decoder = transport.FrameDecoder()
+    assert json.loads(transport.read_frame(b, decoder).tobytes()) == {"seq": 1}
+    assert json.loads(transport.read_frame(b, decoder).tobytes()) == payload
+    sender.join()
+    a.close()
+    with pytest.raises(ConnectionError):
+        transport.read_frame(b, decoder)
+    b.close()
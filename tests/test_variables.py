@@ -0,0 +1,104 @@
+from cmakedbg import variables
+import pytest
+
+
+def test_record_and_diff():
+    history = variables.VariableHistory()
+    stop1 = {"A": "1", "B": "2", "C": "3"}
+    assert history.record(1, stop1) == {}
+    assert history.changes(1) == (None, {})
+    stop2 = {"A": "1", "B": "20", "D": "4"}
+    changes = history.record(2, stop2)
+    assert changes == {"B": ("2", "20"), "C": ("3", None), "D": (None, "4")}
+    assert history.changes() == (1, changes)
+    assert history.snapshot(1) == stop1
+    assert history.snapshot(2) == stop2
+    assert history.value("B", 1) == "2"
+    assert history.value("C", 2) is None
+    with pytest.raises(ValueError):
+        history.record(1, stop1)
+
+
+def test_snapshots_share_unchanged_values():
+    history = variables.VariableHistory()
+    for stop in range(1, 101):
+        values = {f"VAR_{i}": "same" for i in range(1000)}
+        values["COUNTER"] = str(stop)
+        history.record(stop, values)
+    # only the newest snapshot is held in full, every other one is a single change
+    assert history._current is values
+    assert all(len(changes) == 1 for _, changes in history._deltas.values() if changes)
+    assert history.value("COUNTER", 90) == "90"
+
+
+def test_partial_records():
+    history = variables.VariableHistory()
+    # nothing known about FOO before the first look at it
+    assert history.record(1, {"FOO": "a"}, partial=True) == {}
+    assert history.record(2, {"FOO": "b"}, partial=True) == {"FOO": ("a", "b")}
+    # a later full snapshot only reports what it can compare
+    assert history.record(3, {"FOO": "b", "BAR": "x"}) == {}
+    assert history.record(3, {"FOO": "c"}, partial=True) == {"FOO": ("b", "c")}
+    assert history.changes(3) == (2, {"FOO": ("b", "c")})
+
+
+def test_lru_eviction_folds_changes():
+    history = variables.VariableHistory(max_snapshots=3)
+    history.record(1, {"A": "1", "B": "1"})
+    history.record(2, {"A": "2", "B": "1"})
+    history.changes(1)  # stop 1 is now more recently used than stop 2
+    history.record(3, {"A": "2", "B": "3"})
+    history.record(4, {"A": "4", "B": "3"})
+    assert history.stops() == [1, 3, 4]
+    # stop 3 now covers the step from stop 1 that went through stop 2
+    assert history.changes(3) == (1, {"A": ("1", "2"), "B": ("1", "3")})
+    assert history.snapshot(1) == {"A": "1", "B": "1"}
+    history.record(5, {"A": "5", "B": "3"})
+    assert len(history) == 3
+    assert 4 not in history
+    assert history.snapshot(3) == {"A": "2", "B": "3"}
+
+
+def test_compose():
+    first = {"A": ("1", "2"), "B": (None, "x")}
+    second = {"A": ("2", "1"), "C": ("y", None)}
+    assert variables.compose(first, second) == {"B": (None, "x"), "C": ("y", None)}
+
+
+def test_index_follows_the_newest_snapshot():
+    history = variables.VariableHistory()
+    values = {f"VAR_{i:05}": str(i) for i in range(20000)}
+    values.update({"CMAKE_C_FLAGS": "-O2", "CMAKE_CXX_FLAGS": "-O3", "MPI_C_FLAGS": ""})
+    history.record(1, values)
+    index = history.index
+    assert len(index) == 20003
+    assert index.glob("CMAKE_*_FLAGS") == ["CMAKE_CXX_FLAGS", "CMAKE_C_FLAGS"]
+    assert index.glob("*_C_FLAGS") == ["CMAKE_C_FLAGS", "MPI_C_FLAGS"]
+    assert index.glob("*[CX]_FLAGS") == [
+        "CMAKE_CXX_FLAGS",
+        "CMAKE_C_FLAGS",
+        "MPI_C_FLAGS",
+    ]
+    assert index.glob("VAR_0000?") == [f"VAR_0000{i}" for i in range(10)]
+    assert index.glob("MPI_C_FLAGS") == ["MPI_C_FLAGS"]
+    assert index.glob("MPI_C") == []
+    assert index.regex("^(CMAKE|MPI)_C_") == ["CMAKE_C_FLAGS", "MPI_C_FLAGS"]
+
+    # a few changes between stops update the index in place
+    values = dict(values)
+    del values["MPI_C_FLAGS"]
+    values["MPI_CXX_FLAGS"] = ""
+    history.record(2, values)
+    assert index.glob("*_C_FLAGS") == ["CMAKE_C_FLAGS"]
+    assert index.glob("MPI_*") == ["MPI_CXX_FLAGS"]
+    # partial records can add names too
+    history.record(3, {"WATCHED": "1"}, partial=True)
+    assert index.with_prefix("W") == ["WATCHED"]
+    assert list(index) == sorted(history.snapshot())
+
+
+def test_container_values_share_names():
+    reply = [{"name": "".join(["CMAKE_", "BUILD_TYPE"]), "value": "Release"}]
+    again = [{"name": "".join(["CMAKE_", "BUILD_TYPE"]), "value": "Debug"}]
+    first, second = variables.container_values(reply), variables.container_values(again)
+    assert next(iter(first)) is next(iter(second))